@@ -0,0 +1,122 @@
+"""
+同時リクエスト処理の計測用ベンチマーク (WORKER_MODE=thread / cooperative の比較)
+
+gunicornを STORAGE_BACKEND=sqlite (STORAGE_LATENCY_MS でBigQueryの往復相当の遅延を挿入) で起動し、
+同時に --concurrency 件のリクエストを --requests 件送って、スループットと応答時間の分布を表示する。
+BigQueryの応答待ちが大半を占める画面で、1インスタンスが同時に抱えられるリクエスト数の違いを確認する。
+GCPへのアクセスは発生しない。QUERY_CACHE / SEARCH_INDEX は無効にして毎回バックエンドを呼び出す。
+
+使い方:
+    python benchmarks/concurrency_bench.py --concurrency 200 --requests 400
+    python benchmarks/concurrency_bench.py --modes cooperative --path /userlist --latency-ms 300
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DUMMY_ENV = {
+    "PROJECT_ID": "bench-project",
+    "DATASET_ID": "bench_dataset",
+    "TABLE_ID": "bench_table",
+    "COMPANY_LIST_TABLE": "bench_company",
+    "FLASK_SECRET_KEY": "bench-secret-key",
+}
+
+
+def _env(mode: str, latency_ms: float, seed_users: int) -> dict:
+    env = dict(os.environ)
+    for key, value in DUMMY_ENV.items():
+        env.setdefault(key, value)
+    env.update({
+        "WORKER_MODE": mode,
+        "STORAGE_BACKEND": "sqlite",
+        "STORAGE_LATENCY_MS": str(latency_ms),
+        "LOCAL_SEED_USERS": str(seed_users),
+        "QUERY_CACHE": "false",
+        "SEARCH_INDEX": "false",
+    })
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url: str) -> float:
+    """GETを1回送り、応答を読み終えるまでの時間(秒)を返す"""
+    started = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=120) as res:
+        res.read()
+        if res.status != 200:
+            raise RuntimeError(f"{url}: status={res.status}")
+    return time.perf_counter() - started
+
+
+def _start(env: dict, port: int, timeout: float = 60.0) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py",
+           "--bind", f"127.0.0.1:{port}", "main:app"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicornが起動直後に終了しました")
+        try:
+            _get(f"http://127.0.0.1:{port}/")
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise TimeoutError("起動がタイムアウトしました")
+
+
+def run(mode: str, args) -> None:
+    port = _free_port()
+    proc = _start(_env(mode, args.latency_ms, args.seed_users), port)
+    try:
+        url = f"http://127.0.0.1:{port}{args.path}"
+        _get(url)  # 初回のテンプレート読み込み等を除外
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            started = time.perf_counter()
+            latencies = sorted(pool.map(lambda _: _get(url), range(args.requests)))
+            elapsed = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    ms = [v * 1000 for v in latencies]
+
+    def pct(p: float) -> float:
+        return ms[min(len(ms) - 1, int(len(ms) * p))]
+
+    print(f"{mode:<12} {len(ms) / elapsed:8.1f} req/s  "
+          f"p50={statistics.median(ms):8.1f}ms  p95={pct(0.95):8.1f}ms  p99={pct(0.99):8.1f}ms  "
+          f"max={ms[-1]:8.1f}ms  (n={len(ms)}, concurrency={args.concurrency})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同時リクエスト処理の計測")
+    parser.add_argument("--modes", nargs="+", default=["thread", "cooperative"], choices=["thread", "cooperative"])
+    parser.add_argument("--path", default="/userlist_edit/1", help="計測する画面 (GET)")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--latency-ms", type=float, default=500, help="バックエンド呼び出しごとの疑似遅延")
+    parser.add_argument("--seed-users", type=int, default=1000)
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+画面ごとの負荷試験 (実際の利用に近いリクエストの混在比率で全画面を呼び出し、前回の計測結果と比較する)
+
+STORAGE_BACKEND=sqlite (STORAGE_LATENCY_MS でBigQueryの1ジョブ相当の遅延を挿入) で Flask アプリを読み込み、
+Resource Manager は遅延付きの LocalProjectsClient へ差し替えて (clients.override)、WSGIアプリを直接呼び出す。
+--concurrency はgunicornの1ワーカーが同時に処理するスレッド数 (WORKER_THREADS) に相当する。
+GCPへのアクセスは発生しない。QUERY_CACHE / SEARCH_INDEX などは本番と同じ既定値のまま計測する。
+
+画面(シナリオ)ごとに以下を表示する。
+    - 応答時間 p50 / p95 / p99、エラー件数
+    - 1リクエストあたりのバックエンド呼び出し回数 (BigQuery相当 / Resource Manager。Server-Timing ヘッダーから集計)
+全体では、スループットとプロセスの最大RSSを表示する。
+
+--check を指定すると benchmarks/baseline.json の同じ混在比率の結果と比較し、
+    - 1リクエストあたりの呼び出し回数が増えた
+    - p95 / スループットが --tolerance (既定 25%) を超えて悪化した
+      (p95は --slack-ms (既定 20ms) 未満の差は無視する。数msで終わる画面のスレッド切り替えによるばらつきを除くため)
+場合に終了コード1で終了する。--save-baseline で今回の結果を基準として保存する。
+応答時間は実行環境の性能に左右されるため、基準は同じ環境で保存したものと比較すること。
+
+使い方:
+    python benchmarks/route_bench.py
+    python benchmarks/route_bench.py --mix registration --requests 1000 --concurrency 8
+    python benchmarks/route_bench.py --check
+    python benchmarks/route_bench.py --save-baseline
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+DUMMY_ENV = {
+    "PROJECT_ID": "bench-project",
+    "DATASET_ID": "bench_dataset",
+    "TABLE_ID": "bench_table",
+    "COMPANY_LIST_TABLE": "bench_company",
+    "FLASK_SECRET_KEY": "bench-secret-key",
+}
+
+# Server-Timing ヘッダーの backend 名 -> 表示名 (sqlite はBigQueryの代替)
+BACKENDS = {"sqlite": "bq", "resource_manager": "rm"}
+
+
+# ==========================================
+# シナリオ (1回の画面操作)
+# ==========================================
+def _user_form(rng: random.Random) -> Dict[str, str]:
+    return {
+        "username": f"負荷試験{rng.randrange(10000)}", "email": "bench@example.com", "tel_number": "03-0000-0000",
+        "regist_date": "2024-06-01", "belonging_department": "情報システム部", "company_id": str(rng.randint(1, 10)),
+    }
+
+
+def _project_form(rng: random.Random) -> Dict[str, Any]:
+    return {"project_name": "bench", "system_name": "bench", "type": ["standard"]}
+
+
+def _admin_form(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "manage_company_name": "bench", "organization_name": "org", "project_name_gcp": f"pj{rng.randrange(100000)}",
+        "group_name": "admins", "user_group_name": "users", "group_email": "admins@example.com",
+        "user_group_email": "users@example.com", "env": ["dev", "prd"], "use_purpose": "standard",
+        "subnet_info": "10.0.0.0/24", "UPDATE_FLG": "update",
+    }
+
+
+def _user_id(rng: random.Random, args) -> int:
+    return rng.randint(1, args.users)
+
+
+SCENARIOS: Dict[str, Callable[[Any, random.Random, Any], Any]] = {
+    "user_req GET": lambda c, rng, args: c.get("/user_req"),
+    "user_req POST": lambda c, rng, args: c.post("/user_req", data=_user_form(rng)),
+    "add POST": lambda c, rng, args: c.post("/add", data=_project_form(rng)),
+    "regist POST": lambda c, rng, args: c.post("/regist", data={**_user_form(rng), "project_name": "bench",
+                                                                "system_name": "bench", "type": "standard"}),
+    "userlist GET": lambda c, rng, args: c.get(f"/userlist?page={rng.randint(1, 5)}"),
+    "userlist_search POST": lambda c, rng, args: c.post(
+        "/userlist_search", data={"text_data": f"利用者{rng.randint(1, 99)}", "date": ""}),
+    "userlist_search GET": lambda c, rng, args: c.get(f"/userlist_search?page={rng.randint(1, 3)}"),
+    "userlist_edit GET": lambda c, rng, args: c.get(f"/userlist_edit/{_user_id(rng, args)}"),
+    "userlist_edit POST": lambda c, rng, args: c.post(f"/userlist_edit/{_user_id(rng, args)}", data=_admin_form(rng)),
+    "userlist_delete GET": lambda c, rng, args: c.get(f"/userlist_delete/{_user_id(rng, args)}"),
+}
+
+# 混在比率 (シナリオ名: 重み)
+MIXES: Dict[str, Dict[str, int]] = {
+    # 通常時: 管理者の一覧・検索・編集が中心
+    "admin": {
+        "userlist GET": 30, "userlist_search POST": 10, "userlist_search GET": 10, "userlist_edit GET": 15,
+        "userlist_edit POST": 5, "userlist_delete GET": 5, "user_req GET": 10, "user_req POST": 5,
+        "add POST": 5, "regist POST": 5,
+    },
+    # 申請の受付期間: 利用者の登録が中心
+    "registration": {
+        "user_req GET": 25, "user_req POST": 20, "add POST": 20, "regist POST": 20,
+        "userlist GET": 10, "userlist_edit GET": 5,
+    },
+}
+
+
+# ==========================================
+# 計測
+# ==========================================
+def _setup(args) -> Any:
+    """環境変数を設定してアプリを読み込み、Resource Manager を遅延付きのフェイクへ差し替える"""
+    for key, value in DUMMY_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ.update({
+        "STORAGE_BACKEND": "sqlite",
+        "STORAGE_LATENCY_MS": str(args.latency_ms),
+        "LOCAL_SEED_USERS": str(args.users),
+        "WRITE_SPOOL_PATH": os.path.join(tempfile.mkdtemp(prefix="route_bench_"), "write_spool.jsonl"),
+        "CLIENT_WARMUP": "false",
+    })
+    sys.path.insert(0, ROOT)
+    import main
+    from utils.util import clients
+    from utils.local_repository import LocalProjectsClient
+    project_ids = [f"bench-org-pj{i}-dev" for i in range(args.projects)]
+    clients.override("resource_manager", LocalProjectsClient(project_ids, latency_ms=args.rm_latency_ms))
+    return main.app
+
+
+def _backend_calls(server_timing: str) -> Dict[str, int]:
+    """Server-Timing ヘッダーからバックエンドごとの呼び出し回数を数える"""
+    calls = {name: 0 for name in BACKENDS.values()}
+    for entry in filter(None, (e.strip() for e in server_timing.split(","))):
+        backend = entry.split(";", 1)[0].rsplit("-", 1)[0]
+        if backend in BACKENDS:
+            calls[BACKENDS[backend]] += 1
+    return calls
+
+
+def run(app, args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    weights = MIXES[args.mix]
+    plan = rng.choices(list(weights), weights=list(weights.values()), k=args.requests)
+    seeds = [rng.randrange(1 << 30) for _ in plan]
+
+    # 画面ごとに1回ずつ実行し、テンプレートの読み込みや初回の全件読み込みを計測から除外
+    warm_client = app.test_client()
+    for name in weights:
+        SCENARIOS[name](warm_client, random.Random(0), args)
+
+    local = threading.local()
+
+    def one(i: int) -> Tuple[str, float, int, Dict[str, int]]:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        res = SCENARIOS[plan[i]](client, random.Random(seeds[i]), args)
+        res.get_data()
+        elapsed = time.perf_counter() - started
+        return plan[i], elapsed, res.status_code, _backend_calls(res.headers.get("Server-Timing", ""))
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(one, range(len(plan))))
+        elapsed = time.perf_counter() - started
+
+    by_scenario: Dict[str, List[Tuple[float, int, Dict[str, int]]]] = {}
+    for name, seconds, status, calls in results:
+        by_scenario.setdefault(name, []).append((seconds, status, calls))
+
+    scenarios = {}
+    for name in weights:
+        samples = by_scenario.get(name, [])
+        if not samples:
+            continue
+        ms = sorted(s[0] * 1000 for s in samples)
+        scenarios[name] = {
+            "n": len(ms),
+            "errors": sum(1 for s in samples if s[1] >= 400),
+            "p50_ms": round(statistics.median(ms), 1),
+            "p95_ms": round(_pct(ms, 0.95), 1),
+            "p99_ms": round(_pct(ms, 0.99), 1),
+            **{f"{b}_calls": round(sum(s[2][b] for s in samples) / len(samples), 2) for b in BACKENDS.values()},
+        }
+    return {
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "latency_ms": args.latency_ms,
+        "throughput": round(len(results) / elapsed, 1),
+        # Linuxの ru_maxrss はKB単位
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "scenarios": scenarios,
+    }
+
+
+def _pct(sorted_ms: List[float], p: float) -> float:
+    return sorted_ms[min(len(sorted_ms) - 1, int(len(sorted_ms) * p))]
+
+
+def report(result: Dict[str, Any]) -> None:
+    print(f"{'scenario':<22} {'n':>5} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'bq/req':>7} {'rm/req':>7}")
+    for name, s in result["scenarios"].items():
+        print(f"{name:<22} {s['n']:>5} {s['errors']:>4} {s['p50_ms']:>6.1f}ms {s['p95_ms']:>6.1f}ms "
+              f"{s['p99_ms']:>6.1f}ms {s['bq_calls']:>7.2f} {s['rm_calls']:>7.2f}")
+    print(f"throughput={result['throughput']} req/s  peak_rss={result['peak_rss_mb']}MB  "
+          f"(requests={result['requests']}, concurrency={result['concurrency']}, latency={result['latency_ms']}ms)")
+
+
+# ==========================================
+# 基準との比較
+# ==========================================
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, slack_ms: float) -> List[str]:
+    """基準からの悪化を列挙する (空なら問題なし)"""
+    regressions = []
+    if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput: {baseline['throughput']} -> {result['throughput']} req/s")
+    for name, base in baseline["scenarios"].items():
+        current = result["scenarios"].get(name)
+        if current is None:
+            continue
+        for key in ("bq_calls", "rm_calls"):
+            # 呼び出し回数は乱数の偏りによる小さな差のみ許容する
+            if current[key] > base[key] + 0.05:
+                regressions.append(f"{name} {key}: {base[key]} -> {current[key]} /req")
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance) + slack_ms:
+            regressions.append(f"{name} p95: {base['p95_ms']} -> {current['p95_ms']} ms")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name} errors: {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def _load_baselines() -> Dict[str, Any]:
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="画面ごとの負荷試験")
+    parser.add_argument("--mix", default="admin", choices=sorted(MIXES), help="リクエストの混在比率")
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に処理するリクエスト数 (WORKER_THREADS相当)")
+    parser.add_argument("--latency-ms", type=float, default=100, help="BigQuery相当の呼び出しごとの疑似遅延")
+    parser.add_argument("--rm-latency-ms", type=float, default=300, help="Resource Managerの検索の疑似遅延")
+    parser.add_argument("--users", type=int, default=5000, help="申請者テーブルの件数")
+    parser.add_argument("--projects", type=int, default=2000, help="既存のプロジェクト数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", action="store_true", help="benchmarks/baseline.json と比較する")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="p95 / スループットの許容する悪化の割合")
+    parser.add_argument("--slack-ms", type=float, default=20, help="p95の比較で無視する差(ミリ秒)")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果を基準として保存する")
+    args = parser.parse_args()
+
+    app = _setup(args)
+    try:
+        result = run(app, args)
+    finally:
+        from utils.util import shutdown
+        shutdown()
+    report(result)
+
+    baselines = _load_baselines()
+    if args.save_baseline:
+        baselines[args.mix] = result
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基準を保存しました: {BASELINE_PATH} ({args.mix})")
+    if args.check:
+        if args.mix not in baselines:
+            print(f"基準がありません: {args.mix} (--save-baseline で保存する)")
+            sys.exit(1)
+        regressions = compare(result, baselines[args.mix], args.tolerance, args.slack_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("基準との比較: 問題なし")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+コールドスタート計測用ベンチマーク
+
+1. import時間: 新しいPythonプロセスで `import main` (及び `import utils.util`) に掛かる時間
+2. 初回応答時間(TTFB): gunicornを起動してから GET / が最初に200を返すまでの時間
+
+いずれも毎回新しいプロセスで計測するため、Cloud Runのコールドスタートに近い値になる。
+GCPへのアクセスは発生しない (必須の環境変数が未設定の場合はダミー値を設定する)。
+
+使い方:
+    python benchmarks/startup_bench.py --runs 5
+    python benchmarks/startup_bench.py --runs 5 --no-warmup   # CLIENT_WARMUP=false で計測
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DUMMY_ENV = {
+    "PROJECT_ID": "bench-project",
+    "DATASET_ID": "bench_dataset",
+    "TABLE_ID": "bench_table",
+    "COMPANY_LIST_TABLE": "bench_company",
+    "FLASK_SECRET_KEY": "bench-secret-key",
+}
+
+
+def _env(warmup: bool) -> dict:
+    env = dict(os.environ)
+    for key, value in DUMMY_ENV.items():
+        env.setdefault(key, value)
+    env["CLIENT_WARMUP"] = "true" if warmup else "false"
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def measure_import(module: str, env: dict) -> float:
+    """新しいプロセスで module を import し、その所要時間(秒)を返す"""
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; "
+        "print(time.perf_counter() - t)"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_ttfb(env: dict, timeout: float = 60.0) -> float:
+    """gunicornを起動し、GET / が200を返すまでの時間(秒)を返す"""
+    port = _free_port()
+    cmd = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py",
+           "--bind", f"127.0.0.1:{port}", "--workers", "1", "--threads", "8", "main:app"]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError("gunicornが起動直後に終了しました")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as res:
+                    res.read()
+                    if res.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("初回応答がタイムアウトしました")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _summary(label: str, values: list) -> str:
+    ms = [v * 1000 for v in values]
+    return (f"{label:<24} median={statistics.median(ms):8.1f}ms  "
+            f"min={min(ms):8.1f}ms  max={max(ms):8.1f}ms  (n={len(ms)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コールドスタート計測")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-warmup", action="store_true", help="CLIENT_WARMUP=false で計測")
+    parser.add_argument("--skip-ttfb", action="store_true", help="import時間のみ計測")
+    args = parser.parse_args()
+
+    env = _env(warmup=not args.no_warmup)
+    print(_summary("import utils.util", [measure_import("utils.util", env) for _ in range(args.runs)]))
+    print(_summary("import main", [measure_import("main", env) for _ in range(args.runs)]))
+    if not args.skip_ttfb:
+        print(_summary("gunicorn TTFB (GET /)", [measure_ttfb(env) for _ in range(args.runs)]))
+
+
+if __name__ == "__main__":
+    main()
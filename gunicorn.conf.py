@@ -0,0 +1,35 @@
+# gunicorn 設定ファイル (Dockerfile の CMD から --config で読み込む)
+# bind は Dockerfile 側で指定する (Cloud Run の $PORT を使用するため)
+import os
+
+# 実行モード
+#   thread      : スレッドで並行処理 (既定)。同時に処理できるのは WORKER_THREADS 件まで
+#   cooperative : geventの協調型マルチタスク。BigQuery等の応答待ちの間に他のリクエストを処理するため、
+#                 1インスタンスで WORKER_CONNECTIONS 件までの待ち状態のリクエストを同時に抱えられる
+worker_mode = os.getenv("WORKER_MODE", "thread").lower()
+
+workers = 1
+timeout = 0
+if worker_mode == "cooperative":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("WORKER_CONNECTIONS", "500"))
+else:
+    worker_class = "gthread"
+    threads = int(os.getenv("WORKER_THREADS", "8"))
+
+
+def post_worker_init(worker):
+    """ワーカー起動後 (ポートbind済み) にクライアントの事前生成をバックグラウンドで開始"""
+    from utils.util import start_warm_up
+    from utils.metrics import WORKER_THREADS
+    if worker_mode == "cooperative":
+        WORKER_THREADS.set(worker.cfg.worker_connections)
+    else:
+        WORKER_THREADS.set(worker.cfg.threads)
+    start_warm_up()
+
+
+def worker_exit(server, worker):
+    """ワーカー停止時 (Cloud RunのSIGTERM受信時など) に書き込み待ちの登録データを書き込む"""
+    from utils.util import shutdown
+    shutdown()
@@ -1,17 +1,31 @@
 import os
 import sys
+import atexit
+import datetime
 import traceback
-import pendulum
-from flask import Flask, request, render_template, session, redirect, url_for, flash
+from flask import Flask, Response, g, request, render_template, session, redirect, url_for, flash
 from flask_login import LoginManager, UserMixin
 from flask_paginate import Pagination, get_page_parameter
-from google.cloud import bigquery
 # リファクタリング済みのUtilsをインポート
-# ※ bigquery_clientなどはUtils内部で隠蔽されているため、直接インポートせずUtils経由で使うか
-#   必要ならUtilsにメソッドを追加して呼び出すのが綺麗な設計です。
-#   ここでは互換性のため、bigquery_clientも使える前提で書きますが、
-#   理想は Utils.get_db_client() のように取得することです。
-from utils.util import Utils, logger, bigquery_client, project, dataset, table
+# ※ データアクセスはリポジトリ(user_repository)経由で行い、SQLはmain.pyに書かない。
+#   保存先(BigQuery / ローカルSQLite)は環境変数 STORAGE_BACKEND で切り替わる。
+from utils.util import (
+    Utils, logger, user_repository, id_allocator, write_pipeline, write_pipeline_enabled,
+    start_warm_up, shutdown, fan_out,
+    session_backend, session_ttl, session_max_entries, session_sqlite_path,
+    data_generation, company_generation, response_cache_enabled,
+    bigquery_transport, request_deadline, route_deadlines,
+)
+from utils.write_pipeline import WriteQueueFull
+from utils.repository import (
+    USER_DELETE_COLUMNS, USER_EDIT_COLUMNS, USER_LIST_COLUMNS, USER_TARGET_COLUMNS, to_date,
+)
+from utils.bulk_import import BulkImportError, detect_format, run_import
+from utils.export import EXPORT_COLUMNS, FORMATS as EXPORT_FORMATS, iter_export
+from utils.session_store import build_session_interface
+from utils import response_cache
+from utils import metrics, query_planner, transport
+from utils.transport import BackendSaturated, DeadlineExceeded, parse_deadlines
 
 # ==========================================
 # 1. アプリケーション初期化
@@ -27,6 +41,94 @@ if not app.secret_key:
 # デバッグモードは環境変数で制御 (ハードコードしない)
 app.debug = os.getenv("FLASK_DEBUG", "False").lower() == "true"
 
+# セッションの保存先 (SESSION_BACKEND=memory / sqlite ではCookieにセッションキーのみを格納)
+_session_interface = build_session_interface(
+    session_backend, session_ttl, max_entries=session_max_entries, sqlite_path=session_sqlite_path)
+if _session_interface is not None:
+    app.session_interface = _session_interface
+
+# 一覧画面の1ページあたりの表示件数
+PER_PAGE = 20
+
+# 条件付きGET: 書き込みが無ければ画面を描画せずに304を返す (If-None-Match が一致した場合)
+def conditional_get(key=None, generation=data_generation):
+    return response_cache.conditional(generation, key=key, enabled=response_cache_enabled)
+
+# リクエストごとの計測 (所要時間を /metrics へ集計し、内訳を Server-Timing ヘッダーで返す)
+@app.before_request
+def begin_metrics():
+    g.metrics = metrics.begin_request()
+
+@app.after_request
+def end_metrics(response):
+    started = g.pop('metrics', None)
+    if started is not None:
+        response.headers['Server-Timing'] = metrics.end_request(
+            *started, endpoint=request.endpoint or 'unmatched', method=request.method, status=response.status_code)
+    return response
+
+# クエリの処理量の上限は画面ごとに設定するため、実行中の画面名をクエリの見積もり側へ渡す
+@app.before_request
+def begin_query_route():
+    g.query_route = query_planner.enter_route(request.endpoint)
+
+@app.teardown_request
+def end_query_route(exc):
+    token = g.pop('query_route', None)
+    if token is not None:
+        query_planner.leave_route(token)
+
+# 外部API(BigQuery等)への呼び出しの期限は画面ごとに設定する (ROUTE_DEADLINES で上書き、既定は REQUEST_DEADLINE)
+ROUTE_DEADLINES = parse_deadlines(route_deadlines)
+
+# 外部APIを呼び出さないため、接続プールが埋まっていても受け付ける画面
+SHED_EXEMPT_ENDPOINTS = {'index', 'static', 'export_metrics'}
+
+# 接続プールの空きを待たずに503を返す場合の、再試行までの目安(秒)
+RETRY_AFTER_SECONDS = 5
+
+@app.before_request
+def shed_when_saturated():
+    # 接続の空き待ちが上限に達している間は、受け付けて待たせるより先に503の画面を返す
+    if request.endpoint in SHED_EXEMPT_ENDPOINTS or not bigquery_transport.limiter.saturated():
+        return None
+    transport.SHED_REQUESTS.inc(backend='bigquery', stage='admission')
+    return busy_response()
+
+@app.before_request
+def begin_deadline():
+    g.deadline = transport.enter_deadline(ROUTE_DEADLINES.get(request.endpoint, request_deadline))
+
+@app.teardown_request
+def end_deadline(exc):
+    token = g.pop('deadline', None)
+    if token is not None:
+        transport.leave_deadline(token)
+
+def busy_response(status=503):
+    """混雑時/期限切れ時の画面 (描画のみで外部APIは呼び出さない)"""
+    response_cache.skip()
+    response = Response(render_template('regist_error.html', error_title='busy'), status=status)
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
+@app.errorhandler(BackendSaturated)
+def handle_backend_saturated(e):
+    logger.warning(f"Backend saturated on {request.endpoint}: {e}")
+    return busy_response(503)
+
+@app.errorhandler(DeadlineExceeded)
+def handle_deadline_exceeded(e):
+    logger.warning(f"Deadline exceeded on {request.endpoint}: {e}")
+    return busy_response(504)
+
+@app.teardown_request
+def abort_metrics(exc):
+    # after_request を通らずに終了した場合も処理中の件数を戻す
+    started = g.pop('metrics', None)
+    if started is not None:
+        metrics.end_request(*started, endpoint=request.endpoint or 'unmatched', method=request.method, status=500)
+
 # ログインマネージャー設定
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -57,12 +159,25 @@ def request_loader(request):
 # 3. ビジネスロジック / ヘルパー関数
 # ==========================================
 def get_company_name_by_id(company_id: int) -> str:
-    """会社IDから会社名を取得 (キャッシュ推奨だが今回は都度取得)"""
-    company_list = Utils.get_company_list()
-    for row in company_list:
-        if int(row["company_id"]) == int(company_id):
-            return row["company_name"]
-    return "不明な会社"
+    """会社IDから会社名を取得 (Utils側の会社一覧キャッシュの索引を参照)"""
+    return Utils.get_company_name(company_id)
+
+def store_registration(row: dict) -> None:
+    """
+    登録データを保存
+    非同期書き込みが有効ならキューへ積んで即座に戻る (BigQueryへの書き込みはバックグラウンドでまとめて実行)
+    キューが満杯の場合・無効の場合は従来どおり同期的にINSERTする
+    """
+    if write_pipeline_enabled:
+        try:
+            write_pipeline.submit(row)
+            return
+        except WriteQueueFull as e:
+            logger.warning(f"書き込みキューが満杯のため同期的に登録します: {e}")
+
+    user_repository.insert_user(row)
+    # 新規行が先頭に入りページ境界がずれるため、ページ境界の破棄と検索インデックスへの反映を行う
+    Utils.notify_users_changed([row], inserted=True)
 
 def generate_github_url(use_purpose: str, target_name: str) -> str:
     """利用用途に応じたGitHub URLを生成"""
@@ -75,6 +190,107 @@ def generate_github_url(use_purpose: str, target_name: str) -> str:
     }
     return f"{base_urls.get(use_purpose, '')}{target_name}"
 
+# 管理者が更新できるカラム (バリデーション済みの安全なキーのみ許可するホワイトリスト)
+ADMIN_UPDATE_KEYS = [
+    'manage_company_name', 'organization_name', 'project_name_gcp', 
+    'group_name', 'group_email', 'user_group_name', 'user_group_email',
+    'env', 'use_purpose', 'subnet_info', 'client_cidr', 'domain_name',
+    'vpc_access_conn', 'connector_cidr', 'UPDATE_FLG'
+]
+
+# 一括操作で設定できる UPDATE_FLG (承認済み / 論理削除)
+BATCH_UPDATE_FLGS = ('operate', 'DLT')
+
+# 一括操作1回あたりの上限件数 (クエリパラメータのサイズ上限を超えないように)
+MAX_BATCH_ROWS = 500
+
+# 一括操作の結果として読み取るカラム (検索インデックスへの反映 + GitHub URL / プロジェクトIDの算出)
+BATCH_RESULT_COLUMNS = USER_LIST_COLUMNS + USER_TARGET_COLUMNS
+
+# 一括更新の入力チェック/重複チェックで読み取る登録済みの値 (変更内容を重ねた変更後の行でチェックする)
+BATCH_CHECK_COLUMNS = ['id'] + ADMIN_UPDATE_KEYS
+
+def admin_update_fields(data: dict) -> dict:
+    """管理者の入力からホワイトリストのカラムだけを取り出す ('None'は未設定として扱う)"""
+    fields = {key: data[key] for key in ADMIN_UPDATE_KEYS if key in data}
+    for key in ('vpc_access_conn', 'connector_cidr'):
+        if fields.get(key) == 'None':
+            fields[key] = None
+    return fields
+
+def changed_fields(original: dict, form: dict) -> dict:
+    """編集画面の入力のうち、元の値から変更されたカラムだけを取り出す (セッションに保持する編集内容)"""
+    def text(value):
+        return '' if value is None else str(value)
+    return {key: form[key] for key in ADMIN_UPDATE_KEYS
+            if key in form and text(form[key]) != text(original.get(key))}
+
+def target_name_of(row: dict) -> str:
+    """GitHub上のディレクトリ名/プロジェクト名の元になる名前"""
+    return f"{row.get('manage_company_name')}-{row.get('organization_name')}-{row.get('project_name_gcp')}"
+
+def project_ids_of(row: dict) -> list:
+    """払い出すプロジェクトID (環境ごと)"""
+    return [f"{target_name_of(row)}-{env}" for env in (row.get('env') or '').split(',') if env]
+
+def load_batch_targets(changes: dict) -> tuple:
+    """
+    一括更新の対象の登録済みの行 {id: 行} と、承認する申請者がいる場合は払い出し済みのプロジェクト(索引)を同時に読み取る
+    (承認しない場合の索引は None)
+    """
+    fetches = {'users': lambda: user_repository.get_users(list(changes), BATCH_CHECK_COLUMNS)}
+    if any(fields.get('UPDATE_FLG') == 'operate' for fields in changes.values()):
+        fetches['projects'] = Utils.get_project_index
+    fetched = fan_out(fetches)
+    return {row['id']: row for row in fetched['users']}, fetched.get('projects')
+
+def duplicate_project_errors(changes: dict, current: dict, existing_projects) -> list:
+    """
+    一括操作で承認する申請者について、編集画面の承認と同じプロジェクト名の重複チェックを行う
+    払い出し済みのプロジェクト(索引)に加え、同じ一括操作内の他の申請者との重複も検出する
+    current は load_batch_targets で読み取った登録済みの行 {id: 行}
+    """
+    approving = [i for i, fields in changes.items() if fields.get('UPDATE_FLG') == 'operate']
+    if not approving:
+        return []
+    claimed = {}
+    errors = []
+    for row in (current[i] for i in sorted(approving) if i in current):
+        # 承認済みの申請者の再承認は、自身のプロジェクトが索引にあるため対象外 (編集画面と同じく申請中のみ)
+        if row.get('UPDATE_FLG') != 'update':
+            continue
+        merged = {**row, **changes[row['id']]}
+        for full_name in project_ids_of(merged):
+            if full_name in existing_projects or claimed.get(full_name, row['id']) != row['id']:
+                errors.append({"id": row['id'], "errors": [f'{full_name}: プロジェクト名が重複しています。']})
+                break
+        else:
+            for full_name in project_ids_of(merged):
+                claimed[full_name] = row['id']
+    return errors
+
+def apply_batch_changes(changes: dict) -> list:
+    """
+    複数の申請者への変更 {id: {カラム: 値}} を1回の書き込み(MERGE)で反映し、
+    更新後の行ごとに GitHub URL を返す
+    """
+    updated = user_repository.update_users(changes, BATCH_RESULT_COLUMNS)
+    Utils.notify_users_changed(updated)
+    results = []
+    new_project_ids = []
+    for row in updated:
+        target_name = target_name_of(row)
+        if row.get('UPDATE_FLG') == 'operate':
+            new_project_ids.extend(project_ids_of(row))
+        results.append({
+            'id': row['id'],
+            'UPDATE_FLG': row.get('UPDATE_FLG'),
+            'target_url': generate_github_url(row.get('use_purpose'), target_name),
+        })
+    # 払い出したプロジェクト名を重複チェック用の索引へ即時反映
+    Utils.register_project_ids(new_project_ids)
+    return results
+
 # ==========================================
 # 4. ルーティング & コントローラー
 # ==========================================
@@ -88,12 +304,14 @@ def index():
     return render_template('first_img.html', kind="登録")
 
 @app.route('/user_req', methods=['GET', 'POST'])
+@conditional_get(generation=company_generation)  # 会社一覧が変わるまで304
 def user_request():
     """ユーザー登録フォーム処理"""
-    company_data = Utils.get_company_list()
+    # 会社プルダウンは会社一覧が変わるまで描画済みのHTMLを再利用
+    company_options = Utils.get_company_options_html()
     
     if request.method == 'GET':
-        return render_template('add.html', form={}, kind="登録", company_data=company_data)
+        return render_template('add.html', form={}, kind="登録", company_options=company_options)
 
     if request.method == 'POST':
         form_data = request.form.to_dict()
@@ -105,7 +323,7 @@ def user_request():
             # 確認画面へ (データはhiddenで渡すか、一時セッションに入れる)
             return render_template('add2.html', form=form_data)
         else:
-            return render_template('add.html', error=error_msgs, kind="登録", form=form_data, company_data=company_data)
+            return render_template('add.html', error=error_msgs, kind="登録", form=form_data, company_options=company_options)
 
 @app.route('/add', methods=['GET', 'POST'])
 def add_project_info():
@@ -137,46 +355,17 @@ def register_user():
     try:
         form = request.form.to_dict()
         
-        # ID採番 (MAX+1) - ※並行実行時に重複リスクあり。本来はUUIDかシーケンス推奨
-        # 互換性のため元のロジックを踏襲するが、Queryを一発にする
-        max_id_query = f"SELECT MAX(id) as max_id FROM `{project}.{dataset}.{table}`"
-        rows = list(bigquery_client.query(max_id_query))
-        new_id = (rows[0].max_id + 1) if rows and rows[0].max_id else 1
-        
-        insert_date = pendulum.today().date()
-        
-        # パラメータクエリで安全にINSERT
-        insert_query = f"""
-            INSERT INTO `{project}.{dataset}.{table}` 
-            (id, name, desired_delivery_date, tel, email, belonging_department, company_id, 
-             project_name, system_name, type, memo, insert_date, UPDATE_FLG)
-            VALUES 
-            (@id, @username, @regist_date, @tel_number, @regist_email, @belonging_department, @company_id,
-             @project_name, @system_name, @type, @memo, @insert_date, 'update')
-        """
+        # 確認画面を経由しない直接POSTに備えて再検証 (非同期書き込みでは書き込み失敗を画面に返せないため)
+        error_msgs = Utils.validate(form) + Utils.validate2(form)
+        if error_msgs:
+            logger.warning(f"Registration rejected: {error_msgs}")
+            return render_template('regist_error.html', error_title='normal')
+
+        # ID採番 (採番テーブルから予約済みのIDをメモリ上で払い出すため、通常はDBアクセスなし)
+        new_id = id_allocator.allocate()
         
-        # 会社IDの分割処理 "1: 株式会社XX" -> 1
-        company_id_val = int(form['company_id'].split(':')[0])
-
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("id", "INTEGER", new_id),
-                bigquery.ScalarQueryParameter("username", "STRING", form['username']),
-                bigquery.ScalarQueryParameter("regist_date", "DATE", form['regist_date']),
-                bigquery.ScalarQueryParameter("tel_number", "STRING", form['tel_number']),
-                bigquery.ScalarQueryParameter("regist_email", "STRING", form['email']),
-                bigquery.ScalarQueryParameter("belonging_department", "STRING", form['belonging_department']),
-                bigquery.ScalarQueryParameter("company_id", "INTEGER", company_id_val),
-                bigquery.ScalarQueryParameter("project_name", "STRING", form['project_name']),
-                bigquery.ScalarQueryParameter("system_name", "STRING", form['system_name']),
-                bigquery.ScalarQueryParameter("type", "STRING", form['type']),
-                bigquery.ScalarQueryParameter("memo", "STRING", form['memo']),
-                bigquery.ScalarQueryParameter("insert_date", "DATE", insert_date),
-            ]
-        )
-
-        query_job = bigquery_client.query(insert_query, job_config=job_config)
-        query_job.result() # 完了待機
+        # 保存 (非同期書き込みが有効ならキューへ積んで即応答)
+        store_registration(Utils.build_registration_row(form, new_id))
 
         return render_template('regist.html')
 
@@ -185,30 +374,31 @@ def register_user():
         return render_template('regist_error.html', error_title='normal')
 
 @app.route('/userlist', methods=['GET'])
+@conditional_get()
 def list_users():
     """管理者用: ユーザー一覧表示"""
     try:
-        users_data = Utils.get_users_list()
-        
-        # 日付フォーマットのユニークリスト作成
-        dates = sorted(list({entry['desired_delivery_date'].strftime('%Y-%m-%d') for entry in users_data if entry.get('desired_delivery_date')}))
-        
-        # ページネーション処理
+        # 日付プルダウン (集計済みの件数から描画したHTMLを次の書き込みまで再利用し、一覧の全件は読まない)
+        date_options = Utils.get_date_options_html()
+
+        # ページネーション処理 (表示する1ページ分と件数だけを取得)
         page = request.args.get(get_page_parameter(), type=int, default=1)
-        per_page = 20
-        start = (page - 1) * per_page
-        end = start + per_page
-        
-        current_page_data = users_data[start:end]
-        pagination = Pagination(page=page, total=len(users_data), per_page=per_page, css_framework='bootstrap5')
+        total = Utils.count_users()
+        current_page_data = Utils.get_users_page(page, PER_PAGE)
+        pagination = Pagination(page=page, total=total, per_page=PER_PAGE, css_framework='bootstrap5')
 
-        return render_template('users_list.html', data=users_data, date_options=dates, rows=current_page_data, pagination=pagination)
+        return render_template('users_list.html', date_options=date_options, rows=current_page_data,
+                               pagination=pagination)
 
+    except (BackendSaturated, DeadlineExceeded):
+        raise  # 503/504の画面は errorhandler で返す
     except Exception as e:
         logger.error(f"Error listing users: {e}\n{traceback.format_exc()}")
+        response_cache.skip()
         return render_template('regist_error.html', error_title='manage_normal', error_mess=str(e))
 
 @app.route("/userlist_search", methods=['POST', 'GET'])
+@conditional_get(key=lambda: (session.get('search_name', ''), session.get('search_date', '')))
 def search_users():
     """ユーザー検索処理"""
     # セッションを活用して検索条件を保持
@@ -219,54 +409,40 @@ def search_users():
     user_name = session.get('search_name', '')
     s_date = session.get('search_date', '')
 
-    query = f"""
-        SELECT id, name, desired_delivery_date, tel, email, belonging_department, 
-               project_name, type, project_id_gcp, UPDATE_FLG 
-        FROM `{project}.{dataset}.{table}` 
-        WHERE name LIKE @user_name
-    """
-    
-    params = [bigquery.ScalarQueryParameter("user_name", "STRING", f"%{user_name}%")]
-
-    if s_date:
-        query += " AND desired_delivery_date = @date"
-        params.append(bigquery.ScalarQueryParameter("date", "STRING", s_date))
-    
-    query += " ORDER BY id DESC"
-
-    query_job = bigquery_client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-    result = [dict(row.items()) for row in query_job]
-    
-    # ページネーション (list_usersと共通化できるが今回はそのまま記述)
+    # ページネーション (検索インデックスからメモリ上で1ページ分と件数を取得)
     page = request.args.get(get_page_parameter(), type=int, default=1)
-    per_page = 20
-    rows = result[(page - 1) * per_page : page * per_page]
-    pagination = Pagination(page=page, total=len(result), per_page=per_page, css_framework='bootstrap5')
+    total, rows = Utils.search_users_page(page, PER_PAGE, user_name, s_date)
+    pagination = Pagination(page=page, total=total, per_page=PER_PAGE, css_framework='bootstrap5')
     
-    # 日付リストは全件から再取得が必要ならUtils経由で呼ぶか、検索結果から作る
-    formatted_dates = [] # 必要なら実装
+    # 日付プルダウンは一覧画面と同じ集計済みの値を使用
+    date_options = Utils.get_date_options_html(s_date)
 
-    return render_template('users_list.html', data=result, date_options=formatted_dates, rows=rows, pagination=pagination)
+    return render_template('users_list.html', date_options=date_options, rows=rows, pagination=pagination,
+                           text_word=user_name, selected_date=s_date)
 
 @app.route("/userlist_edit/<int:id>", methods=["GET", "POST"])
 def update_user_view(id):
     """管理者用: 編集画面表示 & 確認処理"""
     
-    # DBから最新データを取得
-    query = f"SELECT * FROM `{project}.{dataset}.{table}` WHERE id = @id"
-    job_config = bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter("id", "INTEGER", id)])
-    rows = list(bigquery_client.query(query, job_config=job_config))
+    # 申請者・会社一覧・(POST時の重複チェック用)プロジェクト索引は互いに独立しているため同時に取得
+    fetches = {
+        'user': lambda: user_repository.get_user(id, USER_EDIT_COLUMNS),
+        'companies': Utils.get_company_list,  # 会社名の索引を読み込み済みにしておく
+    }
+    if request.method == "POST":
+        fetches['projects'] = Utils.get_project_index
+    fetched = fan_out(fetches)
+    user_data = fetched['user']
     
-    if not rows:
+    if not user_data:
         return "User not found", 404
         
-    user_data = dict(rows[0].items())
     user_data['company_name'] = get_company_name_by_id(user_data['company_id'])
     
     # GET: 編集画面表示
     if request.method == "GET":
-        # 新規編集セッションの開始
-        session['edit_form'] = user_data # セッションに退避
+        # 新規編集セッションの開始 (行全体ではなくIDのみを保持し、セッションを小さく保つ)
+        session['edit_form'] = {'id': id}
         
         msg = '※登録後変更不可' if user_data.get('UPDATE_FLG') == 'update' else ''
         return render_template("users_edit.html", data=[user_data], mess=msg)
@@ -285,16 +461,18 @@ def update_user_view(id):
         # 重複チェックロジック
         if form.get('UPDATE_FLG') == 'update':
             target_name = f"{form['manage_company_name']}-{form['organization_name']}-{form['project_name_gcp']}"
-            existing_projects = Utils.get_multicloud_pjname()
+            existing_projects = fetched['projects']
             
             for env in env_list:
                 full_name = f"{target_name}-{env}"
-                # リスト内の存在確認
+                # 索引(frozenset)での存在確認
                 if full_name in existing_projects:
                     error_msgs.append(f'{full_name}: プロジェクト名が重複しています。')
                     break
 
         if not error_msgs:
+            # 確認画面へ進む編集内容は、変更されたカラムだけを保持
+            session['edit_form'] = {'id': id, 'changes': changed_fields(user_data, form)}
             return render_template('edit_confirm.html', item=form, data=form)
         else:
             msg = '※登録後変更不可' if form.get('UPDATE_FLG') == 'update' else ''
@@ -306,39 +484,25 @@ def execute_update(id):
     try:
         data = request.form.to_dict()
         data['UPDATE_FLG'] = "operate" # フラグ更新
-        
-        # 不要なキーの削除や整形
-        if data.get('vpc_access_conn') == 'None': data['vpc_access_conn'] = None
-        if data.get('connector_cidr') == 'None': data['connector_cidr'] = None
-
-        # 動的SQL構築 (BigQueryパラメータクエリ使用)
-        # 更新対象のカラムを定義 (バリデーション済みの安全なキーのみ許可するホワイトリスト方式推奨)
-        allowed_keys = [
-            'manage_company_name', 'organization_name', 'project_name_gcp', 
-            'group_name', 'group_email', 'user_group_name', 'user_group_email',
-            'env', 'use_purpose', 'subnet_info', 'client_cidr', 'domain_name',
-            'vpc_access_conn', 'connector_cidr', 'UPDATE_FLG'
-        ]
-        
-        set_clauses = []
-        params = []
-        
-        for key in allowed_keys:
-            if key in data:
-                set_clauses.append(f"{key} = @{key}")
-                params.append(bigquery.ScalarQueryParameter(key, "STRING", data[key]))
 
-        if not set_clauses:
-            raise ValueError("No fields to update")
+        # 確認画面へ進んだ時点の編集内容 (入力チェック済みの変更カラム) のみを書き込む
+        # 別の申請者の編集を開いた後の古い確認画面・確認画面を経由しない送信は受け付けない
+        edit_form = session.get('edit_form') or {}
+        if edit_form.get('id') != id or 'changes' not in edit_form:
+            return render_template('regist_error.html', error_title='manage_normal',
+                                   error_mess='編集内容が古いため更新できません。編集画面からやり直してください。')
+        fields = admin_update_fields({**edit_form['changes'], 'UPDATE_FLG': data['UPDATE_FLG']})
 
-        query = f"UPDATE `{project}.{dataset}.{table}` SET {', '.join(set_clauses)} WHERE id = @id"
-        params.append(bigquery.ScalarQueryParameter("id", "INTEGER", id))
-
-        query_job = bigquery_client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-        query_job.result()
+        # リポジトリ側でパラメータクエリとしてUPDATE
+        user_repository.update_user(id, fields)
+        Utils.notify_users_changed([{'id': id, **fields}])
+        session.pop('edit_form', None)
 
         # 完了画面へ (GitHub URL生成)
-        target_name = f"{data.get('manage_company_name')}-{data.get('organization_name')}-{data.get('project_name_gcp')}"
+        target_name = target_name_of(data)
+
+        # 払い出したプロジェクト名を重複チェック用の索引へ即時反映
+        Utils.register_project_ids(project_ids_of(data))
         gh_url = generate_github_url(data.get('use_purpose'), target_name)
         
         return render_template('regist_complete.html', target_url=gh_url)
@@ -351,13 +515,13 @@ def execute_update(id):
 def delete_user(id):
     """論理削除処理"""
     try:
-        # 対象データ取得
-        query = f"SELECT * FROM `{project}.{dataset}.{table}` WHERE id = @id"
-        job_config = bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter("id", "INTEGER", id)])
-        rows = list(bigquery_client.query(query, job_config=job_config))
+        # 対象データ取得 (会社名の索引の読み込みと同時に実行)
+        delete_data = fan_out({
+            'user': lambda: user_repository.get_user(id, USER_DELETE_COLUMNS),
+            'companies': Utils.get_company_list,
+        })['user']
         
-        if not rows: return "Not Found", 404
-        delete_data = dict(rows[0].items())
+        if not delete_data: return "Not Found", 404
         delete_data['company_name'] = get_company_name_by_id(delete_data['company_id'])
 
         if request.method == "GET":
@@ -365,10 +529,8 @@ def delete_user(id):
 
         if request.method == "POST":
             # UPDATE_FLG = 'DLT' に更新
-            update_query = f"UPDATE `{project}.{dataset}.{table}` SET UPDATE_FLG = 'DLT' WHERE id = @id"
-            update_params = [bigquery.ScalarQueryParameter("id", "INTEGER", id)]
-            
-            bigquery_client.query(update_query, job_config=bigquery.QueryJobConfig(query_parameters=update_params)).result()
+            user_repository.mark_deleted(id)
+            Utils.notify_users_changed([{'id': id, 'UPDATE_FLG': 'DLT'}])
             
             # 完了画面へ
             target_name = f"{delete_data['manage_company_name']}-{delete_data['organization_name']}-{delete_data['project_name_gcp']}"
@@ -380,6 +542,151 @@ def delete_user(id):
         logger.error(f"Delete failed: {e}")
         return render_template('regist_error.html', error_title='manage_normal', error_mess=str(e))
 
+@app.route("/userlist_batch_update", methods=["POST"])
+def batch_update_users():
+    """
+    管理者用: 複数の申請者をまとめて承認/更新/削除 (1回のMERGEで反映)
+    JSON: {"rows": [{"id": 1, "UPDATE_FLG": "operate", "env": "dev", ...}, ...]}
+    UPDATE_FLG は operate(承認) 又は DLT(論理削除)。指定しない行は項目の更新のみ行う (承認状態は変更しない)
+    他の項目は編集画面と同じホワイトリストのみ更新する。承認する行は編集画面と同じプロジェクト名の重複チェックを行う
+    """
+    payload = request.get_json(silent=True) or {}
+    rows = payload.get('rows')
+    if not isinstance(rows, list) or not rows:
+        return {"error": "rows is required"}, 400
+    if len(rows) > MAX_BATCH_ROWS:
+        return {"error": f"too many rows (max {MAX_BATCH_ROWS})"}, 400
+
+    changes = {}
+    errors = []
+    for row in rows:
+        if not isinstance(row, dict) or not isinstance(row.get('id'), int):
+            errors.append({"row": row, "errors": ["id is required"]})
+            continue
+        fields = admin_update_fields(row)
+        if not fields:
+            errors.append({"id": row['id'], "errors": ["no fields to update"]})
+            continue
+        if 'UPDATE_FLG' in fields and fields['UPDATE_FLG'] not in BATCH_UPDATE_FLGS:
+            errors.append({"id": row['id'], "errors": [f"UPDATE_FLG must be one of {list(BATCH_UPDATE_FLGS)}"]})
+            continue
+        changes[row['id']] = fields
+
+    ids = list(changes)
+    try:
+        current, existing_projects = load_batch_targets(changes) if changes else ({}, None)
+    except Exception as e:
+        logger.error(f"Batch update failed: {e}\n{traceback.format_exc()}")
+        return {"error": str(e)}, 500
+
+    # 編集画面と同じ入力チェック (変更した項目を登録済みの値に重ねた、変更後の行に対して行う)
+    for user_id, msgs in Utils.validate_admin_changes(current, changes).items():
+        errors.append({"id": user_id, "errors": msgs})
+    if errors:
+        return {"errors": errors}, 400
+
+    try:
+        errors = duplicate_project_errors(changes, current, existing_projects)
+        if errors:
+            return {"errors": errors}, 400
+        results = apply_batch_changes(changes)
+    except Exception as e:
+        logger.error(f"Batch update failed: {e}\n{traceback.format_exc()}")
+        return {"error": str(e)}, 500
+
+    found = {r['id'] for r in results}
+    return {"results": results, "not_found": [i for i in ids if i not in found]}
+
+@app.route("/userlist_batch_delete", methods=["POST"])
+def batch_delete_users():
+    """
+    管理者用: 複数の申請者をまとめて論理削除 (1回のMERGEで反映)
+    JSON: {"ids": [1, 2, 3]}
+    """
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+        return {"error": "ids must be a non-empty list of integers"}, 400
+    if len(ids) > MAX_BATCH_ROWS:
+        return {"error": f"too many ids (max {MAX_BATCH_ROWS})"}, 400
+
+    ids = list(dict.fromkeys(ids))
+    try:
+        results = apply_batch_changes({i: {'UPDATE_FLG': 'DLT'} for i in ids})
+    except Exception as e:
+        logger.error(f"Batch delete failed: {e}\n{traceback.format_exc()}")
+        return {"error": str(e)}, 500
+
+    found = {r['id'] for r in results}
+    return {"results": results, "not_found": [i for i in ids if i not in found]}
+
+@app.route("/userlist_import", methods=["POST"])
+def import_users():
+    """
+    管理者用: CSV/JSONLファイルから申請者を一括登録
+    multipartの file に入力ファイル、dry_run=true で検証のみ。
+    入力1行につき1件の報告をJSONLで返す (件数は X-Import-* ヘッダー)
+    """
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return {"error": "file is required"}, 400
+
+    fmt = request.form.get('format') or detect_format(upload.filename)
+    dry_run = request.form.get('dry_run', 'false').lower() == 'true'
+    try:
+        result = run_import(upload.stream, fmt, dry_run=dry_run)
+    except BulkImportError as e:
+        logger.warning(f"Bulk import rejected: {e}")
+        return {"error": str(e)}, 400
+    except Exception as e:
+        logger.error(f"Bulk import failed: {e}\n{traceback.format_exc()}")
+        return {"error": str(e)}, 500
+
+    headers = {
+        'X-Import-Total': str(result.total),
+        'X-Import-Loaded': str(result.loaded),
+        'X-Import-Rejected': str(result.rejected),
+    }
+    return Response(result.iter_report(), mimetype='application/x-ndjson', headers=headers)
+
+@app.route("/userlist/export", methods=["GET"])
+def export_users():
+    """
+    管理者用: 申請者一覧のエクスポート (検索画面と同じ氏名/引き渡し希望日の条件で絞り込み、id降順)
+    ?format=csv|jsonl&name=...&date=YYYY-MM-DD
+    結果は一定件数ずつ取得してそのまま返すため、件数が多くてもメモリに全件を保持しない
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return {"error": f"format must be one of {list(EXPORT_FORMATS)}"}, 400
+    name = request.args.get('name') or None
+    s_date = request.args.get('date') or None
+    try:
+        to_date(s_date)
+    except ValueError:
+        return {"error": "date must be YYYY-MM-DD"}, 400
+
+    try:
+        # クエリの失敗(処理量の上限超過を含む)は応答の送信開始前にここで検知する
+        rows = user_repository.iter_users(EXPORT_COLUMNS, name, s_date)
+    except (BackendSaturated, DeadlineExceeded):
+        raise  # 503/504の画面は errorhandler で返す
+    except Exception as e:
+        logger.error(f"Export failed: {e}\n{traceback.format_exc()}")
+        return {"error": str(e)}, 500
+
+    filename = f"users_{datetime.date.today():%Y%m%d}.{fmt}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    return Response(iter_export(rows, fmt), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+@app.route("/metrics", methods=["GET"])
+def export_metrics():
+    """性能指標 (Prometheus形式。値はこのワーカープロセス内の集計)"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     # 本番運用時はgunicorn等で起動するため、ここは開発用
+    # (gunicornでは gunicorn.conf.py の post_worker_init から呼び出される)
+    start_warm_up()
+    atexit.register(shutdown)
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 8080)), debug=app.debug)
@@ -0,0 +1,66 @@
+"""
+テスト共通の設定
+
+GCPへ接続せずに実行するため、utils.util の読み込み前に STORAGE_BACKEND=sqlite を設定する。
+リポジトリを使うテストは、テストごとに新しいインメモリのSQLite (repository フィクスチャ) を使用する。
+
+使い方:
+    pip install pytest
+    python -m pytest -q
+"""
+import os
+import sys
+import datetime
+import tempfile
+from typing import Any, Dict
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DUMMY_ENV = {
+    "PROJECT_ID": "test-project",
+    "DATASET_ID": "test_dataset",
+    "TABLE_ID": "test_table",
+    "COMPANY_LIST_TABLE": "test_company",
+    "FLASK_SECRET_KEY": "test-secret-key",
+}
+
+for _key, _value in DUMMY_ENV.items():
+    os.environ.setdefault(_key, _value)
+_tmp = tempfile.mkdtemp(prefix="multicloud_test_")
+os.environ.update({
+    "STORAGE_BACKEND": "sqlite",
+    "LOG_PIPELINE": "false",
+    "CLIENT_WARMUP": "false",
+    "WRITE_SPOOL_PATH": os.path.join(_tmp, "write_spool.jsonl"),
+    "WRITE_DEAD_LETTER_PATH": os.path.join(_tmp, "write_dead_letter.jsonl"),
+})
+sys.path.insert(0, ROOT)
+
+
+def make_user(user_id: int, **overrides: Any) -> Dict[str, Any]:
+    """申請者テーブルの1行 (登録直後の状態)"""
+    row = {
+        'id': user_id,
+        'name': f"利用者{user_id}",
+        'desired_delivery_date': datetime.date(2024, 4, 1),
+        'tel': '03-0000-0000',
+        'email': f"user{user_id}@example.com",
+        'belonging_department': '情報システム部',
+        'company_id': 1,
+        'project_name': f"project{user_id}",
+        'system_name': f"system{user_id}",
+        'type': 'standard',
+        'memo': '',
+        'insert_date': datetime.date(2024, 3, 1),
+        'UPDATE_FLG': 'update',
+    }
+    row.update(overrides)
+    return row
+
+
+@pytest.fixture
+def repository():
+    from utils.local_repository import SQLiteUserRepository
+    return SQLiteUserRepository(":memory:")
@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import make_user
+
+
+@pytest.fixture
+def client(repository):
+    """一括更新APIをテスト用のSQLiteに対して実行する"""
+    import main
+    from utils import util
+    util.clients.override("repository", repository)
+    yield main.app.test_client()
+    util.clients.reset("repository")
+
+
+def static_site(user_id, **overrides):
+    return make_user(user_id, manage_company_name='acme', organization_name='org', project_name_gcp=f"pj{user_id}",
+                     env='dev', use_purpose='static', domain_name='example.com', **overrides)
+
+
+def test_partial_update_checks_rules_against_stored_use_purpose(client, repository):
+    repository.insert_users([static_site(10)])
+
+    response = client.post('/userlist_batch_update', json={"rows": [{"id": 10, "domain_name": "!!! not a domain"}]})
+
+    assert response.status_code == 400
+    assert response.get_json() == {"errors": [{"id": 10, "errors": ['無効なドメイン名です。']}]}
+    assert repository.get_user(10, ['domain_name'])['domain_name'] == 'example.com'
+
+
+def test_changing_use_purpose_checks_stored_dependent_fields(client, repository):
+    repository.insert_users([static_site(10)])
+
+    response = client.post('/userlist_batch_update', json={"rows": [{"id": 10, "use_purpose": "standard"}]})
+
+    assert response.status_code == 400
+    assert response.get_json()["errors"][0]["errors"] == ['利用IP範囲は半角数字及び.(ドット)/(スラッシュ)のみです。']
+
+
+def test_valid_partial_update_is_applied(client, repository):
+    repository.insert_users([static_site(10), static_site(11)])
+
+    response = client.post('/userlist_batch_update', json={"rows": [
+        {"id": 10, "domain_name": "new.example.com"},
+        {"id": 11, "UPDATE_FLG": "operate"},
+        {"id": 99, "domain_name": "example.org"},
+    ]})
+
+    assert response.status_code == 200
+    assert response.get_json()["not_found"] == [99]
+    assert repository.get_user(10, ['domain_name'])['domain_name'] == 'new.example.com'
+    assert repository.get_user(11, ['UPDATE_FLG'])['UPDATE_FLG'] == 'operate'
@@ -0,0 +1,130 @@
+import re
+
+import pytest
+
+from utils.bigquery_repository import BigQueryUserRepository
+from utils.repository import DELETED_FLG
+
+from conftest import make_user
+
+
+# ==========================================
+# 変更履歴 (SQLite)
+# ==========================================
+def test_change_log_records_only_changed_fields_in_order(repository):
+    repository.insert_users([make_user(1)])
+
+    repository.update_user(1, {'name': '変更1', 'memo': 'メモ'})
+    repository.update_user(1, {'name': '変更2'})
+
+    changes = repository.list_changes(1)
+    assert [change['changed_fields'] for change in changes] == ['name,memo', 'name']
+    assert [(change['name'], change.get('memo')) for change in changes] == [('変更1', 'メモ'), ('変更2', None)]
+    assert changes[0]['changed_at'] <= changes[1]['changed_at']
+
+
+def test_latest_state_keeps_unchanged_columns(repository):
+    repository.insert_users([make_user(1, memo='初期値')])
+
+    repository.update_user(1, {'name': '変更1'})
+    repository.update_user(1, {'UPDATE_FLG': 'operate'})
+
+    user = repository.get_user(1)
+    assert (user['name'], user['memo'], user['UPDATE_FLG']) == ('変更1', '初期値', 'operate')
+
+
+def test_update_users_returns_merged_rows_for_existing_ids(repository):
+    repository.insert_users([make_user(1), make_user(2)])
+
+    rows = repository.update_users({2: {'memo': '承認'}, 1: {'name': '変更'}, 9: {'name': '存在しない'}},
+                                   ['id', 'name', 'memo'])
+
+    assert rows == [{'id': 1, 'name': '変更', 'memo': ''}, {'id': 2, 'name': '利用者2', 'memo': '承認'}]
+
+
+def test_mark_deleted_is_recorded_as_change(repository):
+    repository.insert_users([make_user(1)])
+
+    repository.mark_deleted(1)
+
+    assert repository.get_user(1)['UPDATE_FLG'] == DELETED_FLG
+    assert [change['UPDATE_FLG'] for change in repository.list_changes(1)] == [DELETED_FLG]
+
+
+def test_update_rejects_unknown_columns(repository):
+    repository.insert_users([make_user(1)])
+
+    with pytest.raises(ValueError):
+        repository.update_user(1, {'name; DROP TABLE users': 'x'})
+
+
+# ==========================================
+# 変更履歴の反映 (BigQuery のスクリプト)
+# ==========================================
+@pytest.fixture
+def bigquery_scripts(monkeypatch):
+    """BigQueryへ送るスクリプトを記録する (MERGEの反映件数として 3 を返す)"""
+    repo = BigQueryUserRepository()
+    repo.planner = None
+    scripts = []
+
+    def query(script, params=None, op="query", **kwargs):
+        scripts.append((op, script))
+        return [[3]] if op == "compact_changes" else []
+
+    monkeypatch.setattr(repo, "_query", query)
+    return repo, scripts
+
+
+def statements(script):
+    return [s.strip() for s in script.split(";") if s.strip()]
+
+
+def test_compaction_merges_and_marks_in_one_transaction(bigquery_scripts):
+    repo, scripts = bigquery_scripts
+
+    assert repo.compact_changes() == 3
+
+    assert [op for op, _ in scripts] == ["ensure_change_log", "compact_changes"]
+    body = statements(scripts[1][1])
+    begin, commit = body.index("BEGIN TRANSACTION"), body.index("COMMIT TRANSACTION")
+    merge = next(i for i, s in enumerate(body) if s.startswith("MERGE"))
+    mark = next(i for i, s in enumerate(body) if s.startswith(f"UPDATE {repo.change_table} SET compacted_at"))
+    assert begin < merge < mark < commit
+    assert f"FROM {repo.current_view}" in body[merge]
+    assert body[mark].endswith("WHERE compacted_at IS NULL")
+
+
+def test_compaction_replaces_view_with_current_columns(bigquery_scripts):
+    repo, scripts = bigquery_scripts
+
+    repo.compact_changes()
+
+    ddl = scripts[0][1]
+    assert f"CREATE OR REPLACE VIEW {repo.current_view}" in ddl
+    assert re.search(r"FROM \S+ AS u\s+LEFT JOIN pending AS p ON p.id = u.id", ddl)
+
+
+def test_view_takes_latest_change_per_column(bigquery_scripts):
+    repo, _ = bigquery_scripts
+
+    ddl = repo._change_log_ddl()
+
+    # 未反映の変更履歴のみを対象とし、カラムごとにそのカラムを変更した最新の値を採用する
+    assert "WHERE compacted_at IS NULL" in ddl
+    assert ("ARRAY_AGG(IF('memo' IN UNNEST(SPLIT(changed_fields)), STRUCT(memo AS v), NULL) IGNORE NULLS "
+            "ORDER BY changed_at DESC LIMIT 1)[SAFE_OFFSET(0)] AS memo") in ddl
+    # 変更が無いカラムは申請者テーブルの値、NULLへの変更はNULLとして反映する
+    assert "IF(p.memo IS NULL, u.memo, p.memo.v) AS memo" in ddl
+
+
+def test_updates_append_changed_fields_instead_of_updating(bigquery_scripts):
+    repo, scripts = bigquery_scripts
+
+    repo.update_users({1: {'name': '変更'}, 2: {}}, ['id', 'name'])
+
+    op, script = scripts[0]
+    assert op == "update_users"
+    assert script.strip().startswith(f"INSERT INTO {repo.change_table}")
+    assert f"UPDATE {repo.users_table}" not in script
+    assert f"FROM {repo.current_view} WHERE id IN UNNEST(@ids)" in script
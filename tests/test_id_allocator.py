@@ -0,0 +1,79 @@
+import threading
+
+from utils.id_allocator import IdAllocator
+from utils.local_repository import SQLiteUserRepository
+
+from conftest import make_user
+
+
+# ==========================================
+# 採番テーブルの予約 (reserve_ids)
+# ==========================================
+def test_reserve_ids_starts_after_existing_max_id(repository):
+    repository.insert_users([make_user(5), make_user(12)])
+
+    assert repository.reserve_ids(10) == 13
+    assert repository.reserve_ids(3) == 23
+
+
+def test_reserve_ids_on_empty_table_starts_at_one(repository):
+    assert repository.reserve_ids(1) == 1
+    assert repository.reserve_ids(1) == 2
+
+
+def test_reservations_from_separate_connections_do_not_overlap(tmp_path):
+    # 同じDBファイルを共有する2つのインスタンス (Cloud Runの複数インスタンスに相当)
+    path = str(tmp_path / "users.sqlite3")
+    first, second = SQLiteUserRepository(path), SQLiteUserRepository(path)
+
+    blocks = [first.reserve_ids(20), second.reserve_ids(20), first.reserve_ids(20)]
+
+    ids = [i for start in blocks for i in range(start, start + 20)]
+    assert len(set(ids)) == len(ids)
+
+
+# ==========================================
+# プロセス内の払い出し (IdAllocator)
+# ==========================================
+def test_allocate_reserves_one_block_per_block_size():
+    calls = []
+
+    def reserve(count):
+        calls.append(count)
+        return 100 * len(calls)
+
+    allocator = IdAllocator(reserve, block_size=3)
+
+    assert [allocator.allocate() for _ in range(5)] == [100, 101, 102, 200, 201]
+    assert calls == [3, 3]
+
+
+def test_allocate_block_does_not_consume_current_block(repository):
+    allocator = IdAllocator(repository.reserve_ids, block_size=5)
+    first = allocator.allocate()
+
+    block = allocator.allocate_block(3)
+
+    assert list(block) == [first + 5, first + 6, first + 7]
+    assert allocator.allocate() == first + 1
+    assert len(allocator.allocate_block(0)) == 0
+
+
+def test_concurrent_allocation_returns_unique_ids(repository):
+    allocator = IdAllocator(repository.reserve_ids, block_size=7)
+    allocated = []
+    lock = threading.Lock()
+
+    def worker():
+        ids = [allocator.allocate() for _ in range(50)]
+        with lock:
+            allocated.extend(ids)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(allocated) == 400
+    assert len(set(allocated)) == 400
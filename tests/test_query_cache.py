@@ -0,0 +1,49 @@
+from utils.query_cache import ID_VERSION_SLOTS, CachedUserRepository, QueryCache
+
+from conftest import make_user
+
+
+class CountingRepository:
+    """get_user の呼び出し回数を数える (それ以外はSQLiteへ委譲)"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.reads = 0
+
+    def get_user(self, user_id, columns=None):
+        self.reads += 1
+        return self.inner.get_user(user_id, columns)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+def build(repository):
+    counting = CountingRepository(repository)
+    return counting, CachedUserRepository(counting, QueryCache(ttl=60))
+
+
+def test_update_invalidates_only_the_updated_id(repository):
+    repository.insert_users([make_user(1), make_user(2)])
+    counting, cached = build(repository)
+    cached.get_user(1)
+    cached.get_user(2)
+
+    cached.update_user(1, {'name': '変更後'})
+
+    assert cached.get_user(1)['name'] == '変更後'
+    assert cached.get_user(2)['name'] == '利用者2'
+    assert counting.reads == 3
+
+
+def test_id_versions_stay_bounded(repository):
+    repository.insert_users([make_user(1)])
+    counting, cached = build(repository)
+
+    for user_id in range(1, ID_VERSION_SLOTS * 3):
+        cached.invalidate([user_id])
+
+    assert len(cached._id_versions) == ID_VERSION_SLOTS
+    cached.get_user(1)
+    assert cached.get_user(1)['id'] == 1
+    assert counting.reads == 1
@@ -0,0 +1,105 @@
+import datetime
+
+import pytest
+
+from utils import util
+from utils.search_index import UserSearchIndex
+
+from conftest import make_user
+
+
+def names(rows):
+    return [row['name'] for row in rows]
+
+
+# ==========================================
+# 検索用インデックス (UserSearchIndex)
+# ==========================================
+def test_search_by_name_and_date_returns_ids_descending():
+    index = UserSearchIndex()
+    index.apply([
+        make_user(1, name='山田太郎'),
+        make_user(2, name='山田花子', desired_delivery_date=datetime.date(2024, 5, 1)),
+        make_user(3, name='佐藤一郎'),
+    ])
+
+    total, rows = index.search(name='山田')
+    assert (total, names(rows)) == (2, ['山田花子', '山田太郎'])
+    assert names(index.search(name='山田', s_date='2024-04-01')[1]) == ['山田太郎']
+    assert names(index.search(name='田太郎')[1]) == ['山田太郎']
+    assert names(index.search(name='田郎')[1]) == []
+    total, rows = index.search(offset=1, limit=1)
+    assert (total, names(rows)) == (3, ['山田花子'])
+
+
+def test_update_replaces_indexed_values():
+    index = UserSearchIndex()
+    index.apply([make_user(1, name='山田太郎')])
+    assert names(index.search(name='山田')[1]) == ['山田太郎']
+
+    assert index.update([{'id': 1, 'name': '鈴木太郎', 'desired_delivery_date': '2024-06-01'}]) == 1
+
+    assert index.search(name='山田') == (0, [])
+    assert names(index.search(name='鈴木', s_date='2024-06-01')[1]) == ['鈴木太郎']
+    assert index.date_counts() == [(datetime.date(2024, 6, 1), 1)]
+
+
+def test_update_of_unknown_id_does_not_add_phantom_row():
+    index = UserSearchIndex()
+    index.apply([make_user(1)])
+
+    assert index.update([{'id': 99, 'name': '未登録'}]) == 0
+
+    assert len(index) == 1
+    assert index.search(name='未登録') == (0, [])
+
+
+def test_date_counts_follow_changes():
+    index = UserSearchIndex()
+    index.apply([make_user(1), make_user(2), make_user(3, desired_delivery_date=datetime.date(2024, 5, 1))])
+    assert index.date_counts() == [(datetime.date(2024, 4, 1), 2), (datetime.date(2024, 5, 1), 1)]
+
+    index.update([{'id': 3, 'desired_delivery_date': datetime.date(2024, 4, 1)}])
+
+    assert index.date_counts() == [(datetime.date(2024, 4, 1), 3)]
+
+
+# ==========================================
+# 差分の取り込み (list_users_changed_since)
+# ==========================================
+def test_changed_since_includes_new_rows_with_lower_ids_and_edited_rows(repository):
+    today = datetime.date.today()
+    repository.insert_users([make_user(50), make_user(60)])
+    since = datetime.datetime.now(datetime.timezone.utc)
+
+    # 他インスタンスが払い出した小さいidの新規行と、既存行の変更
+    repository.insert_users([make_user(7, insert_date=today)])
+    repository.update_user(50, {'name': '変更後'})
+
+    rows = repository.list_users_changed_since(since)
+
+    assert [(row['id'], row['name']) for row in rows] == [(7, '利用者7'), (50, '変更後')]
+
+
+@pytest.fixture
+def synced_index(repository, monkeypatch):
+    """utils.util の検索インデックスの読み込みをテスト用のSQLiteで行う"""
+    util.clients.override("repository", repository)
+    monkeypatch.setattr(util, "user_search_index", UserSearchIndex())
+    monkeypatch.setattr(util, "_user_index_reloaded_at", None)
+    monkeypatch.setattr(util, "search_index_reload_interval", 3600)
+    yield util.user_search_index
+    util.clients.reset("repository")
+
+
+def test_incremental_sync_picks_up_changes_without_full_reload(repository, synced_index):
+    repository.insert_users([make_user(50), make_user(60)])
+    util._load_user_search_index()
+    assert len(synced_index) == 2
+
+    repository.insert_users([make_user(7, insert_date=datetime.date.today())])
+    repository.update_user(60, {'name': '変更後'})
+    util._load_user_search_index()
+
+    assert [row['id'] for row in synced_index.search()[1]] == [60, 50, 7]
+    assert names(synced_index.search(name='変更後')[1]) == ['変更後']
@@ -0,0 +1,111 @@
+import pytest
+
+from utils.validation import ADMIN_FORM, PROJECT_FORM, USER_FORM
+
+
+def user_form(**overrides):
+    form = {
+        'username': '山田太郎', 'email': 'yamada@example.com', 'tel_number': '03-0000-0000',
+        'regist_date': '2024-04-01', 'belonging_department': '情報システム部', 'company_id': '1:株式会社A',
+    }
+    form.update(overrides)
+    return form
+
+
+def admin_form(**overrides):
+    form = {
+        'manage_company_name': 'acme', 'organization_name': 'org', 'project_name_gcp': 'pj',
+        'group_name': 'admin-group', 'user_group_name': 'user-group',
+        'group_email': 'admin@example.com', 'user_group_email': 'user@example.com',
+        'env': 'dev', 'use_purpose': 'standard', 'subnet_info': '10.0.0.0/24',
+    }
+    form.update(overrides)
+    return form
+
+
+# ==========================================
+# 一般ユーザー登録
+# ==========================================
+def test_valid_user_form_has_no_errors():
+    assert USER_FORM.validate(user_form()) == []
+
+
+def test_user_form_errors_keep_field_order():
+    errors = USER_FORM.validate(user_form(username='', regist_date='', company_id=''))
+
+    assert errors == ['氏名が正しく入力されていません。', '引き渡し希望日が正しく入力されていません。',
+                      '社名が正しく入力されていません。']
+
+
+@pytest.mark.parametrize('value', ['2024/04/01', '2024-13-01', 'あした'])
+def test_user_form_rejects_unparseable_date(value):
+    assert USER_FORM.validate(user_form(regist_date=value)) == ['引き渡し希望日が正しく入力されていません。']
+
+
+@pytest.mark.parametrize('value', ['株式会社A', 'x:株式会社A'])
+def test_user_form_requires_numeric_company_id(value):
+    assert USER_FORM.validate(user_form(company_id=value)) == ['社名が正しく入力されていません。']
+
+
+def test_user_form_checks_length_limit():
+    assert USER_FORM.validate(user_form(username='あ' * 101)) == ['氏名が正しく入力されていません。']
+
+
+def test_project_form_requires_all_fields():
+    assert len(PROJECT_FORM.validate({})) == 3
+
+
+# ==========================================
+# 管理者用 (CIDR / 条件付きチェック)
+# ==========================================
+def test_valid_admin_form_has_no_errors():
+    assert ADMIN_FORM.validate(admin_form()) == []
+
+
+@pytest.mark.parametrize('value', ['10.0.0.0/255.0.0.0', '10.0.0.0', '10.0.0.0/31', '300.0.0.0/24', '10.0.0.0/33'])
+def test_subnet_rejects_invalid_cidr(value):
+    assert ADMIN_FORM.validate(admin_form(subnet_info=value)) == ['利用IP範囲は半角数字及び.(ドット)/(スラッシュ)のみです。']
+
+
+def test_subnet_is_not_checked_for_static_sites():
+    form = admin_form(use_purpose='static', subnet_info='', domain_name='example.com')
+
+    assert ADMIN_FORM.validate(form) == []
+
+
+def test_client_cidr_accepts_comma_separated_list_with_spaces():
+    assert ADMIN_FORM.validate(admin_form(use_purpose='api', client_cidr='10.0.0.0/24, 192.168.1.0/28')) == []
+    assert ADMIN_FORM.validate(admin_form(use_purpose='api', client_cidr='10.0.0.0/24,10.1.0.0/255.255.0.0')) == [
+        'アクセス元IP制限は半角数字及び.(ドット)/(スラッシュ),(カンマ)のみです。']
+
+
+def test_connector_cidr_requires_prefix_28_unless_unset():
+    secure = admin_form(use_purpose='secure')
+
+    assert ADMIN_FORM.validate({**secure, 'connector_cidr': '10.8.0.0/28'}) == []
+    assert ADMIN_FORM.validate({**secure, 'connector_cidr': 'None'}) == []
+    assert ADMIN_FORM.validate({**secure, 'connector_cidr': '10.8.0.0/24'}) == [
+        'VPCコネクター利用IP範囲が適切な形式になっていません。(空欄又は*.*.*.*/28など)。']
+
+
+def test_partial_validation_checks_only_given_fields():
+    assert ADMIN_FORM.validate({'manage_company_name': 'acme'}, partial=True) == []
+    assert ADMIN_FORM.validate({'manage_company_name': 'ACME'}, partial=True) == [
+        '会社名は半角英数文字(英小文字)のみです。']
+
+
+def test_invalid_rows_reports_only_rows_with_errors():
+    rows = [user_form(), user_form(email='not-an-email'), user_form()]
+
+    assert USER_FORM.invalid_rows(rows) == {1: ['メールアドレスが正しく入力されていません。']}
+
+
+def test_changes_are_checked_against_stored_row():
+    stored = admin_form(use_purpose='static', subnet_info=None, domain_name='example.com')
+
+    assert ADMIN_FORM.validate_changes(stored, {'domain_name': '!!! not a domain'}) == ['無効なドメイン名です。']
+    assert ADMIN_FORM.validate_changes(stored, {'subnet_info': 'not checked for static'}) == []
+    # 条件の項目を変更した場合は、変更していない項目も変更後の条件でチェックする
+    assert ADMIN_FORM.validate_changes(stored, {'use_purpose': 'standard'}) == [
+        '利用IP範囲は半角数字及び.(ドット)/(スラッシュ)のみです。']
+    assert ADMIN_FORM.validate_changes(stored, {'use_purpose': 'standard', 'subnet_info': '10.0.0.0/24'}) == []
@@ -0,0 +1,162 @@
+import json
+
+import pytest
+
+from utils.write_pipeline import WritePipeline, WriteQueueFull, is_transient
+
+from conftest import make_user
+
+
+class FlakySink:
+    """リポジトリへの書き込みの前に、指定した回数だけ一時的な障害を起こす sink"""
+
+    def __init__(self, repository, failures: int = 0, bad_names=()):
+        self.repository = repository
+        self.failures = failures
+        self.bad_names = set(bad_names)
+        self.calls = 0
+
+    def __call__(self, rows):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        if any(row['name'] in self.bad_names for row in rows):
+            raise ValueError("invalid value")
+        self.repository.insert_users(rows)
+
+
+def build_pipeline(sink, tmp_path, **kwargs):
+    options = dict(spool_path=str(tmp_path / "spool.jsonl"), dead_letter_path=str(tmp_path / "dead.jsonl"),
+                   batch_size=10, flush_interval=0.01, max_retries=3, retry_backoff=0.001)
+    options.update(kwargs)
+    return WritePipeline(sink, **options)
+
+
+def read_lines(path):
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line]
+
+
+def stored_ids(repository):
+    return sorted(row['id'] for row in repository.list_users())
+
+
+def test_is_transient_classifies_errors():
+    class ApiError(Exception):
+        def __init__(self, code=None, reason=None):
+            self.code = code
+            self.errors = [{"reason": reason}] if reason else []
+
+    assert is_transient(ConnectionError())
+    assert is_transient(ApiError(code=503))
+    assert is_transient(ApiError(code=403, reason="rateLimitExceeded"))
+    assert not is_transient(ApiError(code=400, reason="invalid"))
+    assert not is_transient(ValueError())
+
+
+def test_transient_failures_are_retried_and_spool_is_emptied(repository, tmp_path):
+    sink = FlakySink(repository, failures=2)
+    pipeline = build_pipeline(sink, tmp_path)
+    pipeline.start()
+    for i in range(1, 4):
+        pipeline.submit(make_user(i))
+
+    assert pipeline.flush(timeout=5)
+    pipeline.shutdown()
+
+    assert stored_ids(repository) == [1, 2, 3]
+    assert sink.calls >= 3
+    assert read_lines(tmp_path / "spool.jsonl") == []
+
+
+def test_batch_resent_after_committed_write_is_not_duplicated(repository, tmp_path):
+    timeouts = [TimeoutError("response timed out")]
+
+    def sink(rows):
+        # 書き込みは完了したが、応答待ちで失敗した場合 (パイプラインはバッチ全体を再送する)
+        repository.insert_users(rows)
+        if timeouts:
+            raise timeouts.pop()
+
+    pipeline = build_pipeline(sink, tmp_path)
+    pipeline.start()
+    pipeline.submit(make_user(1001))
+
+    assert pipeline.flush(timeout=5)
+    pipeline.shutdown()
+
+    assert stored_ids(repository) == [1001]
+    assert repository.count_users() == 1
+
+
+def test_permanent_failure_dead_letters_only_the_bad_row(repository, tmp_path):
+    pipeline = build_pipeline(FlakySink(repository, bad_names={'不正な行'}), tmp_path, flush_interval=0.2)
+    pipeline.start()
+    for i in range(1, 6):
+        pipeline.submit(make_user(i, name='不正な行' if i == 3 else f"利用者{i}"))
+
+    assert pipeline.flush(timeout=5)
+    pipeline.shutdown()
+
+    assert stored_ids(repository) == [1, 2, 4, 5]
+    assert pipeline.dead_lettered == 1
+    dead = read_lines(tmp_path / "dead.jsonl")
+    assert [record['row']['id'] for record in dead] == [3]
+    assert dead[0]['error'].startswith("ValueError")
+    assert read_lines(tmp_path / "spool.jsonl") == []
+
+
+def test_rows_failing_past_max_requeues_are_dead_lettered(repository, tmp_path):
+    pipeline = build_pipeline(FlakySink(repository, failures=1000), tmp_path, max_retries=1, max_requeues=2)
+    pipeline.start()
+    pipeline.submit(make_user(1))
+
+    assert pipeline.flush(timeout=5)
+    pipeline.shutdown()
+
+    assert stored_ids(repository) == []
+    assert [record['row']['id'] for record in read_lines(tmp_path / "dead.jsonl")] == [1]
+
+
+def test_unwritten_rows_are_recovered_from_spool_on_restart(repository, tmp_path):
+    failing = build_pipeline(FlakySink(repository, failures=1000), tmp_path, max_retries=1, max_requeues=1000)
+    failing.start()
+    failing.submit(make_user(1))
+    failing.submit(make_user(2))
+    failing.shutdown(timeout=0.2)
+    assert stored_ids(repository) == []
+
+    restarted = build_pipeline(FlakySink(repository), tmp_path)
+    restarted.start()
+
+    assert restarted.flush(timeout=5)
+    restarted.shutdown()
+    assert stored_ids(repository) == [1, 2]
+    assert read_lines(tmp_path / "spool.jsonl") == []
+
+
+def test_spool_only_rows_are_reloaded_when_queue_drains(repository, tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    spool.write_text("".join(
+        json.dumps({"op": "row", "row": make_user(i)}, default=str) + "\n" for i in range(1, 6)
+    ), encoding="utf-8")
+    pipeline = build_pipeline(FlakySink(repository), tmp_path, max_queue=2, batch_size=2)
+
+    pipeline.start()
+    assert pipeline.spool_only == 3
+
+    assert pipeline.flush(timeout=5)
+    pipeline.shutdown()
+    assert stored_ids(repository) == [1, 2, 3, 4, 5]
+    assert pipeline.spool_only == 0
+    assert read_lines(spool) == []
+
+
+def test_submit_rejects_when_queue_is_full(repository, tmp_path):
+    pipeline = build_pipeline(FlakySink(repository), tmp_path, max_queue=1)
+    pipeline.submit(make_user(1))
+
+    with pytest.raises(WriteQueueFull):
+        pipeline.submit(make_user(2))
@@ -0,0 +1,475 @@
+import time
+import datetime
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+import requests.exceptions
+from google.cloud import bigquery
+from google.api_core.exceptions import BadGateway, InternalServerError, NotFound, TooManyRequests
+from google.auth.exceptions import TransportError
+
+from utils.repository import (
+    CHANGE_META_COLUMNS, USER_COLUMN_TYPES, USER_DETAIL_COLUMNS, USER_LIST_COLUMNS, UserRepository,
+    check_columns, check_update_columns, to_date,
+)
+from utils.metrics import track_call
+from utils.query_planner import QueryPlanner, parse_budgets, parse_bytes
+from utils.schema import CHANGES_CLUSTERING_FIELDS
+from utils.transport import DeadlineExceeded
+from utils.util import (
+    bigquery_client, bigquery_transport, logger, project, dataset, table, company_list_table, id_sequence_table,
+    user_change_table, user_current_view,
+    query_planner_enabled, query_bytes_budget, query_route_budgets, query_budget_enforce,
+)
+
+# 採番テーブルの更新が他インスタンスのトランザクションと競合した場合の再試行回数
+RESERVE_RETRIES = 5
+
+# 変更履歴で値を持つカラム (id は変更できない)
+CHANGE_COLUMNS = [c for c in USER_COLUMN_TYPES if c != 'id']
+
+# 再試行する一時的なエラー (google.cloud.bigquery の DEFAULT_RETRY / DEFAULT_JOB_RETRY と同じ条件)
+# API呼び出しはエラーの reason、reason の無いエラー(ロードバランサからの応答・通信断)は例外の型で判定する
+RETRYABLE_REASONS = frozenset({"rateLimitExceeded", "backendError", "internalError", "badGateway"})
+RETRYABLE_TYPES = (
+    ConnectionError, TooManyRequests, InternalServerError, BadGateway, TransportError,
+    requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+)
+# ジョブ自体の再実行は、レート制限超過・BigQuery内部の一時的なエラーで失敗した場合のみ
+JOB_RETRYABLE_REASONS = frozenset({"rateLimitExceeded", "backendError"})
+
+
+def _error_reason(exc: Exception) -> Optional[str]:
+    errors = getattr(exc, "errors", None)
+    if not errors or not isinstance(errors[0], dict):
+        return None
+    return errors[0].get("reason")
+
+
+def should_retry(exc: Exception) -> bool:
+    """API呼び出しを再試行するエラーか"""
+    reason = _error_reason(exc)
+    if reason is None:
+        return isinstance(exc, RETRYABLE_TYPES)
+    return reason in RETRYABLE_REASONS
+
+
+def should_retry_job(exc: Exception) -> bool:
+    """失敗したクエリジョブを再実行するエラーか"""
+    return _error_reason(exc) in JOB_RETRYABLE_REASONS
+
+
+class BigQueryUserRepository(UserRepository):
+    """BigQuery上の申請者テーブル/会社テーブルへのアクセス (本番用)"""
+
+    def __init__(self):
+        self.users_table = f"`{project}.{dataset}.{table}`"
+        self.company_table = f"`{project}.{dataset}.{company_list_table}`"
+        self.sequence_table = f"`{project}.{dataset}.{id_sequence_table}`"
+        self._sequence_ready = False
+        self._sequence_lock = threading.Lock()
+        # 更新は変更履歴テーブルへの追記で行い、読み取りは未反映の変更履歴を重ねたビューから行う
+        self.change_table = f"`{project}.{dataset}.{user_change_table}`"
+        self.current_view = f"`{project}.{dataset}.{user_current_view}`"
+        self._change_log_ready = False
+        self._change_log_lock = threading.Lock()
+        # 読み取りクエリは実行前に処理量を見積もり、画面ごとの上限と比較する
+        self.planner = QueryPlanner(
+            self._dry_run, parse_bytes(query_bytes_budget), parse_budgets(query_route_budgets),
+            enforce=query_budget_enforce,
+        ) if query_planner_enabled else None
+
+    # ------------------------------------------
+    # 内部ヘルパー
+    # ------------------------------------------
+    @staticmethod
+    def _param(name: str, column: str, value: Any) -> bigquery.ScalarQueryParameter:
+        type_ = USER_COLUMN_TYPES.get(column, 'STRING')
+        if type_ == 'DATE':
+            value = to_date(value)
+        return bigquery.ScalarQueryParameter(name, type_, value)
+
+    @staticmethod
+    def _dry_run(query: str, job_config: bigquery.QueryJobConfig) -> bigquery.QueryJob:
+        """処理量の見積もり (ドライランは課金されず、完了を待つ必要もない)"""
+        config = bigquery.QueryJobConfig(
+            dry_run=True, use_query_cache=False, query_parameters=job_config.query_parameters,
+        )
+        with bigquery_transport.call("dry_run") as timeout, track_call("bigquery", "dry_run"):
+            return bigquery_client.query(query, job_config=config, timeout=timeout,
+                                         retry=bigquery_transport.retry(should_retry, timeout))
+
+    def _query(self, query: str, params: Optional[List[Any]] = None, op: str = "query",
+               page_size: Optional[int] = None):
+        """
+        クエリを実行して完了を待ち、結果の行を返す (所要時間とジョブの統計を op 名で記録)
+        読み取りクエリは処理量の上限を確認してから実行する (超過時の拒否は QueryBudgetExceeded)
+        page_size 指定時は、結果を反復する際に page_size 件ずつ取得する
+        ジョブの投入・完了待ち・再試行はリクエストの期限まで (超過時はジョブを取り消して DeadlineExceeded)
+        """
+        job_config = bigquery.QueryJobConfig(query_parameters=params or [])
+        if self.planner is not None:
+            self.planner.prepare(query, job_config, op)
+        with bigquery_transport.call(op) as timeout, track_call("bigquery", op) as stats:
+            retry = bigquery_transport.retry(should_retry, timeout)
+            # ジョブ自体の再実行 (レート制限超過時など) も同じ予算・期限の範囲内とする
+            job_retry = bigquery_transport.retry(should_retry_job, timeout)
+            job = bigquery_client.query(query, job_config=job_config, retry=retry, timeout=timeout,
+                                        job_retry=job_retry)
+            try:
+                return job.result(page_size=page_size, retry=retry, timeout=bigquery_transport.timeout())
+            except (FutureTimeout, DeadlineExceeded):
+                self._cancel(job)
+                raise
+            finally:
+                stats.from_job(job)
+
+    @staticmethod
+    def _cancel(job: bigquery.QueryJob) -> None:
+        """期限までに完了しなかったジョブを取り消す (結果を使わないため、取り消しの失敗は無視)"""
+        try:
+            job.cancel(retry=None, timeout=5)
+        except Exception as e:
+            logger.warning(f"ジョブの取り消しに失敗しました ({job.job_id}): {e}")
+
+    @staticmethod
+    def _filter(name: Optional[str], s_date: Optional[str]) -> Tuple[List[str], List[Any]]:
+        """一覧/検索共通の検索条件とパラメータ"""
+        conditions = []
+        params = []
+        if name:
+            conditions.append("name LIKE @user_name")
+            params.append(bigquery.ScalarQueryParameter("user_name", "STRING", f"%{name}%"))
+        if s_date:
+            conditions.append("desired_delivery_date = @date")
+            params.append(bigquery.ScalarQueryParameter("date", "DATE", to_date(s_date)))
+        return conditions, params
+
+    # ------------------------------------------
+    # 変更履歴
+    # ------------------------------------------
+    # UPDATEはストレージブロックを書き換え、同一テーブルへの同時実行数にも制限があるため、
+    # 管理者の編集・承認・論理削除は変更したカラムの値だけを変更履歴テーブルへ追記する (INSERTのみ)。
+    # 読み取りは最新の状態のビュー (申請者テーブルの行に、未反映の変更履歴をカラムごとに最新の値で重ねたもの) から行う。
+    # 変更履歴は compact_changes() (python -m utils.change_log compact) で申請者テーブルへまとめて反映し、
+    # 反映済みの印(compacted_at)を付けてビューの集計対象から外す。変更履歴の行は削除せず履歴として残す。
+
+    def _change_log_ddl(self, replace_view: bool = False) -> str:
+        """変更履歴テーブルと最新の状態のビューの作成スクリプト"""
+        columns = ", ".join(f"{c} {USER_COLUMN_TYPES[c]}" for c in CHANGE_COLUMNS)
+        # カラムごとに、そのカラムを変更した最新の変更履歴の値 (変更していなければNULLのSTRUCT)
+        latest = ",\n".join(
+            f"ARRAY_AGG(IF('{c}' IN UNNEST(SPLIT(changed_fields)), STRUCT({c} AS v), NULL) IGNORE NULLS "
+            f"ORDER BY changed_at DESC LIMIT 1)[SAFE_OFFSET(0)] AS {c}"
+            for c in CHANGE_COLUMNS
+        )
+        resolved = ", ".join(f"IF(p.{c} IS NULL, u.{c}, p.{c}.v) AS {c}" for c in CHANGE_COLUMNS)
+        create_view = "CREATE OR REPLACE VIEW" if replace_view else "CREATE VIEW IF NOT EXISTS"
+        return f"""
+            CREATE TABLE IF NOT EXISTS {self.change_table}
+            (id INT64 NOT NULL, changed_fields STRING NOT NULL, changed_at TIMESTAMP NOT NULL,
+             compacted_at TIMESTAMP, {columns})
+            CLUSTER BY {', '.join(CHANGES_CLUSTERING_FIELDS)};
+            {create_view} {self.current_view} AS
+            WITH pending AS (
+                SELECT id,
+                {latest}
+                FROM {self.change_table}
+                WHERE compacted_at IS NULL
+                GROUP BY id
+            )
+            SELECT u.id, {resolved}
+            FROM {self.users_table} AS u
+            LEFT JOIN pending AS p ON p.id = u.id;
+        """
+
+    def _ensure_change_log(self) -> None:
+        """変更履歴テーブルとビューを作成 (プロセスごとに1回のみ)"""
+        if self._change_log_ready:
+            return
+        with self._change_log_lock:
+            if self._change_log_ready:
+                return
+            self._query(self._change_log_ddl(), op="ensure_change_log")
+            self._change_log_ready = True
+
+    def _query_current(self, query: str, params: Optional[List[Any]] = None, op: str = "query", **kwargs):
+        """
+        変更履歴テーブル/最新の状態のビューを参照するクエリを実行
+        作成済みか確認するジョブを毎回挟まないよう、見つからない場合にのみ作成して再実行する
+        """
+        try:
+            return self._query(query, params, op=op, **kwargs)
+        except NotFound:
+            if self._change_log_ready:
+                raise
+            self._ensure_change_log()
+            return self._query(query, params, op=op, **kwargs)
+
+    def _append_changes(self, changes: Dict[int, Dict[str, Any]], select_columns: Optional[List[str]], op: str):
+        """変更内容を変更履歴へ追記 (select_columns 指定時は同じスクリプト(1ジョブ)内で変更後の行を取得)"""
+        columns = check_update_columns(changes)
+        changes = {user_id: fields for user_id, fields in changes.items() if fields}
+        # 行ごとに変更するカラムが異なるため、変更したカラム名をカンマ区切りで記録し、対象外の値はNULLとする
+        structs = [
+            bigquery.StructQueryParameter(
+                None,
+                bigquery.ScalarQueryParameter("id", "INTEGER", user_id),
+                bigquery.ScalarQueryParameter("_fields", "STRING", ",".join(fields)),
+                *[self._param(c, c, fields.get(c)) for c in columns],
+            )
+            for user_id, fields in changes.items()
+        ]
+        script = f"""
+            INSERT INTO {self.change_table} (id, changed_fields, changed_at, {', '.join(columns)})
+            SELECT id, _fields, CURRENT_TIMESTAMP(), {', '.join(columns)} FROM UNNEST(@changes);
+        """
+        params = [bigquery.ArrayQueryParameter("changes", "STRUCT", structs)]
+        if select_columns:
+            script += f"    SELECT {', '.join(select_columns)} FROM {self.current_view} WHERE id IN UNNEST(@ids) ORDER BY id;\n"
+            params.append(bigquery.ArrayQueryParameter("ids", "INTEGER", list(changes)))
+        return self._query_current(script, params, op=op)
+
+    def list_changes(self, user_id: int) -> List[Dict[str, Any]]:
+        query = f"""
+            SELECT id, {', '.join(CHANGE_META_COLUMNS + CHANGE_COLUMNS)} FROM {self.change_table}
+            WHERE id = @id
+            ORDER BY changed_at
+        """
+        params = [bigquery.ScalarQueryParameter("id", "INTEGER", user_id)]
+        changes = []
+        for row in self._query_current(query, params, op="list_changes"):
+            fields = row.changed_fields.split(",")
+            change = {c: row[c] for c in CHANGE_META_COLUMNS}
+            change.update((c, row[c]) for c in fields)
+            changes.append(change)
+        return changes
+
+    def compact_changes(self) -> int:
+        # 反映と反映済みの印付けを1トランザクションで行う (実行中に追記された変更履歴は次回に反映)
+        # 併せてビューの定義を現在のカラム構成で作り直す
+        self._query(self._change_log_ddl(replace_view=True), op="ensure_change_log")
+        self._change_log_ready = True
+        set_clauses = ", ".join(f"{c} = s.{c}" for c in CHANGE_COLUMNS)
+        script = f"""
+            DECLARE merged INT64 DEFAULT 0;
+            BEGIN TRANSACTION;
+            MERGE {self.users_table} AS t
+            USING (
+                SELECT {', '.join(USER_DETAIL_COLUMNS)} FROM {self.current_view}
+                WHERE id IN (SELECT id FROM {self.change_table} WHERE compacted_at IS NULL)
+            ) AS s
+            ON t.id = s.id
+            WHEN MATCHED THEN UPDATE SET {set_clauses};
+            SET merged = @@row_count;
+            UPDATE {self.change_table} SET compacted_at = CURRENT_TIMESTAMP() WHERE compacted_at IS NULL;
+            COMMIT TRANSACTION;
+            SELECT merged;
+        """
+        rows = list(self._query(script, op="compact_changes"))
+        return int(rows[0][0]) if rows else 0
+
+    # ------------------------------------------
+    # 申請者 (CRUD)
+    # ------------------------------------------
+    def get_max_id(self) -> int:
+        rows = list(self._query(f"SELECT MAX(id) AS max_id FROM {self.users_table}", op="get_max_id"))
+        return (rows[0].max_id or 0) if rows else 0
+
+    def _ensure_sequence_table(self) -> None:
+        """採番テーブルを作成 (プロセスごとに初回のみ実行)"""
+        with self._sequence_lock:
+            if self._sequence_ready:
+                return
+            self._query(f"""
+                CREATE TABLE IF NOT EXISTS {self.sequence_table}
+                (name STRING NOT NULL, next_id INT64 NOT NULL)
+            """, op="ensure_sequence_table")
+            self._sequence_ready = True
+
+    def reserve_ids(self, count: int) -> int:
+        self._ensure_sequence_table()
+        # 採番行の初期化・加算・予約範囲の取得を1つのトランザクション(1ジョブ)で実行する
+        # 他インスタンスと同時に更新した場合はBigQuery側で片方が中断されるため再試行する
+        script = f"""
+            DECLARE block_start INT64;
+            BEGIN TRANSACTION;
+            INSERT INTO {self.sequence_table} (name, next_id)
+                SELECT @name, start_id FROM (SELECT IFNULL(MAX(id), 0) + 1 AS start_id FROM {self.users_table})
+                WHERE NOT EXISTS (SELECT 1 FROM {self.sequence_table} WHERE name = @name);
+            UPDATE {self.sequence_table} SET next_id = next_id + @count WHERE name = @name;
+            SET block_start = (SELECT next_id - @count FROM {self.sequence_table} WHERE name = @name);
+            COMMIT TRANSACTION;
+            SELECT block_start;
+        """
+        params = [
+            bigquery.ScalarQueryParameter("name", "STRING", table),
+            bigquery.ScalarQueryParameter("count", "INTEGER", count),
+        ]
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                rows = list(self._query(script, params, op="reserve_ids"))
+                return int(rows[0][0])
+            except Exception as e:
+                if attempt >= RESERVE_RETRIES or "concurrent update" not in str(e).lower():
+                    raise
+                logger.warning(f"ID予約が他のトランザクションと競合したため再試行します ({attempt}): {e}")
+                time.sleep(0.2 * 2 ** (attempt - 1))
+
+    def insert_user(self, row: Dict[str, Any]) -> None:
+        columns = list(row)
+        query = f"""
+            INSERT INTO {self.users_table}
+            ({', '.join(columns)})
+            VALUES
+            ({', '.join('@' + c for c in columns)})
+        """
+        self._query(query, [self._param(c, c, row[c]) for c in columns], op="insert_user")
+
+    def insert_users(self, rows: List[Dict[str, Any]]) -> None:
+        # ストリーミング挿入はストリーミングバッファ上の行を最大30分程度MERGEできず、
+        # 変更履歴の反映(compact_changes)が失敗するため、1回のDML INSERTでまとめて登録する
+        # 完了後の応答待ちでの失敗・スプールからの復旧で再送された行は、登録済みのidを除いて重複させない
+        # (MERGEは同じテーブルへの他の更新と直列化されるため、同時に実行できるINSERTのまま条件で除外する)
+        if not rows:
+            return
+        columns = sorted({c for row in rows for c in row})
+        structs = [
+            bigquery.StructQueryParameter(None, *[self._param(c, c, row.get(c)) for c in columns])
+            for row in rows
+        ]
+        query = f"""
+            INSERT INTO {self.users_table}
+            ({', '.join(columns)})
+            SELECT {', '.join(columns)} FROM UNNEST(@rows) AS r
+            WHERE NOT EXISTS (SELECT 1 FROM {self.users_table} AS u WHERE u.id = r.id)
+        """
+        self._query(query, [bigquery.ArrayQueryParameter("rows", "STRUCT", structs)], op="insert_users")
+
+    def load_users(self, source: IO[bytes], chunk_size: int = 500) -> int:
+        # 一括登録は件数が多いため、DML INSERTではなくロードジョブ1回で登録する
+        # (ロードジョブはDMLのクォータを消費せず、ストリーミングバッファも経由しないため直後に更新できる)
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        with bigquery_transport.call("load_users") as timeout, track_call("bigquery", "load_users") as stats:
+            job = bigquery_client.load_table_from_file(
+                source, f"{project}.{dataset}.{table}", job_config=job_config, rewind=True, timeout=timeout,
+            )
+            try:
+                job.result(timeout=bigquery_transport.timeout())
+            finally:
+                stats.from_job(job)
+        return int(job.output_rows or 0)
+
+    def get_user(self, user_id: int, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        query = f"SELECT {', '.join(check_columns(columns))} FROM {self.current_view} WHERE id = @id"
+        params = [bigquery.ScalarQueryParameter("id", "INTEGER", user_id)]
+        rows = list(self._query_current(query, params, op="get_user"))
+        return dict(rows[0].items()) if rows else None
+
+    def get_users(self, user_ids: List[int], columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if not user_ids:
+            return []
+        query = (f"SELECT {', '.join(check_columns(columns))} FROM {self.current_view} "
+                 f"WHERE id IN UNNEST(@ids) ORDER BY id")
+        params = [bigquery.ArrayQueryParameter("ids", "INTEGER", list(user_ids))]
+        return [dict(row.items()) for row in self._query_current(query, params, op="get_users")]
+
+    def update_user(self, user_id: int, fields: Dict[str, Any]) -> None:
+        self._append_changes({user_id: fields}, None, op="update_user")
+
+    def update_users(self, changes: Dict[int, Dict[str, Any]],
+                     columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        # 複数件の変更も1回のINSERTで追記し、同じスクリプト内で変更後の行を取得する
+        if not changes:
+            return []
+        rows = self._append_changes(changes, check_columns(columns), op="update_users")
+        return [dict(row.items()) for row in rows]
+
+    # ------------------------------------------
+    # 申請者 (一覧/検索)
+    # ------------------------------------------
+    def list_users(self) -> List[Dict[str, Any]]:
+        query = f"""
+            SELECT {', '.join(USER_LIST_COLUMNS)}
+            FROM {self.current_view}
+            ORDER BY id DESC
+        """
+        return [dict(row.items()) for row in self._query_current(query, op="list_users")]
+
+    def list_users_changed_since(self, since: datetime.datetime) -> List[Dict[str, Any]]:
+        # 登録日はパーティション列のため、直近のパーティションのみを読む
+        query = f"""
+            SELECT {', '.join(USER_LIST_COLUMNS)}
+            FROM {self.current_view}
+            WHERE insert_date >= DATE_SUB(DATE(@since), INTERVAL 1 DAY)
+               OR id IN (SELECT id FROM {self.change_table} WHERE changed_at >= @since)
+            ORDER BY id
+        """
+        params = [bigquery.ScalarQueryParameter("since", "TIMESTAMP", since)]
+        return [dict(row.items()) for row in self._query_current(query, params, op="list_users_changed_since")]
+
+    def count_users(self, name: Optional[str] = None, s_date: Optional[str] = None) -> int:
+        conditions, params = self._filter(name, s_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT COUNT(*) AS total FROM {self.current_view} {where}"
+        rows = list(self._query_current(query, params, op="count_users"))
+        return int(rows[0].total) if rows else 0
+
+    def list_users_page(self, limit: int, offset: int = 0, after_id: Optional[int] = None,
+                        name: Optional[str] = None, s_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        conditions, params = self._filter(name, s_date)
+        if after_id is not None:
+            conditions.append("id < @after_id")
+            params.append(bigquery.ScalarQueryParameter("after_id", "INTEGER", after_id))
+            paging = "LIMIT @limit"
+        else:
+            paging = "LIMIT @limit OFFSET @offset"
+            params.append(bigquery.ScalarQueryParameter("offset", "INTEGER", offset))
+        params.append(bigquery.ScalarQueryParameter("limit", "INTEGER", limit))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT {', '.join(USER_LIST_COLUMNS)}
+            FROM {self.current_view}
+            {where}
+            ORDER BY id DESC
+            {paging}
+        """
+        return [dict(row.items()) for row in self._query_current(query, params, op="list_users_page")]
+
+    def count_by_delivery_date(self) -> List[Tuple[Any, int]]:
+        query = f"""
+            SELECT desired_delivery_date, COUNT(*) AS total
+            FROM {self.current_view}
+            WHERE desired_delivery_date IS NOT NULL
+            GROUP BY desired_delivery_date
+            ORDER BY desired_delivery_date
+        """
+        return [(row.desired_delivery_date, int(row.total)) for row in self._query_current(query, op="count_by_delivery_date")]
+
+    def iter_users(self, columns: Optional[List[str]] = None, name: Optional[str] = None,
+                   s_date: Optional[str] = None, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        # クエリの完了までをここで待ち、結果は反復に合わせて page_size 件ずつ取得する
+        conditions, params = self._filter(name, s_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT {', '.join(check_columns(columns))}
+            FROM {self.current_view}
+            {where}
+            ORDER BY id DESC
+        """
+        rows = self._query_current(query, params, op="iter_users", page_size=page_size)
+        return (dict(row.items()) for row in rows)
+
+    # ------------------------------------------
+    # 会社
+    # ------------------------------------------
+    def list_companies(self) -> List[Dict[str, Any]]:
+        query = f"SELECT company_id, company_name FROM {self.company_table}"
+        return [{"company_id": row.company_id, "company_name": row.company_name} for row in self._query(query, op="list_companies")]
@@ -0,0 +1,249 @@
+import io
+import os
+import csv
+import sys
+import json
+import argparse
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+from utils.repository import USER_COLUMN_TYPES, to_date
+from utils.util import Utils, logger, user_repository, id_allocator
+from utils.validation import NO_INPUT
+
+# ==========================================
+# 申請者の一括登録 (CSV / JSONL)
+# ==========================================
+# 入力ファイルを1行ずつ読み、VALIDATE_CHUNK 件ごとに登録フォームと同じチェック(validate + validate2)を行う。
+# チェック結果は一時ファイルへ書き出すため、メモリ使用量は入力ファイルの大きさに依存しない。
+# 全行を読み終えてから有効行の件数分のIDを1回で予約し、有効行を1回のロードジョブで登録する。
+# 結果は入力1行につき1件の報告 (JSONL) として返す。
+#
+#   {"line": 2, "status": "ok", "id": 1201}
+#   {"line": 3, "status": "error", "errors": ["電話番号が正しく入力されていません。"]}
+#
+# CLI: python -m utils.bulk_import users.csv [--dry-run] [--report report.jsonl]
+
+# 入力チェックを1回にまとめる行数
+VALIDATE_CHUNK = 500
+
+# 入力ファイルの項目 (登録フォームと同じ名前)
+IMPORT_FIELDS = (
+    'username', 'regist_date', 'tel_number', 'email', 'belonging_department',
+    'company_id', 'project_name', 'system_name', 'type', 'memo',
+)
+
+FORMATS = ('csv', 'jsonl')
+
+
+class BulkImportError(Exception):
+    """入力ファイルを読み込めないため一括登録を中断した (形式・ヘッダー・文字コードの誤り)"""
+
+
+@dataclass
+class ImportResult:
+    """一括登録の結果 (report には入力1行につき1件の報告がJSONLで入っている)"""
+    total: int
+    loaded: int
+    rejected: int
+    dry_run: bool
+    report: IO[bytes]
+
+    def summary(self) -> Dict[str, Any]:
+        return {'total': self.total, 'loaded': self.loaded, 'rejected': self.rejected, 'dry_run': self.dry_run}
+
+    def iter_report(self) -> Iterator[bytes]:
+        """報告を先頭から1行ずつ返す (読み終えたら一時ファイルを閉じる)"""
+        try:
+            self.report.seek(0)
+            for line in self.report:
+                yield line
+        finally:
+            self.report.close()
+
+
+def detect_format(filename: str) -> str:
+    """拡張子から入力形式を判定 (.jsonl / .ndjson / .json は jsonl、それ以外は csv)"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    return 'jsonl' if ext in ('.jsonl', '.ndjson', '.json') else 'csv'
+
+
+def iter_records(stream: IO[bytes], fmt: str) -> Iterator[Tuple[int, Optional[Dict[str, str]], Optional[str]]]:
+    """
+    入力を1行ずつ (行番号, 登録フォーム相当のdict, 読み込みエラー) で返す
+    CSVは1行目をヘッダーとして扱う。Excelで保存したBOM付きUTF-8も読み込める。
+    """
+    if fmt not in FORMATS:
+        raise BulkImportError(f"未対応の形式です: {fmt}")
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            missing = [f for f in ('username', 'company_id') if f not in (reader.fieldnames or [])]
+            if missing:
+                raise BulkImportError(f"CSVのヘッダーに必要な項目がありません: {', '.join(missing)}")
+            for record in reader:
+                yield reader.line_num, _normalize(record), None
+        else:
+            for line_no, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield line_no, None, 'JSONとして読み込めません。'
+                    continue
+                if not isinstance(record, dict):
+                    yield line_no, None, 'JSONオブジェクトではありません。'
+                    continue
+                yield line_no, _normalize(record), None
+    except UnicodeDecodeError as e:
+        raise BulkImportError(f"UTF-8として読み込めません: {e}")
+    finally:
+        # 呼び出し元のストリームは閉じない
+        text.detach()
+
+
+def _normalize(record: Dict[str, Any]) -> Dict[str, str]:
+    """入力値を登録フォームと同じ文字列へ揃える (未知の項目は無視)"""
+    return {f: '' if record.get(f) is None else str(record.get(f)) for f in IMPORT_FIELDS}
+
+
+def _to_row(form: Dict[str, str], user_id: int) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    検証済みの入力を申請者テーブルの1行へ変換
+    ロードジョブは1行でも型が合わないと全体が失敗するため、日付と会社IDの形式もここで確認する
+    """
+    errors = []
+    try:
+        to_date(form['regist_date'])
+    except ValueError:
+        errors.append('引き渡し希望日' + NO_INPUT)
+    try:
+        row = Utils.build_registration_row(form, user_id)
+    except ValueError:
+        errors.append('社名' + NO_INPUT)
+        row = None
+    return (None, errors) if errors else (row, [])
+
+
+def _dump(record: Dict[str, Any]) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def _dump_row(row: Dict[str, Any]) -> bytes:
+    values = {}
+    for column, value in row.items():
+        if USER_COLUMN_TYPES.get(column) == 'DATE':
+            value = to_date(value)
+            value = value.isoformat() if value else None
+        values[column] = value
+    return _dump(values)
+
+
+def run_import(stream: IO[bytes], fmt: str, dry_run: bool = False) -> ImportResult:
+    """
+    入力を検証し、有効な行を一括登録する (dry_run ではIDの予約・登録を行わず検証結果のみ返す)
+    1行でも無効な行があっても、有効な行は登録する
+    """
+    # 1回目: 入力チェック結果を一時ファイルへ (IDは有効行の件数が確定してから予約する)
+    staged = tempfile.TemporaryFile()
+    total = valid = 0
+    try:
+        chunk: List[Tuple[int, Optional[Dict[str, str]], Optional[str]]] = []
+
+        def stage_chunk() -> int:
+            forms = [form for _, form, _ in chunk if form is not None]
+            results = iter(Utils.validate_registrations(forms))
+            count = 0
+            for line_no, form, read_error in chunk:
+                if form is None:
+                    staged.write(_dump({'line': line_no, 'errors': [read_error]}))
+                    continue
+                errors = next(results)
+                if not errors:
+                    _, errors = _to_row(form, 0)
+                if errors:
+                    staged.write(_dump({'line': line_no, 'errors': errors}))
+                else:
+                    staged.write(_dump({'line': line_no, 'form': form}))
+                    count += 1
+            chunk.clear()
+            return count
+
+        for item in iter_records(stream, fmt):
+            chunk.append(item)
+            total += 1
+            if len(chunk) >= VALIDATE_CHUNK:
+                valid += stage_chunk()
+        valid += stage_chunk()
+
+        # 2回目: IDを1ブロックで予約し、ロード用ファイルと報告を作成
+        ids = iter(id_allocator.allocate_block(valid)) if valid and not dry_run else None
+        report = tempfile.TemporaryFile()
+        rows = tempfile.TemporaryFile()
+        try:
+            staged.seek(0)
+            for line in staged:
+                record = json.loads(line)
+                if 'errors' in record:
+                    report.write(_dump({'line': record['line'], 'status': 'error', 'errors': record['errors']}))
+                elif ids is None:
+                    report.write(_dump({'line': record['line'], 'status': 'ok'}))
+                else:
+                    user_id = next(ids)
+                    row, _ = _to_row(record['form'], user_id)
+                    rows.write(_dump_row(row))
+                    report.write(_dump({'line': record['line'], 'status': 'ok', 'id': user_id}))
+
+            loaded = 0
+            if ids is not None:
+                rows.seek(0)
+                loaded = user_repository.load_users(rows)
+                # 新規行が先頭に入るため、ページ境界を破棄し、検索インデックスには次回参照時に差分を取り込ませる
+                Utils.notify_users_changed()
+        except BaseException:
+            report.close()
+            raise
+        finally:
+            rows.close()
+    finally:
+        staged.close()
+
+    result = ImportResult(total=total, loaded=loaded, rejected=total - valid, dry_run=dry_run, report=report)
+    logger.info(f"一括登録: {json.dumps(result.summary())}")
+    return result
+
+
+# ==========================================
+# CLI
+# ==========================================
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="申請者をCSV/JSONLファイルから一括登録する")
+    parser.add_argument("path", help="入力ファイル (CSVは1行目がヘッダー。項目名は登録フォームと同じ)")
+    parser.add_argument("--format", choices=FORMATS, help="入力形式 (省略時は拡張子から判定)")
+    parser.add_argument("--dry-run", action="store_true", help="検証のみ行い、登録しない")
+    parser.add_argument("--report", help="行ごとの報告(JSONL)の出力先 (省略時は標準出力)")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.path, "rb") as f:
+            result = run_import(f, args.format or detect_format(args.path), dry_run=args.dry_run)
+    except BulkImportError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+    out = open(args.report, "wb") if args.report else sys.stdout.buffer
+    try:
+        for line in result.iter_report():
+            out.write(line)
+    finally:
+        if args.report:
+            out.close()
+    print(json.dumps(result.summary()), file=sys.stderr)
+    return 0 if result.rejected == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
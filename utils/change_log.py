@@ -0,0 +1,44 @@
+import sys
+import json
+import argparse
+from typing import List, Optional
+
+from utils.util import logger, user_repository
+
+# ==========================================
+# 申請者の変更履歴 (反映・参照)
+# ==========================================
+# 管理者の編集・承認・論理削除は変更履歴テーブルへの追記で行われる (utils.repository 参照)。
+# 未反映の変更履歴が増えると最新の状態のビューの集計量が増えるため、定期的に申請者テーブルへ反映する。
+# (Cloud Scheduler から Cloud Run ジョブ等で1日数回実行する想定。複数箇所から同時に実行しない)
+#
+# CLI:
+#   python -m utils.change_log compact        未反映の変更履歴を申請者テーブルへ反映
+#   python -m utils.change_log history 1201   申請者の変更履歴をJSONLで表示 (古い順)
+
+
+def compact() -> int:
+    """未反映の変更履歴を申請者テーブルへ反映し、反映した申請者の件数を返す"""
+    merged = user_repository.compact_changes()
+    logger.info(f"変更履歴の反映: {merged}件")
+    return merged
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="申請者の変更履歴の反映・参照")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("compact", help="未反映の変更履歴を申請者テーブルへ反映する")
+    history = sub.add_parser("history", help="申請者の変更履歴を表示する")
+    history.add_argument("id", type=int, help="申請者ID")
+    args = parser.parse_args(argv)
+
+    if args.command == "compact":
+        print(json.dumps({"merged": compact()}))
+    else:
+        for change in user_repository.list_changes(args.id):
+            print(json.dumps(change, ensure_ascii=False, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
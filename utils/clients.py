@@ -0,0 +1,95 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# utils.util と同じルートロガーを使用 (循環importを避けるため直接取得)
+logger = logging.getLogger()
+
+
+class ClientRegistry:
+    """
+    外部APIクライアントを初回使用時に生成するレジストリ (スレッドセーフ)
+
+    - import時には何も生成しない (Cloud Runのコールドスタート短縮)
+    - 同時に複数スレッドが初回アクセスしても、生成処理は1回だけ実行
+    - override() でテスト/ベンチマーク用のフェイクへ差し替え可能
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._build_seconds: Dict[str, float] = {}
+        self._registry_lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._locks[name]:
+            # ロック待ちの間に他スレッドが生成済みならそれを使う
+            instance = self._instances.get(name)
+            if instance is None:
+                started = time.perf_counter()
+                instance = self._factories[name]()
+                self._build_seconds[name] = time.perf_counter() - started
+                self._instances[name] = instance
+            return instance
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    def override(self, name: str, instance: Any) -> None:
+        """生成済みインスタンスを差し替え (テスト/ベンチマーク用)"""
+        with self._locks.setdefault(name, threading.Lock()):
+            self._instances[name] = instance
+
+    def reset(self, name: str) -> None:
+        """生成済みインスタンスを破棄し、次回アクセス時に再生成させる"""
+        with self._locks[name]:
+            self._instances.pop(name, None)
+
+    def build_seconds(self) -> Dict[str, float]:
+        """クライアントごとの生成所要時間(秒)"""
+        return dict(self._build_seconds)
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> None:
+        """指定したクライアントを事前生成 (失敗しても初回使用時に再試行されるためログのみ)"""
+        for name in list(names if names is not None else self._factories):
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"{name}クライアントの事前生成に失敗しました: {e}")
+
+    def warm_up_async(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """事前生成をバックグラウンドスレッドで実行"""
+        worker = threading.Thread(target=self.warm_up, args=(names,), name="client-warm-up", daemon=True)
+        worker.start()
+        return worker
+
+
+class LazyClient:
+    """
+    レジストリ上のクライアントへ属性アクセスを委譲するプロキシ
+
+    `from utils.util import bigquery_client` のような既存のimportを変えずに、
+    実体の生成を初回のメソッド呼び出しまで遅延させる
+    """
+
+    def __init__(self, registry: ClientRegistry, name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._registry.get(self._name), attr)
+
+    def __repr__(self) -> str:
+        state = "built" if self._registry.is_built(self._name) else "lazy"
+        return f"<LazyClient {self._name} ({state})>"
@@ -0,0 +1,81 @@
+import io
+import csv
+import json
+import datetime
+from typing import Any, Dict, Iterable, Iterator, List
+
+from utils.repository import USER_DETAIL_COLUMNS
+
+# ==========================================
+# 申請者一覧のエクスポート (CSV / JSONL)
+# ==========================================
+# リポジトリの iter_users() から1件ずつ受け取った行を、CHUNK_ROWS 件ごとにまとめてバイト列で返す。
+# 全件をリストへ読み込まないため、メモリ使用量は件数に依存しない (Flaskのストリーミング応答で使用)。
+# CSVはExcelで開けるようBOM付きUTF-8で出力する (utils.bulk_import もBOM付きのCSVを読み込める)。
+# 申請者の入力値が表計算ソフトで数式として実行されないよう、数式と解釈される文字で始まる値は先頭に ' を付ける。
+
+# 1回の書き出しにまとめる行数
+CHUNK_ROWS = 500
+
+# エクスポートするカラム
+EXPORT_COLUMNS: List[str] = USER_DETAIL_COLUMNS
+
+# 表計算ソフトが数式として解釈する先頭文字 (CSVの値のみ対象。JSONLはそのまま出力する)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_text(value: Any) -> str:
+    text = _text(value)
+    if isinstance(value, str) and text.startswith(FORMULA_PREFIXES):
+        return "'" + text
+    return text
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]], columns: List[str] = EXPORT_COLUMNS) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_text(row.get(c)) for c in columns])
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_jsonl(rows: Iterable[Dict[str, Any]], columns: List[str] = EXPORT_COLUMNS) -> Iterator[bytes]:
+    lines = []
+    for row in rows:
+        record = {c: row.get(c) for c in columns}
+        lines.append(json.dumps(record, ensure_ascii=False, default=_text))
+        if len(lines) >= CHUNK_ROWS:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def iter_export(rows: Iterable[Dict[str, Any]], fmt: str) -> Iterator[bytes]:
+    """fmt ('csv' / 'jsonl') の形式でバイト列を返す"""
+    if fmt == 'csv':
+        return iter_csv(rows)
+    if fmt == 'jsonl':
+        return iter_jsonl(rows)
+    raise ValueError(f"未対応の形式です: {fmt}")
@@ -0,0 +1,39 @@
+import threading
+from typing import Callable
+
+# ==========================================
+# 申請者IDの採番
+# ==========================================
+# SELECT MAX(id)+1 方式は登録のたびにテーブルを走査し、同時登録でIDが重複する。
+# 採番テーブル(シーケンス行)から block_size 件ずつまとめて予約し、プロセス内ではロック下で
+# メモリから払い出す。予約はトランザクションで行うため、複数のCloud Runインスタンス間でも重複しない。
+# ※インスタンス停止時に未使用分は欠番になる (IDの連続性は保証しない)
+
+
+class IdAllocator:
+    """採番テーブルから予約したIDブロックをメモリ上で払い出す"""
+
+    def __init__(self, reserve: Callable[[int], int], block_size: int = 20):
+        # reserve(count) は連続したID count 件を予約し、その先頭IDを返す関数
+        self._reserve = reserve
+        self._block_size = max(block_size, 1)
+        self._next = 0
+        self._end = 0  # 予約済みブロックの終端 (このIDは含まない)
+        self._lock = threading.Lock()
+
+    def allocate(self) -> int:
+        """IDを1件払い出す (手持ちが尽きた場合のみ採番テーブルへ1往復)"""
+        with self._lock:
+            if self._next >= self._end:
+                start = self._reserve(self._block_size)
+                self._next, self._end = start, start + self._block_size
+            new_id = self._next
+            self._next += 1
+            return new_id
+
+    def allocate_block(self, count: int) -> range:
+        """連続したIDを count 件まとめて払い出す (一括登録用。手持ちのブロックは消費しない)"""
+        if count <= 0:
+            return range(0)
+        start = self._reserve(count)
+        return range(start, start + count)
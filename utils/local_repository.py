@@ -0,0 +1,308 @@
+import time
+import random
+import sqlite3
+import datetime
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.metrics import track_call
+from utils.repository import (
+    CHANGE_META_COLUMNS, USER_COLUMN_TYPES, USER_LIST_COLUMNS, UserRepository, check_columns, check_update_columns,
+    to_date,
+)
+
+# ==========================================
+# ローカル検証/ベンチマーク用のストレージ (SQLite)
+# ==========================================
+# GCPへ接続せずにFlaskアプリ全体を動かすためのBigQueryの代替実装。
+# latency_ms を指定すると、各呼び出しにBigQueryのジョブ待ち相当の遅延を挿入する。
+# 各呼び出しはBigQueryと同じく track_call() で計測する (backend="sqlite"。/metrics・Server-Timing で確認できる)。
+# 更新はBigQueryと同じく変更履歴(user_changes)へ追記するが、SQLiteの更新は安価なため、
+# 同じトランザクション内で申請者テーブルも直接更新する (ビューを介さずに最新の状態を読み取れる)。
+
+_SQLITE_TYPES = {'INTEGER': 'INTEGER', 'STRING': 'TEXT', 'DATE': 'DATE'}
+
+# DATE型のカラムは datetime.date で読み書きする (BigQueryクライアントの戻り値と揃える)
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_converter("DATE", lambda b: datetime.date.fromisoformat(b.decode()))
+
+
+class SQLiteUserRepository(UserRepository):
+    """SQLite上の申請者テーブル/会社テーブルへのアクセス (path=':memory:' でインメモリ)"""
+
+    def __init__(self, path: str = ":memory:", latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # gunicornの複数スレッドから共有するため、1接続をロックで直列化して使用
+        self._conn = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._create_tables()
+
+    # ------------------------------------------
+    # 内部ヘルパー
+    # ------------------------------------------
+    def _create_tables(self) -> None:
+        columns = ", ".join(f"{c} {_SQLITE_TYPES[t]}" for c, t in USER_COLUMN_TYPES.items())
+        with self._lock, self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS users ({columns})")
+            # 再送された行を重複して登録しないよう、idを一意にする (insert_users は登録済みのidを無視する)
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_id_unique ON users (id)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS companies (company_id INTEGER, company_name TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS id_sequence (name TEXT PRIMARY KEY, next_id INTEGER NOT NULL)")
+            change_columns = ", ".join(f"{c} {_SQLITE_TYPES[t]}" for c, t in USER_COLUMN_TYPES.items() if c != 'id')
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, id INTEGER NOT NULL, "
+                f"changed_fields TEXT NOT NULL, changed_at TEXT NOT NULL, {change_columns})"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS user_changes_id ON user_changes (id)")
+
+    def _sleep(self) -> None:
+        """BigQueryの往復に相当する遅延を挿入"""
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay += random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    @contextmanager
+    def _round_trip(self, op: str) -> Iterator[None]:
+        """BigQueryの1回のジョブに相当する呼び出し (遅延の挿入と計測)"""
+        with track_call("sqlite", op):
+            self._sleep()
+            yield
+
+    def _fetch(self, query: str, params: Iterable[Any] = (), op: str = "query") -> List[Dict[str, Any]]:
+        with self._round_trip(op), self._lock:
+            return [dict(row) for row in self._conn.execute(query, tuple(params))]
+
+    def _execute(self, query: str, params: Iterable[Any] = (), op: str = "execute") -> None:
+        with self._round_trip(op), self._lock, self._conn:
+            self._conn.execute(query, tuple(params))
+
+    @staticmethod
+    def _value(column: str, value: Any) -> Any:
+        if USER_COLUMN_TYPES.get(column) == 'DATE':
+            return to_date(value)
+        return value
+
+    @staticmethod
+    def _filter(name: Optional[str], s_date: Optional[str]):
+        conditions = []
+        params: List[Any] = []
+        if name:
+            # BigQueryの LIKE と同じく大文字小文字を区別する部分一致
+            conditions.append("instr(name, ?) > 0")
+            params.append(name)
+        if s_date:
+            conditions.append("desired_delivery_date = ?")
+            params.append(to_date(s_date))
+        return conditions, params
+
+    # ------------------------------------------
+    # 申請者 (CRUD)
+    # ------------------------------------------
+    def get_max_id(self) -> int:
+        rows = self._fetch("SELECT MAX(id) AS max_id FROM users", op="get_max_id")
+        return rows[0]["max_id"] or 0
+
+    def reserve_ids(self, count: int) -> int:
+        with self._round_trip("reserve_ids"), self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO id_sequence (name, next_id)
+                   SELECT 'users', start_id FROM (SELECT IFNULL(MAX(id), 0) + 1 AS start_id FROM users)
+                   WHERE NOT EXISTS (SELECT 1 FROM id_sequence WHERE name = 'users')"""
+            )
+            self._conn.execute("UPDATE id_sequence SET next_id = next_id + ? WHERE name = 'users'", (count,))
+            row = self._conn.execute("SELECT next_id - ? FROM id_sequence WHERE name = 'users'", (count,)).fetchone()
+            return row[0]
+
+    def insert_user(self, row: Dict[str, Any]) -> None:
+        columns = list(row)
+        query = f"INSERT INTO users ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        self._execute(query, [self._value(c, row[c]) for c in columns], op="insert_user")
+
+    def insert_users(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        columns = sorted({c for row in rows for c in row})
+        query = f"INSERT OR IGNORE INTO users ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        with self._round_trip("insert_users"), self._lock, self._conn:
+            self._conn.executemany(query, [[self._value(c, row.get(c)) for c in columns] for row in rows])
+
+    def get_user(self, user_id: int, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        rows = self._fetch(f"SELECT {', '.join(check_columns(columns))} FROM users WHERE id = ?", [user_id],
+                           op="get_user")
+        return rows[0] if rows else None
+
+    def get_users(self, user_ids: List[int], columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if not user_ids:
+            return []
+        return self._fetch(f"SELECT {', '.join(check_columns(columns))} FROM users "
+                           f"WHERE id IN ({', '.join('?' for _ in user_ids)}) ORDER BY id", list(user_ids),
+                           op="get_users")
+
+    def _apply_changes(self, changes: Dict[int, Dict[str, Any]]) -> None:
+        """変更履歴への追記と申請者テーブルの更新 (呼び出し元でロックとトランザクションを確保する)"""
+        changed_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        for user_id, fields in changes.items():
+            if not fields:
+                continue
+            columns = list(fields)
+            values = [self._value(k, v) for k, v in fields.items()]
+            self._conn.execute(
+                f"INSERT INTO user_changes (id, changed_fields, changed_at, {', '.join(columns)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in columns)})",
+                [user_id, ",".join(columns), changed_at] + values,
+            )
+            set_clauses = ", ".join(f"{key} = ?" for key in columns)
+            self._conn.execute(f"UPDATE users SET {set_clauses} WHERE id = ?", values + [user_id])
+
+    def update_user(self, user_id: int, fields: Dict[str, Any]) -> None:
+        check_update_columns({user_id: fields})
+        with self._round_trip("update_user"), self._lock, self._conn:
+            self._apply_changes({user_id: fields})
+
+    def update_users(self, changes: Dict[int, Dict[str, Any]],
+                     columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if not changes:
+            return []
+        check_update_columns(changes)
+        select = ", ".join(check_columns(columns))
+        ids = list(changes)
+        with self._round_trip("update_users"), self._lock, self._conn:
+            self._apply_changes(changes)
+            query = f"SELECT {select} FROM users WHERE id IN ({', '.join('?' for _ in ids)}) ORDER BY id"
+            return [dict(row) for row in self._conn.execute(query, ids)]
+
+    def list_changes(self, user_id: int) -> List[Dict[str, Any]]:
+        changes = []
+        columns = CHANGE_META_COLUMNS + [c for c in USER_COLUMN_TYPES if c != 'id']
+        for row in self._fetch(f"SELECT {', '.join(columns)} FROM user_changes WHERE id = ? ORDER BY seq", [user_id],
+                               op="list_changes"):
+            change = {c: row[c] for c in CHANGE_META_COLUMNS}
+            change['changed_at'] = datetime.datetime.fromisoformat(change['changed_at'])
+            change.update((c, row[c]) for c in row['changed_fields'].split(","))
+            changes.append(change)
+        return changes
+
+    # ------------------------------------------
+    # 申請者 (一覧/検索)
+    # ------------------------------------------
+    def list_users(self) -> List[Dict[str, Any]]:
+        return self._fetch(f"SELECT {', '.join(USER_LIST_COLUMNS)} FROM users ORDER BY id DESC", op="list_users")
+
+    def list_users_changed_since(self, since: datetime.datetime) -> List[Dict[str, Any]]:
+        # changed_at はUTCのISO形式の文字列のため、同じ形式の文字列で比較する
+        since = since.astimezone(datetime.timezone.utc)
+        query = f"""
+            SELECT {', '.join(USER_LIST_COLUMNS)} FROM users
+            WHERE insert_date >= ? OR id IN (SELECT id FROM user_changes WHERE changed_at >= ?)
+            ORDER BY id
+        """
+        params = [(since.date() - datetime.timedelta(days=1)).isoformat(), since.isoformat()]
+        return self._fetch(query, params, op="list_users_changed_since")
+
+    def count_users(self, name: Optional[str] = None, s_date: Optional[str] = None) -> int:
+        conditions, params = self._filter(name, s_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._fetch(f"SELECT COUNT(*) AS total FROM users {where}", params, op="count_users")[0]["total"]
+
+    def list_users_page(self, limit: int, offset: int = 0, after_id: Optional[int] = None,
+                        name: Optional[str] = None, s_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        conditions, params = self._filter(name, s_date)
+        if after_id is not None:
+            conditions.append("id < ?")
+            params.append(after_id)
+            offset = 0
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT {', '.join(USER_LIST_COLUMNS)}
+            FROM users
+            {where}
+            ORDER BY id DESC
+            LIMIT ? OFFSET ?
+        """
+        return self._fetch(query, params + [limit, offset], op="list_users_page")
+
+    def count_by_delivery_date(self) -> List[Tuple[datetime.date, int]]:
+        query = """
+            SELECT desired_delivery_date, COUNT(*) AS total
+            FROM users
+            WHERE desired_delivery_date IS NOT NULL
+            GROUP BY desired_delivery_date
+            ORDER BY desired_delivery_date
+        """
+        return [(row["desired_delivery_date"], row["total"]) for row in self._fetch(query, op="count_by_delivery_date")]
+
+    def iter_users(self, columns: Optional[List[str]] = None, name: Optional[str] = None,
+                   s_date: Optional[str] = None, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        # 接続のロックを反復中ずっと保持しないよう、id < 直前の末尾id のキーセットで page_size 件ずつ取得する
+        select = ", ".join(check_columns(columns))
+        conditions, params = self._filter(name, s_date)
+
+        def fetch(after_id: Optional[int]) -> List[Dict[str, Any]]:
+            page_conditions = conditions + (["id < ?"] if after_id is not None else [])
+            where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+            query = f"SELECT {select} FROM users {where} ORDER BY id DESC LIMIT ?"
+            return self._fetch(query, params + ([after_id] if after_id is not None else []) + [page_size],
+                               op="iter_users")
+
+        def generate(rows: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            while rows:
+                yield from rows
+                rows = fetch(rows[-1]['id']) if len(rows) == page_size else []
+
+        return generate(fetch(None))
+
+    # ------------------------------------------
+    # 会社
+    # ------------------------------------------
+    def list_companies(self) -> List[Dict[str, Any]]:
+        return self._fetch("SELECT company_id, company_name FROM companies ORDER BY company_id", op="list_companies")
+
+    # ------------------------------------------
+    # テストデータ投入
+    # ------------------------------------------
+    def seed(self, users: int = 0, companies: int = 10) -> None:
+        """ダミーの会社/申請者データを投入 (遅延は挿入しない。会社は未登録の場合のみ投入)"""
+        with self._lock, self._conn:
+            if not self._conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]:
+                self._conn.executemany(
+                    "INSERT INTO companies (company_id, company_name) VALUES (?, ?)",
+                    [(i, f"株式会社サンプル{i}") for i in range(1, companies + 1)],
+                )
+            start = (self._conn.execute("SELECT MAX(id) FROM users").fetchone()[0] or 0) + 1
+            base_date = datetime.date(2024, 4, 1)
+            rows = []
+            for i in range(start, start + users):
+                rows.append((
+                    i, f"利用者{i}", base_date + datetime.timedelta(days=i % 90), "03-0000-0000",
+                    f"user{i}@example.com", "情報システム部", (i % max(companies, 1)) + 1,
+                    f"project{i}", f"system{i}", "standard", "", base_date, "update",
+                ))
+            self._conn.executemany(
+                """INSERT INTO users (id, name, desired_delivery_date, tel, email, belonging_department,
+                   company_id, project_name, system_name, type, memo, insert_date, UPDATE_FLG)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+
+
+class _LocalProject:
+    def __init__(self, project_id: str):
+        self.project_id = project_id
+
+
+class LocalProjectsClient:
+    """resourcemanager_v3.ProjectsClient の代替 (search_projects のみ対応)"""
+
+    def __init__(self, project_ids: Iterable[str] = (), latency_ms: float = 0.0):
+        self.project_ids = list(project_ids)
+        self.latency_ms = latency_ms
+
+    def search_projects(self, request: Any = None, **kwargs) -> List[_LocalProject]:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        return [_LocalProject(pj_id) for pj_id in self.project_ids]
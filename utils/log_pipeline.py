@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import REGISTRY
+
+# ==========================================
+# ログの非同期・一括出力
+# ==========================================
+# リクエストスレッドではログを構造化(JSON)してキューへ積むだけにし、専用スレッドがまとめて出力先へ書き込む。
+#   - 出力先(sink)が失敗した、又は1回の書き込みに slow_seconds 以上かかった場合は、cooldown 秒の間
+#     ローカルのスプールファイル(サイズでローテーション)へ書き込む (出力先の遅延をリクエストへ波及させない)
+#   - キューが満杯の場合は待たずに破棄し、件数を記録する
+#   - 同じ箇所(ファイル・行・例外の型)からの WARNING 以上のログは、window 秒ごとに limit 件までそのまま出力し、
+#     以降は sample_every 件に1件だけ、抑止した件数(suppressed)を付けて出力する
+# 出力先へ書き込めなかったログはスプールに残るのみで、再送はしない。
+
+LOG_RECORDS = REGISTRY.counter(
+    "multicloud_log_records_total", "Log records handled by the logging pipeline", ("result",))
+
+# Cloud Loggingの構造化ログで、ソースの位置として認識されるキー
+SOURCE_LOCATION_KEY = "logging.googleapis.com/sourceLocation"
+
+
+def to_entry(record: logging.LogRecord) -> Dict[str, Any]:
+    """ログレコードを構造化ログ(Cloud Loggingの形式)へ"""
+    message = record.getMessage()
+    if record.exc_info:
+        message += "\n" + logging.Formatter().formatException(record.exc_info)
+    entry = {
+        "severity": record.levelname,
+        "message": message,
+        "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+        "logger": record.name,
+        SOURCE_LOCATION_KEY: {"file": record.pathname, "line": str(record.lineno), "function": record.funcName},
+    }
+    suppressed = getattr(record, "suppressed", 0)
+    if suppressed:
+        entry["suppressed"] = suppressed
+    return entry
+
+
+class RateLimiter:
+    """同じ箇所から繰り返し出力されるログの件数制限とサンプリング"""
+
+    # 保持する箇所の上限 (超過時はすべて破棄して数え直す)
+    MAX_KEYS = 1000
+
+    def __init__(self, limit: int = 10, window: float = 60.0, sample_every: int = 100):
+        self.limit = limit
+        self.window = window
+        self.sample_every = max(sample_every, 1)
+        self._counts: Dict[Tuple, List[float]] = {}  # 箇所 -> [集計開始時刻, 件数, 未報告の抑止件数]
+        self._lock = threading.Lock()
+
+    def check(self, key: Tuple) -> Tuple[bool, int]:
+        """(出力するか, 出力する場合に付ける抑止件数)"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._counts.get(key)
+            if state is None or now - state[0] >= self.window:
+                if len(self._counts) >= self.MAX_KEYS:
+                    self._counts.clear()
+                suppressed = int(state[2]) if state is not None else 0
+                self._counts[key] = [now, 1, 0]
+                return True, suppressed
+            state[1] += 1
+            if state[1] <= self.limit:
+                return True, 0
+            state[2] += 1
+            if state[2] % self.sample_every == 0:
+                suppressed, state[2] = int(state[2]) - 1, 0
+                return True, suppressed
+            return False, 0
+
+
+class RotatingSpool:
+    """JSON行を追記するローカルファイル (max_bytes を超えたら .1, .2, ... へ退避)"""
+
+    def __init__(self, path: str, max_bytes: int = 10 << 20, backups: int = 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, entries: List[Dict[str, Any]]) -> None:
+        data = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in entries)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+            size = f.tell()
+        if size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+class PipelineHandler(logging.Handler):
+    """ログレコードを構造化してパイプラインのキューへ積むハンドラー (待たない)"""
+
+    def __init__(self, pipeline: "LogPipeline", level: int = logging.NOTSET):
+        super().__init__(level)
+        self.pipeline = pipeline
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.pipeline.submit(record)
+        except Exception:
+            self.handleError(record)
+
+
+class LogPipeline:
+    """構造化したログを batch_size 件ずつ sink へ書き込むバックグラウンドパイプライン"""
+
+    def __init__(self, sink: Callable[[List[Dict[str, Any]]], None], spool_path: str,
+                 max_queue: int = 10000, batch_size: int = 100, flush_interval: float = 1.0,
+                 slow_seconds: float = 2.0, cooldown: float = 30.0, spool_max_bytes: int = 10 << 20,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self._sink = sink
+        self._spool = RotatingSpool(spool_path, max_bytes=spool_max_bytes)
+        self._batch_size = max(batch_size, 1)
+        self._flush_interval = flush_interval
+        self._slow_seconds = slow_seconds
+        self._cooldown = cooldown
+        self._rate_limiter = rate_limiter
+
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max_queue)
+        self._spool_until = 0.0  # この時刻(monotonic)までは sink を使わずスプールへ書き込む
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self.handler = PipelineHandler(self)
+
+    # ------------------------------------------
+    # 受付
+    # ------------------------------------------
+    def submit(self, record: logging.LogRecord) -> None:
+        if self._worker is not None and threading.get_ident() == self._worker.ident:
+            # 書き込みスレッド自身(出力先のライブラリ等)のログは、キューを経由せず標準エラー出力へ
+            sys.stderr.write(f"{record.levelname} {record.getMessage()}\n")
+            return
+        if self._rate_limiter is not None and record.levelno >= logging.WARNING:
+            exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else ""
+            allowed, suppressed = self._rate_limiter.check((record.pathname, record.lineno, exc_type))
+            if not allowed:
+                LOG_RECORDS.inc(result="suppressed")
+                return
+            record.suppressed = suppressed
+        # メッセージは受付時点の値で確定させる (引数のオブジェクトが後から変更されても影響しない)
+        record.msg, record.args = record.getMessage(), None
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS.inc(result="dropped")
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # ------------------------------------------
+    # 起動/停止
+    # ------------------------------------------
+    def start(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name="log-pipeline", daemon=True)
+        self._worker.start()
+
+    def shutdown(self, timeout: float = 2.0) -> None:
+        """書き込みスレッドを止め、キューに残ったログを書き込む (出力先が使えない場合はスプールへ)"""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join(timeout=timeout)
+        remaining = []
+        while True:
+            try:
+                remaining.append(to_entry(self._queue.get_nowait()))
+            except queue.Empty:
+                break
+        for i in range(0, len(remaining), self._batch_size):
+            self._write(remaining[i:i + self._batch_size])
+
+    # ------------------------------------------
+    # 書き込みスレッド
+    # ------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._write([to_entry(record) for record in batch])
+
+    def _take_batch(self) -> List[logging.LogRecord]:
+        """最初の1件を待ち、flush_interval の間に届いたログを batch_size 件までまとめる"""
+        try:
+            batch = [self._queue.get(timeout=self._flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self._flush_interval
+        while len(batch) < self._batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, entries: List[Dict[str, Any]]) -> None:
+        if time.monotonic() < self._spool_until:
+            self._write_spool(entries)
+            return
+        started = time.monotonic()
+        try:
+            self._sink(entries)
+        except Exception as e:
+            self._spool_until = time.monotonic() + self._cooldown
+            sys.stderr.write(f"ログの出力に失敗したため{self._cooldown:.0f}秒間スプールへ書き込みます: {e}\n")
+            self._write_spool(entries)
+            return
+        LOG_RECORDS.inc(len(entries), result="sent")
+        elapsed = time.monotonic() - started
+        if elapsed >= self._slow_seconds:
+            self._spool_until = time.monotonic() + self._cooldown
+            sys.stderr.write(f"ログの出力に{elapsed:.1f}秒かかったため{self._cooldown:.0f}秒間スプールへ書き込みます\n")
+
+    def _write_spool(self, entries: List[Dict[str, Any]]) -> None:
+        try:
+            self._spool.write(entries)
+            LOG_RECORDS.inc(len(entries), result="spooled")
+        except OSError as e:
+            LOG_RECORDS.inc(len(entries), result="dropped")
+            sys.stderr.write(f"ログのスプールへの書き込みに失敗しました ({len(entries)}件): {e}\n")
+
+
+# ==========================================
+# 出力先
+# ==========================================
+def stdout_sink(stream: Any = None) -> Callable[[List[Dict[str, Any]]], None]:
+    """標準出力へJSON行で書き込む (Cloud Runでは構造化ログとしてCloud Loggingへ取り込まれる)"""
+    def write(entries: List[Dict[str, Any]]) -> None:
+        out = stream or sys.stdout
+        out.write("".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in entries))
+        out.flush()
+    return write
+
+
+def cloud_logging_sink(client: Any, log_name: str) -> Callable[[List[Dict[str, Any]]], None]:
+    """Cloud Logging APIへまとめて書き込む (1バッチ = 1回のAPI呼び出し)"""
+    from google.cloud.logging_v2.handlers import _monitored_resources
+    # 実行環境(Cloud Run等)のリソースとして記録する (setup_logging() と同じ判定)
+    cloud_logger = client.logger(log_name, resource=_monitored_resources.detect_resource(client.project))
+
+    def write(entries: List[Dict[str, Any]]) -> None:
+        batch = cloud_logger.batch()
+        for entry in entries:
+            payload = dict(entry)
+            severity = payload.pop("severity")
+            timestamp = datetime.datetime.fromisoformat(payload.pop("time"))
+            location = payload.pop(SOURCE_LOCATION_KEY)
+            batch.log_struct(payload, severity=severity, timestamp=timestamp,
+                             source_location={"file": location["file"], "line": int(location["line"]),
+                                              "function": location["function"]})
+        batch.commit()
+    return write
@@ -0,0 +1,266 @@
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# utils.util と同じルートロガーを使用 (循環importを避けるため直接取得)
+logger = logging.getLogger()
+
+# ==========================================
+# 性能計測 (Prometheus形式の /metrics と Server-Timing ヘッダー)
+# ==========================================
+# BigQuery / Resource Manager などの外部呼び出しは track_call() で囲み、所要時間と
+# ジョブの統計(処理バイト数・スロット時間・キャッシュヒット・ジョブID)を記録する。
+# リクエスト処理中の呼び出しは、Server-Timing ヘッダー用にリクエスト単位でも保持する。
+# 外部ライブラリは使用せず、このプロセス(gunicornワーカー)内の値のみを集計する。
+
+# 所要時間ヒストグラムの区切り(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    """ラベル付きの値を保持する指標の基底クラス"""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """増加のみの累計値"""
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._format_labels(k)} {v:g}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """増減する現在値"""
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._format_labels(k)} {v:g}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """値の分布 (区切りごとの累積件数・合計・件数)"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, List[float]] = {}  # [区切りごとの件数..., +Inf, 合計]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, counts in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', le))} {cumulative:g}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {counts[-1]:g}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative:g}")
+        return lines
+
+
+class MetricsRegistry:
+    """指標の登録と、Prometheusのテキスト形式での出力"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# 外部呼び出し (BigQueryのクエリ/ロードジョブ, Resource Managerの検索, ローカル検証用のSQLite)
+CALL_SECONDS = REGISTRY.histogram(
+    "multicloud_backend_call_seconds", "Wall time of backend calls", ("backend", "operation"))
+CALL_ERRORS = REGISTRY.counter(
+    "multicloud_backend_call_errors_total", "Backend calls that raised an exception", ("backend", "operation"))
+BYTES_PROCESSED = REGISTRY.counter(
+    "multicloud_bigquery_bytes_processed_total", "Bytes processed by BigQuery jobs", ("operation",))
+SLOT_MILLIS = REGISTRY.counter(
+    "multicloud_bigquery_slot_milliseconds_total", "Slot milliseconds consumed by BigQuery jobs", ("operation",))
+CACHE_HITS = REGISTRY.counter(
+    "multicloud_bigquery_cache_hits_total", "BigQuery jobs answered from the query cache", ("operation",))
+
+# HTTPリクエスト
+REQUEST_SECONDS = REGISTRY.histogram(
+    "multicloud_http_request_seconds", "Latency of HTTP requests", ("endpoint", "method", "status"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "multicloud_http_requests_in_flight", "Requests currently being handled (busy worker threads)")
+WORKER_THREADS = REGISTRY.gauge(
+    "multicloud_worker_threads", "Concurrent requests this worker can hold (threads, or gevent connections)")
+
+# リクエスト処理中に発生した外部呼び出し ([(名前, 所要ミリ秒, 説明), ...])。リクエスト外ではNone
+_request_calls: "contextvars.ContextVar[Optional[List[Tuple[str, float, str]]]]" = \
+    contextvars.ContextVar("request_calls", default=None)
+
+
+class CallStats:
+    """track_call() の中で設定するジョブの統計"""
+    __slots__ = ("job_id", "bytes_processed", "slot_millis", "cache_hit")
+
+    def __init__(self):
+        self.job_id: Optional[str] = None
+        self.bytes_processed: Optional[int] = None
+        self.slot_millis: Optional[int] = None
+        self.cache_hit: Optional[bool] = None
+
+    def from_job(self, job: Any) -> None:
+        """BigQueryのジョブから統計を取得 (取得できない項目はNoneのまま)"""
+        self.job_id = getattr(job, "job_id", None)
+        self.bytes_processed = getattr(job, "total_bytes_processed", None)
+        self.slot_millis = getattr(job, "slot_millis", None)
+        self.cache_hit = getattr(job, "cache_hit", None)
+
+
+@contextmanager
+def track_call(backend: str, operation: str) -> Iterator[CallStats]:
+    """外部呼び出しを計測 (例外はそのまま送出し、エラー件数として記録)"""
+    stats = CallStats()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield stats
+    except Exception as e:
+        error = e
+        CALL_ERRORS.inc(backend=backend, operation=operation)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        CALL_SECONDS.observe(elapsed, backend=backend, operation=operation)
+        if stats.bytes_processed:
+            BYTES_PROCESSED.inc(stats.bytes_processed, operation=operation)
+        if stats.slot_millis:
+            SLOT_MILLIS.inc(stats.slot_millis, operation=operation)
+        if stats.cache_hit:
+            CACHE_HITS.inc(operation=operation)
+
+        calls = _request_calls.get()
+        if calls is not None:
+            calls.append((backend, elapsed * 1000.0, operation + (" (cache)" if stats.cache_hit else "")))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"{backend}.{operation}: {elapsed * 1000.0:.1f}ms job_id={stats.job_id} "
+                f"bytes={stats.bytes_processed} slot_ms={stats.slot_millis} cache_hit={stats.cache_hit}"
+                + (f" error={error}" if error else "")
+            )
+
+
+# ------------------------------------------
+# リクエスト単位の計測 (main.py の before_request / after_request から呼び出す)
+# ------------------------------------------
+def begin_request() -> Tuple[float, contextvars.Token]:
+    REQUESTS_IN_FLIGHT.inc()
+    return time.perf_counter(), _request_calls.set([])
+
+
+def end_request(started: float, token: contextvars.Token, endpoint: str, method: str, status: int) -> str:
+    """リクエストの所要時間を記録し、Server-Timing ヘッダーの値を返す"""
+    elapsed = time.perf_counter() - started
+    REQUESTS_IN_FLIGHT.dec()
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=method, status=str(status))
+    calls = _request_calls.get() or []
+    _request_calls.reset(token)
+    return server_timing(elapsed * 1000.0, calls)
+
+
+def server_timing(total_ms: float, calls: List[Tuple[str, float, str]]) -> str:
+    """Server-Timing ヘッダーの値 (外部呼び出しごとの所要時間 + 全体)"""
+    entries = [
+        f'{backend}-{i};dur={ms:.1f};desc="{desc}"' for i, (backend, ms, desc) in enumerate(calls, start=1)
+    ]
+    entries.append(f"app;dur={total_ms:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,223 @@
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+from utils.metrics import REGISTRY
+from utils.repository import UserRepository
+
+# ==========================================
+# 読み取り結果のキャッシュ (リポジトリのラッパー)
+# ==========================================
+# 編集/削除画面の遷移や一覧の再表示で同じ読み取りが繰り返されるため、
+# 「操作名 + 正規化したパラメータ」をキーに結果をプロセス内に保持する (LRU・件数上限・TTL)。
+# 書き込みはラッパーを通して実行し、書き込みの内容に応じて該当するキャッシュを無効化する。
+#   - id指定の読み取り(get_user): そのidの世代を進める (他のidのキャッシュは残る)
+#     idごとの世代は id を ID_VERSION_SLOTS で割った余りごとに持つ (更新されたidの数によらずメモリは一定。
+#     同じ余りの他のidのキャッシュも無効になるが、読み直すだけで結果は変わらない)
+#   - 一覧/件数/集計: テーブル全体の世代を進める (追加・更新で一覧の内容や並びが変わるため)
+# 読み取り開始時点の世代をキーに含めるため、読み取り中に書き込みがあっても古い結果は参照されない。
+# 他インスタンスでの書き込みは検知できないため、TTLで鮮度の上限を決める。
+
+# idごとの世代を保持する枠の数
+ID_VERSION_SLOTS = 4096
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "multicloud_query_cache_requests_total", "Repository reads served by the query cache", ("operation", "result"))
+
+
+class QueryCache:
+    """LRU + TTL のキャッシュ (max_rows は保持する結果の行数の合計の上限)"""
+
+    def __init__(self, ttl: float, max_entries: int = 512, max_rows: int = 20000):
+        self.ttl = ttl
+        self.max_entries = max(max_entries, 1)
+        self.max_rows = max(max_rows, 1)
+        self._entries: "OrderedDict[tuple, Tuple[Any, float, int]]" = OrderedDict()  # key -> (値, 保存時刻, 行数)
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, stored_at, _ = entry
+            if time.monotonic() - stored_at > self.ttl:
+                self._pop(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def put(self, key: tuple, value: Any) -> None:
+        weight = len(value) if isinstance(value, list) else 1
+        if weight > self.max_rows:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, time.monotonic(), weight)
+            self._rows += weight
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._pop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def _pop(self, key: tuple) -> None:
+        _, _, weight = self._entries.pop(key)
+        self._rows -= weight
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _copy(value: Any) -> Any:
+    """呼び出し元が結果の行(dict)を書き換えてもキャッシュに影響しないよう複製して返す"""
+    if isinstance(value, list):
+        return [dict(v) if isinstance(v, dict) else v for v in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+class CachedUserRepository(UserRepository):
+    """読み取り結果をキャッシュし、書き込み時に該当する結果を無効化するリポジトリ"""
+
+    def __init__(self, inner: UserRepository, cache: QueryCache):
+        self.inner = inner
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._generation = 0                   # テーブル全体の世代 (一覧/件数/集計のキー)
+        self._id_versions: List[int] = [0] * ID_VERSION_SLOTS  # idごとの世代 (get_user のキー。余りごとの枠)
+
+    def __getattr__(self, name: str) -> Any:
+        # seed() など実装固有のメソッドはそのまま委譲
+        return getattr(self.inner, name)
+
+    # ------------------------------------------
+    # キャッシュ操作
+    # ------------------------------------------
+    def _cached(self, op: str, key: tuple, load: Callable[[], Any]) -> Any:
+        hit, value = self.cache.get(key)
+        CACHE_REQUESTS.inc(operation=op, result="hit" if hit else "miss")
+        if not hit:
+            value = load()
+            self.cache.put(key, value)
+        return _copy(value)
+
+    def _table_key(self, op: str, *args: Any) -> tuple:
+        return (op, args, self._generation)
+
+    def _id_key(self, op: str, user_id: int, *args: Any) -> tuple:
+        with self._lock:
+            return (op, user_id, args, self._id_versions[user_id % ID_VERSION_SLOTS])
+
+    def invalidate(self, user_ids: Optional[List[int]] = None) -> None:
+        """書き込み後の無効化 (user_ids 指定時はそのidの結果も無効化)"""
+        with self._lock:
+            self._generation += 1
+            for user_id in user_ids or ():
+                self._id_versions[user_id % ID_VERSION_SLOTS] += 1
+
+    # ------------------------------------------
+    # 読み取り (キャッシュ対象)
+    # ------------------------------------------
+    def get_user(self, user_id: int, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        user_id = int(user_id)
+        key = self._id_key("get_user", user_id, tuple(columns) if columns is not None else None)
+        return self._cached("get_user", key, lambda: self.inner.get_user(user_id, columns))
+
+    def get_users(self, user_ids: List[int], columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        # 一括操作の直前の読み取りで、IDの組み合わせごとの結果は再利用されないためキャッシュしない
+        return self.inner.get_users(user_ids, columns)
+
+    def list_users(self) -> List[Dict[str, Any]]:
+        return self._cached("list_users", self._table_key("list_users"), self.inner.list_users)
+
+    def list_users_changed_since(self, since: datetime.datetime) -> List[Dict[str, Any]]:
+        # 差分の取り込みは呼び出しごとに時刻が異なり、同じ結果を再利用しないためキャッシュしない
+        return self.inner.list_users_changed_since(since)
+
+    def count_users(self, name: Optional[str] = None, s_date: Optional[str] = None) -> int:
+        name, s_date = name or None, s_date or None
+        return self._cached("count_users", self._table_key("count_users", name, s_date),
+                            lambda: self.inner.count_users(name, s_date))
+
+    def list_users_page(self, limit: int, offset: int = 0, after_id: Optional[int] = None,
+                        name: Optional[str] = None, s_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        name, s_date = name or None, s_date or None
+        if after_id is not None:
+            offset = 0  # キーセットページングでは offset を使用しないため、キーを揃える
+        key = self._table_key("list_users_page", limit, offset, after_id, name, s_date)
+        return self._cached("list_users_page", key,
+                            lambda: self.inner.list_users_page(limit, offset, after_id, name, s_date))
+
+    def count_by_delivery_date(self):
+        return self._cached("count_by_delivery_date", self._table_key("count_by_delivery_date"),
+                            self.inner.count_by_delivery_date)
+
+    def iter_users(self, columns: Optional[List[str]] = None, name: Optional[str] = None,
+                   s_date: Optional[str] = None, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        # エクスポートは全件を読むためキャッシュしない
+        return self.inner.iter_users(columns, name, s_date, page_size)
+
+    def list_companies(self) -> List[Dict[str, Any]]:
+        # 会社一覧は utils.util の company_directory がキャッシュ済み
+        return self.inner.list_companies()
+
+    def get_max_id(self) -> int:
+        return self.inner.get_max_id()
+
+    def list_changes(self, user_id: int) -> List[Dict[str, Any]]:
+        return self.inner.list_changes(user_id)
+
+    # ------------------------------------------
+    # 書き込み (実行後に該当するキャッシュを無効化)
+    # ------------------------------------------
+    def reserve_ids(self, count: int) -> int:
+        return self.inner.reserve_ids(count)
+
+    def insert_user(self, row: Dict[str, Any]) -> None:
+        try:
+            self.inner.insert_user(row)
+        finally:
+            self.invalidate()
+
+    def insert_users(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            self.inner.insert_users(rows)
+        finally:
+            self.invalidate()
+
+    def load_users(self, source: IO[bytes], chunk_size: int = 500) -> int:
+        try:
+            return self.inner.load_users(source, chunk_size)
+        finally:
+            self.invalidate()
+
+    def update_user(self, user_id: int, fields: Dict[str, Any]) -> None:
+        try:
+            self.inner.update_user(user_id, fields)
+        finally:
+            self.invalidate([int(user_id)])
+
+    def update_users(self, changes: Dict[int, Dict[str, Any]],
+                     columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        try:
+            return self.inner.update_users(changes, columns)
+        finally:
+            self.invalidate([int(i) for i in changes])
+
+    def mark_deleted(self, user_id: int) -> None:
+        try:
+            self.inner.mark_deleted(user_id)
+        finally:
+            self.invalidate([int(user_id)])
+
+    def compact_changes(self) -> int:
+        # 変更履歴を申請者テーブルへ反映するだけで、読み取り結果(最新の状態)は変わらない
+        return self.inner.compact_changes()
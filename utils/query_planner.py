@@ -0,0 +1,135 @@
+import time
+import logging
+import threading
+import contextvars
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.metrics import REGISTRY
+
+# utils.util と同じルートロガーを使用 (循環importを避けるため直接取得)
+logger = logging.getLogger()
+
+# ==========================================
+# クエリの処理量の見積もりと上限 (BigQuery)
+# ==========================================
+# テーブルの急な増加や広い範囲の LIKE 検索で、気付かないうちに処理量(課金額)の大きいクエリにならないよう、
+# 読み取りクエリ(SELECT / WITH)の実行前に、クエリの形(パラメータを除いたSQL文)ごとに1回だけ
+# ドライランで処理量を見積もり、画面(Flaskのエンドポイント)ごとの上限と比較する。
+#   - 見積もりは形ごとに保持し、PLAN_TTL 秒ごとに見積もり直す (テーブルの増加に追従)
+#   - 上限超過時は警告ログを出力し、enforce=True の場合は実行せずに QueryBudgetExceeded を送出する
+#     (enforce=True では maximum_bytes_billed も設定し、見積もり後の増加分もBigQuery側で拒否させる)
+#   - 読み取りクエリはBigQueryのクエリキャッシュを明示的に使用する
+#     (参照先のテーブル/ビューの元テーブルが更新されるとキャッシュは無効になるため、結果は常に最新)
+# ドライランの見積もりはクラスタリングによる絞り込みを含まない上限値のため、実際の処理量はこれより小さい場合がある。
+# DML・DDL・スクリプト(複数文)は見積もり/上限の対象外とする。
+
+# リクエスト外(バックグラウンドの再読み込み等)で実行したクエリの画面名
+BACKGROUND_ROUTE = "background"
+
+# BigQueryは参照するテーブルごとに最低10MB分を課金するため、maximum_bytes_billed はこれを下回らないようにする
+MIN_BILLED_PER_TABLE = 10 << 20
+
+PLANNED_QUERIES = REGISTRY.counter(
+    "multicloud_query_budget_checks_total", "Read queries checked against the per-route byte budget",
+    ("route", "operation", "result"))
+
+# 実行中の画面名 (main.py の before_request で設定)
+_route: "contextvars.ContextVar[str]" = contextvars.ContextVar("query_route", default=BACKGROUND_ROUTE)
+
+
+class QueryBudgetExceeded(Exception):
+    """見積もりの処理量が画面ごとの上限を超えたため、クエリを実行しなかった"""
+
+
+def enter_route(endpoint: Optional[str]) -> contextvars.Token:
+    return _route.set(endpoint or BACKGROUND_ROUTE)
+
+
+def leave_route(token: contextvars.Token) -> None:
+    _route.reset(token)
+
+
+def parse_bytes(value: str) -> int:
+    """'500MB' / '1GB' / '1048576' などを バイト数へ (単位は1024倍)"""
+    text = value.strip().upper().removesuffix("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def parse_budgets(value: str) -> Dict[str, int]:
+    """'search_users=200MB,list_users=50MB' を {画面名: バイト数} へ"""
+    budgets = {}
+    for item in filter(None, (v.strip() for v in value.split(","))):
+        route, _, size = item.partition("=")
+        budgets[route.strip()] = parse_bytes(size)
+    return budgets
+
+
+def is_read_query(query: str) -> bool:
+    """見積もりの対象とする単一の読み取りクエリか"""
+    text = query.strip().rstrip(";")
+    if ";" in text:
+        return False  # スクリプト(複数文)
+    return text[:6].upper() == "SELECT" or text[:4].upper() == "WITH"
+
+
+class QueryPlanner:
+    """読み取りクエリの処理量の見積もり(形ごとに保持)と、画面ごとの上限の確認"""
+
+    PLAN_TTL = 3600.0
+
+    def __init__(self, dry_run: Callable[[str, Any], Any], default_budget: int,
+                 route_budgets: Optional[Dict[str, int]] = None, enforce: bool = False):
+        """
+        dry_run: (クエリ, ジョブ設定) を受け取り、ドライランのジョブ(total_bytes_processed / referenced_tables)を返す関数
+        default_budget: route_budgets に無い画面の1クエリあたりの上限(バイト)。0以下なら上限なし
+        """
+        self._dry_run = dry_run
+        self.default_budget = default_budget
+        self.route_budgets = dict(route_budgets or {})
+        self.enforce = enforce
+        self._estimates: Dict[str, Tuple[int, int, float]] = {}  # クエリ -> (見積もり, 参照テーブル数, 見積もり時刻)
+        self._lock = threading.Lock()
+
+    def budget_for(self, route: str) -> int:
+        return self.route_budgets.get(route, self.default_budget)
+
+    def estimate(self, query: str, job_config: Any) -> Tuple[int, int]:
+        """クエリの形ごとの (見積もりの処理量, 参照テーブル数)。未見積もり/期限切れの場合のみドライランを実行"""
+        with self._lock:
+            entry = self._estimates.get(query)
+        if entry is not None and time.monotonic() - entry[2] < self.PLAN_TTL:
+            return entry[0], entry[1]
+        job = self._dry_run(query, job_config)
+        estimated, tables = int(job.total_bytes_processed or 0), len(job.referenced_tables or ())
+        with self._lock:
+            self._estimates[query] = (estimated, tables, time.monotonic())
+        return estimated, tables
+
+    def prepare(self, query: str, job_config: Any, op: str) -> None:
+        """
+        実行前の確認とジョブ設定 (読み取りクエリ以外は何もしない)
+        上限超過時は警告ログを出力し、enforce=True なら QueryBudgetExceeded を送出する
+        """
+        if not is_read_query(query):
+            return
+        job_config.use_query_cache = True
+        route = _route.get()
+        budget = self.budget_for(route)
+        if budget <= 0:
+            return
+        estimated, tables = self.estimate(query, job_config)
+        if self.enforce:
+            job_config.maximum_bytes_billed = max(budget, MIN_BILLED_PER_TABLE * max(tables, 1))
+        if estimated <= budget:
+            PLANNED_QUERIES.inc(route=route, operation=op, result="ok")
+            return
+        message = f"クエリの見積もり処理量が上限を超えています: {route}/{op} {estimated:,} > {budget:,} bytes"
+        if self.enforce:
+            PLANNED_QUERIES.inc(route=route, operation=op, result="refused")
+            logger.error(message)
+            raise QueryBudgetExceeded(message)
+        PLANNED_QUERIES.inc(route=route, operation=op, result="over_budget")
+        logger.warning(message)
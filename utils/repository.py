@@ -0,0 +1,256 @@
+import json
+import datetime
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+# ==========================================
+# 申請者テーブル/会社テーブルへのデータアクセス (リポジトリ層)
+# ==========================================
+# main.py / Utils はSQLを直接組み立てず、このインターフェース経由でデータへアクセスする。
+# 実装は utils.util の STORAGE_BACKEND で切り替える。
+#   - bigquery: utils.bigquery_repository.BigQueryUserRepository (本番)
+#   - sqlite  : utils.local_repository.SQLiteUserRepository (ローカル検証/ベンチマーク用)
+#
+# 申請者の更新(管理者の編集・承認・論理削除)は、変更内容を1件の変更履歴(変更したカラムと値・日時)として
+# 変更履歴テーブルへ追記する。読み取りは申請者テーブルに未反映の変更履歴を重ねた最新の状態を返す。
+# (BigQueryでは行を書き換えるUPDATEを行わず、変更履歴は compact_changes() でまとめて申請者テーブルへ反映する)
+
+# 申請者テーブルのカラムと型 (BigQueryのパラメータ型名で記載)
+USER_COLUMN_TYPES: Dict[str, str] = {
+    'id': 'INTEGER',
+    'name': 'STRING',
+    'desired_delivery_date': 'DATE',
+    'tel': 'STRING',
+    'email': 'STRING',
+    'belonging_department': 'STRING',
+    'company_id': 'INTEGER',
+    'project_name': 'STRING',
+    'system_name': 'STRING',
+    'type': 'STRING',
+    'memo': 'STRING',
+    'insert_date': 'DATE',
+    'UPDATE_FLG': 'STRING',
+    'project_id_gcp': 'STRING',
+    'manage_company_name': 'STRING',
+    'organization_name': 'STRING',
+    'project_name_gcp': 'STRING',
+    'group_name': 'STRING',
+    'group_email': 'STRING',
+    'user_group_name': 'STRING',
+    'user_group_email': 'STRING',
+    'env': 'STRING',
+    'use_purpose': 'STRING',
+    'subnet_info': 'STRING',
+    'client_cidr': 'STRING',
+    'domain_name': 'STRING',
+    'vpc_access_conn': 'STRING',
+    'connector_cidr': 'STRING',
+}
+
+# 読み取りは SELECT * を使わず、画面ごとに必要なカラムだけを指定する (BigQueryは読み取ったカラム分だけ課金される)
+
+# 申請者1件の全カラム (カラム未指定時)
+USER_DETAIL_COLUMNS: List[str] = list(USER_COLUMN_TYPES)
+
+# 一覧画面で表示するカラム
+USER_LIST_COLUMNS: List[str] = [
+    'id', 'name', 'desired_delivery_date', 'tel', 'email', 'belonging_department',
+    'project_name', 'type', 'project_id_gcp', 'UPDATE_FLG',
+]
+
+# 編集画面で表示するカラム (会社名の表示用に company_id を含む)
+USER_EDIT_COLUMNS: List[str] = [
+    'id', 'name', 'desired_delivery_date', 'tel', 'email', 'belonging_department', 'company_id',
+    'project_name', 'system_name', 'type', 'memo', 'insert_date', 'UPDATE_FLG',
+    'manage_company_name', 'organization_name', 'project_name_gcp', 'group_name', 'group_email',
+    'user_group_name', 'user_group_email', 'env', 'use_purpose', 'subnet_info', 'client_cidr',
+    'domain_name', 'vpc_access_conn', 'connector_cidr',
+]
+
+# 削除確認画面で表示するカラム
+USER_DELETE_COLUMNS: List[str] = [
+    'id', 'company_id', 'project_name', 'system_name', 'type', 'UPDATE_FLG',
+    'manage_company_name', 'organization_name', 'project_name_gcp', 'env', 'use_purpose',
+    'subnet_info', 'client_cidr',
+]
+
+# 払い出し先(GitHub URL / プロジェクトID)の算出に使うカラム
+USER_TARGET_COLUMNS: List[str] = ['manage_company_name', 'organization_name', 'project_name_gcp', 'env', 'use_purpose']
+
+# 論理削除時のフラグ値
+DELETED_FLG = 'DLT'
+
+# 変更履歴のみが持つカラム (変更したカラム名のカンマ区切り / 変更日時)
+CHANGE_META_COLUMNS: List[str] = ['changed_fields', 'changed_at']
+
+
+def check_columns(columns: Optional[List[str]]) -> List[str]:
+    """読み取るカラム (未指定なら全カラム。id は常に含める。未知のカラムは ValueError)"""
+    if columns is None:
+        return USER_DETAIL_COLUMNS
+    unknown = set(columns) - set(USER_COLUMN_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown columns: {sorted(unknown)}")
+    return list(columns) if 'id' in columns else ['id'] + list(columns)
+
+
+def check_update_columns(changes: Dict[int, Dict[str, Any]]) -> List[str]:
+    """更新するカラム名の一覧 (未知のカラム / id の更新 / 更新内容が空の場合は ValueError)"""
+    columns = sorted({c for fields in changes.values() for c in fields})
+    if not columns:
+        raise ValueError("No fields to update")
+    unknown = set(columns) - set(USER_COLUMN_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown columns: {sorted(unknown)}")
+    if 'id' in columns:
+        raise ValueError("id cannot be updated")
+    return columns
+
+
+class UserRepository:
+    """申請者/会社データへのアクセスインターフェース"""
+
+    # ------------------------------------------
+    # 申請者 (CRUD)
+    # ------------------------------------------
+    def get_max_id(self) -> int:
+        """申請者IDの最大値 (0件なら0)"""
+        raise NotImplementedError
+
+    def reserve_ids(self, count: int) -> int:
+        """
+        採番テーブルから連続したID count 件分を予約し、その先頭IDを返す (1回の往復で完結)
+        採番テーブルが未作成/未初期化の場合は、申請者テーブルの MAX(id)+1 から開始する
+        """
+        raise NotImplementedError
+
+    def insert_user(self, row: Dict[str, Any]) -> None:
+        """申請者を1件登録 (row のキーは USER_COLUMN_TYPES のカラム名)"""
+        raise NotImplementedError
+
+    def insert_users(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        申請者を複数件まとめて登録 (実装側で1回の書き込みにまとめる)
+        書き込み後の応答待ちでの失敗・スプールからの復旧で同じ行が再送されるため、登録済みのidの行は登録しない
+        """
+        existing = {user['id'] for user in self.get_users([row['id'] for row in rows], ['id'])} if rows else set()
+        for row in rows:
+            if row['id'] not in existing:
+                self.insert_user(row)
+
+    def load_users(self, source: IO[bytes], chunk_size: int = 500) -> int:
+        """
+        改行区切りJSON(1行1件、キーはカラム名)のファイルから申請者を一括登録し、登録件数を返す
+        既定の実装は chunk_size 件ずつ insert_users する (BigQueryは1回のロードジョブで登録)
+        """
+        loaded = 0
+        chunk: List[Dict[str, Any]] = []
+        for line in source:
+            if not line.strip():
+                continue
+            chunk.append(json.loads(line))
+            if len(chunk) >= chunk_size:
+                self.insert_users(chunk)
+                loaded += len(chunk)
+                chunk = []
+        if chunk:
+            self.insert_users(chunk)
+            loaded += len(chunk)
+        return loaded
+
+    def get_user(self, user_id: int, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """IDで申請者を1件取得 (columns のカラムのみ。未指定なら全カラム。存在しなければNone)"""
+        raise NotImplementedError
+
+    def get_users(self, user_ids: List[int], columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """IDで申請者を複数件取得 (id昇順。存在しないIDは含まない。実装側で1回の読み取りにまとめる)"""
+        rows = [self.get_user(user_id, columns) for user_id in user_ids]
+        return sorted((row for row in rows if row is not None), key=lambda row: row['id'])
+
+    def update_user(self, user_id: int, fields: Dict[str, Any]) -> None:
+        """指定カラムを更新"""
+        raise NotImplementedError
+
+    def update_users(self, changes: Dict[int, Dict[str, Any]],
+                     columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        複数の申請者をまとめて更新し、更新後の行の columns のカラムを返す (id昇順。存在しないIDは含まない)
+        changes は {id: {カラム名: 値}}。行ごとに異なるカラムを更新できる (実装側で1回の書き込みにまとめる)
+        """
+        updated = []
+        for user_id, fields in changes.items():
+            self.update_user(user_id, fields)
+            row = self.get_user(user_id, columns)
+            if row is not None:
+                updated.append(row)
+        return sorted(updated, key=lambda row: row['id'])
+
+    def mark_deleted(self, user_id: int) -> None:
+        """論理削除 (UPDATE_FLG = 'DLT')"""
+        self.update_user(user_id, {'UPDATE_FLG': DELETED_FLG})
+
+    def list_changes(self, user_id: int) -> List[Dict[str, Any]]:
+        """
+        申請者の変更履歴 (古い順)
+        各要素は changed_at / changed_fields(カンマ区切り) と、変更したカラムの変更後の値
+        """
+        raise NotImplementedError
+
+    def compact_changes(self) -> int:
+        """申請者テーブルへ未反映の変更履歴を反映し、反映した申請者の件数を返す (変更履歴自体は残す)"""
+        return 0
+
+    # ------------------------------------------
+    # 申請者 (一覧/検索)
+    # ------------------------------------------
+    def list_users(self) -> List[Dict[str, Any]]:
+        """全申請者の一覧 (id降順)"""
+        raise NotImplementedError
+
+    def list_users_changed_since(self, since: datetime.datetime) -> List[Dict[str, Any]]:
+        """
+        since 以降に登録又は変更された申請者の一覧 (検索用インデックスの差分取り込み用)
+        IDはインスタンスごとにブロック単位で払い出されるため、idの大小ではなく登録日・変更履歴で判定する
+        登録日(insert_date)は日付のみのため、since の前日以降の登録分をすべて返す (取り込み済みの行を含んでよい)
+        """
+        raise NotImplementedError
+
+    def count_users(self, name: Optional[str] = None, s_date: Optional[str] = None) -> int:
+        """条件に一致する申請者の件数"""
+        raise NotImplementedError
+
+    def list_users_page(self, limit: int, offset: int = 0, after_id: Optional[int] = None,
+                        name: Optional[str] = None, s_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        条件に一致する申請者を1ページ分取得 (id降順)
+        after_id 指定時は id < after_id のキーセットページング (offsetは無視)
+        """
+        raise NotImplementedError
+
+    def count_by_delivery_date(self) -> List[Tuple[datetime.date, int]]:
+        """引き渡し希望日ごとの件数 (日付の昇順。日付未設定の行は含まない)"""
+        raise NotImplementedError
+
+    def iter_users(self, columns: Optional[List[str]] = None, name: Optional[str] = None,
+                   s_date: Optional[str] = None, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        条件に一致する申請者を id降順で1件ずつ返す (エクスポート用)
+        page_size 件ずつ取得するため、メモリ使用量は件数に依存しない。クエリの失敗は呼び出し時点で送出する
+        """
+        raise NotImplementedError
+
+    # ------------------------------------------
+    # 会社
+    # ------------------------------------------
+    def list_companies(self) -> List[Dict[str, Any]]:
+        """会社一覧 ([{company_id, company_name}, ...])"""
+        raise NotImplementedError
+
+
+def to_date(value: Any) -> Optional[datetime.date]:
+    """'YYYY-MM-DD'文字列/date/datetimeをdateへ揃える (空ならNone)"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime.date):
+        # datetime や pendulum.Date などのサブクラスも素のdateへ揃える
+        return datetime.date(value.year, value.month, value.day)
+    return datetime.date.fromisoformat(str(value))
@@ -0,0 +1,156 @@
+import time
+import uuid
+import hashlib
+import datetime
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from flask import Response, g, has_request_context, make_response, request
+from markupsafe import Markup
+
+from utils.metrics import REGISTRY
+
+# ==========================================
+# 条件付きGET (ETag / 304) と描画済みの部分HTMLのキャッシュ
+# ==========================================
+# 申請者データの世代(DataGeneration)は、書き込み(Utils.notify_users_changed)のたびに増える。
+# 一覧・検索・登録フォームのETagは、URL・世代・画面固有の値(検索条件など)から画面を描画せずに算出するため、
+# ブラウザの If-None-Match が一致すれば、BigQueryへの問い合わせも描画も行わずに304を返す。
+# 他インスタンスでの書き込みは世代に反映されないため、世代には max_age 秒ごとに切り替わる時間枠を含める
+# (読み取り結果のキャッシュ・検索インデックスの更新間隔と同程度にし、表示の遅れがそれ以上にならないようにする)。
+# ETagにはプロセスの起動ごとの値も含める (デプロイでテンプレートが変わった場合に古い画面を返さない)。
+# 会社一覧のみに依存する画面(登録フォーム)は、申請者データの世代ではなく会社一覧のスナップショットの版を世代とする。
+# 障害で一部を欠いた画面(読み取りに失敗して空の一覧を返す場合など)は skip() でETagを付けず、描画済みHTMLも保持しない。
+
+CONDITIONAL_REQUESTS = REGISTRY.counter(
+    "multicloud_http_conditional_total", "Conditional GET handling (not_modified: answered with 304)",
+    ("endpoint", "result"))
+
+# プロセスの起動ごとの値
+_BOOT_ID = uuid.uuid4().hex[:8]
+
+
+class DataGeneration:
+    """申請者データの世代 (書き込みのたびに増加) と、その最終更新時刻"""
+
+    def __init__(self, max_age: float = 30.0):
+        self.max_age = max_age
+        self.value = 0
+        self.changed_at = time.time()
+        self._lock = threading.Lock()
+
+    def bump(self) -> None:
+        with self._lock:
+            self.value += 1
+            self.changed_at = time.time()
+
+    def token(self) -> str:
+        """ETagの元になる値 (起動ID・世代・時間枠)"""
+        window = int(time.time() // self.max_age) if self.max_age > 0 else 0
+        return f"{_BOOT_ID}-{self.value}-{window}"
+
+    def last_modified(self) -> datetime.datetime:
+        """最終更新時刻 (時間枠の開始時刻の方が新しければそちら)"""
+        latest = self.changed_at
+        if self.max_age > 0:
+            latest = max(latest, time.time() // self.max_age * self.max_age)
+        return datetime.datetime.fromtimestamp(int(latest), datetime.timezone.utc)
+
+
+class SnapshotGeneration:
+    """スナップショット(RefreshingSnapshot)の版を世代とする (スナップショットの内容のみに依存する画面用)"""
+
+    def __init__(self, snapshot: Any):
+        self.snapshot = snapshot
+
+    def token(self) -> str:
+        # 未取得ならここで取得し、画面の描画中に版が変わらないようにする
+        self.snapshot.get()
+        return f"{_BOOT_ID}-{self.snapshot.version}"
+
+    def last_modified(self) -> datetime.datetime:
+        replaced_at = self.snapshot.replaced_at
+        return datetime.datetime.fromtimestamp(int(replaced_at or time.time()), datetime.timezone.utc)
+
+
+class FragmentCache:
+    """描画済みの部分HTMLを、元データの版(version)が同じ間だけ再利用する (LRU)"""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Markup]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Any, render: Callable[[], Markup]) -> Markup:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+        html = Markup(render())
+        if skipped():
+            return html  # 障害で一部を欠いた描画は再利用しない
+        with self._lock:
+            self._entries[key] = (version, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def skip() -> None:
+    """
+    このリクエストの応答にETagを付けない (エラー画面や、障害で一部を欠いた画面を200で返す場合など)
+    リクエスト外(バックグラウンドの読み込み等)では何もしない
+    """
+    if has_request_context():
+        g.response_cache_skip = True
+
+
+def skipped() -> bool:
+    return has_request_context() and g.get("response_cache_skip", False)
+
+
+def conditional(generation: Any, key: Optional[Callable[[], Tuple]] = None,
+                enabled: bool = True) -> Callable:
+    """
+    GETの応答にETag / Last-Modified を付け、If-None-Match が一致すれば画面を描画せずに304を返すデコレーター
+    generation: 世代 (DataGeneration 又は SnapshotGeneration)
+    key: URL以外に応答の内容を左右する値 (セッションの検索条件など) を返す関数
+    """
+    def decorator(view: Callable) -> Callable:
+        if not enabled:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            parts = (request.full_path, generation.token()) + (key() if key is not None else ())
+            etag = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+            last_modified = generation.last_modified()
+            endpoint = request.endpoint or "unmatched"
+
+            if etag in request.if_none_match:
+                CONDITIONAL_REQUESTS.inc(endpoint=endpoint, result="not_modified")
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or g.pop("response_cache_skip", False):
+                    CONDITIONAL_REQUESTS.inc(endpoint=endpoint, result="uncached")
+                    return response
+                CONDITIONAL_REQUESTS.inc(endpoint=endpoint, result="rendered")
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # ブラウザには保持させつつ、表示のたびに If-None-Match で確認させる
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
+
@@ -0,0 +1,171 @@
+import sys
+import json
+import argparse
+import datetime
+from typing import Any, Dict, List, Optional
+
+from utils.repository import USER_COLUMN_TYPES
+from utils.util import bigquery_client, logger, project, dataset, table
+
+# ==========================================
+# 申請者テーブルの構成 (パーティション・クラスタリング)
+# ==========================================
+# BigQueryは読み取ったカラム・ブロックの分だけ処理(課金)されるため、申請者テーブルを
+#   - insert_date (登録日) の月単位のパーティション
+#   - id, name, UPDATE_FLG のクラスタリング (id指定の1件取得・検索・フラグでの絞り込みで読み取るブロックを限定)
+# で作成する。読み取り側は SELECT * を使わず、必要なカラムだけを指定する (utils.repository 参照)。
+# 登録件数は多くないため、日単位ではなく月単位のパーティションとする (小さなパーティションの増加を避ける)。
+#
+# CLI:
+#   python -m utils.schema show                 現在の構成を表示
+#   python -m utils.schema migrate [--dry-run]  申請者テーブルを作成/上記の構成へ移行
+#
+# パーティションは既存のテーブルに後から設定できないため、移行時は新しい構成のテーブルへ全件をコピーし、
+# 旧テーブルを {TABLE_ID}_backup_YYYYMMDDHHMMSS へ、新テーブルを {TABLE_ID} へ名前を変更する。
+# コピーから名前の変更までの間の書き込みは旧テーブルに残るため、移行は書き込みを止めて実行すること。
+# BigQueryのトランザクションはテーブルの作成・名前の変更(DDL)を含められないため、途中で失敗した場合は
+# 次回の migrate で {TABLE_ID}_migrating の有無から状態を判定し、作り直しを戻す/完了させる。
+#   - 旧テーブルが残っている (名前の変更前に失敗) : コピー途中のテーブルを削除し、作り直しをやり直す
+#   - 旧テーブルが無い (退避後に失敗)             : コピー済みのテーブルを {TABLE_ID} へ名前を変更する
+
+USERS_PARTITION_FIELD = 'insert_date'
+USERS_PARTITION_TYPE = 'MONTH'
+USERS_CLUSTERING_FIELDS = ['id', 'name', 'UPDATE_FLG']
+
+# 変更履歴テーブル: 最新の状態のビューは未反映(compacted_at IS NULL)の行のみを集計するため、先頭に compacted_at を置く
+CHANGES_CLUSTERING_FIELDS = ['compacted_at', 'id']
+
+
+def users_table_id() -> str:
+    return f"{project}.{dataset}.{table}"
+
+
+def build_users_table(table_id: str):
+    """申請者テーブルの定義 (カラム・パーティション・クラスタリング)"""
+    from google.cloud import bigquery
+    users = bigquery.Table(table_id, schema=[bigquery.SchemaField(c, t) for c, t in USER_COLUMN_TYPES.items()])
+    users.time_partitioning = bigquery.TimePartitioning(type_=USERS_PARTITION_TYPE, field=USERS_PARTITION_FIELD)
+    users.clustering_fields = USERS_CLUSTERING_FIELDS
+    return users
+
+
+def describe(users) -> Dict[str, Any]:
+    """テーブルの構成 (表示・比較用)"""
+    partitioning = users.time_partitioning
+    return {
+        'table': users.full_table_id,
+        'partitioning': {'type': partitioning.type_, 'field': partitioning.field} if partitioning else None,
+        'clustering': users.clustering_fields,
+        'rows': users.num_rows,
+        'bytes': users.num_bytes,
+    }
+
+
+def _migrating_id(table_id: str) -> str:
+    return f"{table_id}_migrating"
+
+
+def _rebuild_script(table_id: str, backup_name: str) -> str:
+    """新しい構成のテーブルへ全件をコピーし、名前を入れ替えるスクリプト"""
+    new_id = _migrating_id(table_id)
+    columns = ", ".join(USER_COLUMN_TYPES)
+    return f"""
+        CREATE TABLE `{new_id}`
+        PARTITION BY DATE_TRUNC({USERS_PARTITION_FIELD}, {USERS_PARTITION_TYPE})
+        CLUSTER BY {', '.join(USERS_CLUSTERING_FIELDS)}
+        AS SELECT {columns} FROM `{table_id}`;
+        ALTER TABLE `{table_id}` RENAME TO `{backup_name}`;
+        ALTER TABLE `{new_id}` RENAME TO `{table}`;
+    """
+
+
+def _recover_rebuild(table_id: str, dry_run: bool = False) -> List[str]:
+    """前回の作り直しが途中で失敗していれば、戻す/完了させる (実施した操作の一覧を返す)"""
+    from google.api_core.exceptions import NotFound
+    migrating_id = _migrating_id(table_id)
+    try:
+        bigquery_client.get_table(migrating_id)
+    except NotFound:
+        return []
+    try:
+        bigquery_client.get_table(table_id)
+    except NotFound:
+        # 旧テーブルの退避後に失敗: コピーは完了しているため、本来の名前へ変更して作り直しを完了させる
+        if not dry_run:
+            bigquery_client.query(f"ALTER TABLE `{migrating_id}` RENAME TO `{table}`").result()
+        return [f"resume rebuild: rename {migrating_id} to {table}"]
+    # 名前の変更前に失敗: 旧テーブルがそのまま使われているため、コピー途中のテーブルを破棄する
+    if not dry_run:
+        bigquery_client.delete_table(migrating_id)
+    return [f"drop incomplete copy {migrating_id}"]
+
+
+def migrate(dry_run: bool = False) -> List[str]:
+    """
+    申請者テーブルを作成、又は現在の構成へ移行し、実施した(dry_run では実施する)操作の一覧を返す
+      - テーブルが無い: 作成
+      - カラムが足りない: 追加 (NULL許容)
+      - パーティションが異なる: 全件コピーで作り直し (旧テーブルはバックアップとして残す)
+      - クラスタリングのみ異なる: 設定を変更 (以降に書き込まれるデータから適用)
+    前回の作り直しが途中で失敗している場合は、先にその状態を戻す/完了させる
+    """
+    from google.api_core.exceptions import NotFound
+    table_id = users_table_id()
+    actions = _recover_rebuild(table_id, dry_run)
+    try:
+        users = bigquery_client.get_table(table_id)
+    except NotFound:
+        if actions:
+            return actions  # dry_run: 作り直しの完了(名前の変更)を実施していないため、以降は判定できない
+        if not dry_run:
+            bigquery_client.create_table(build_users_table(table_id))
+        return [f"create {table_id}"]
+
+    missing = [c for c in USER_COLUMN_TYPES if c not in {f.name for f in users.schema}]
+    if missing:
+        actions.append(f"add columns {missing}")
+        if not dry_run:
+            from google.cloud import bigquery
+            users.schema = list(users.schema) + [bigquery.SchemaField(c, USER_COLUMN_TYPES[c]) for c in missing]
+            users = bigquery_client.update_table(users, ["schema"])
+
+    partitioning = users.time_partitioning
+    if (partitioning is None or partitioning.field != USERS_PARTITION_FIELD
+            or partitioning.type_ != USERS_PARTITION_TYPE):
+        backup_name = f"{table}_backup_{datetime.datetime.now():%Y%m%d%H%M%S}"
+        actions.append(f"rebuild {table_id} (backup: {backup_name})")
+        if not dry_run:
+            bigquery_client.query(_rebuild_script(table_id, backup_name)).result()
+    elif users.clustering_fields != USERS_CLUSTERING_FIELDS:
+        actions.append(f"set clustering {USERS_CLUSTERING_FIELDS}")
+        if not dry_run:
+            users.clustering_fields = USERS_CLUSTERING_FIELDS
+            bigquery_client.update_table(users, ["clustering_fields"])
+    return actions
+
+
+# ==========================================
+# CLI
+# ==========================================
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="申請者テーブルの構成(パーティション・クラスタリング)の確認/移行")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("show", help="現在の構成を表示する")
+    migrate_parser = sub.add_parser("migrate", help="申請者テーブルを作成/現在の構成へ移行する")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="実施する操作の表示のみ行う")
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        print(json.dumps(describe(bigquery_client.get_table(users_table_id())), ensure_ascii=False))
+        return 0
+
+    actions = migrate(dry_run=args.dry_run)
+    for action in actions or ["(変更なし)"]:
+        print(action)
+    if actions and not args.dry_run:
+        logger.info(f"申請者テーブルの移行: {actions}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
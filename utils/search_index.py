@@ -0,0 +1,184 @@
+import datetime
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.repository import USER_LIST_COLUMNS, to_date
+
+# ==========================================
+# 申請者一覧の検索用インデックス (プロセス内)
+# ==========================================
+# 検索のたびに name LIKE '%...%' でテーブルを全件走査しないよう、一覧表示用のカラムだけをメモリに保持し、
+#   - 氏名: 1文字/2文字のn-gram -> id の転置索引 (候補を絞り込んだ後に部分一致で確認)
+#   - 引き渡し希望日: 日付 -> id の索引
+# で検索・並べ替え(id降順)・ページングをメモリ上で行う。
+# 初回に全件を読み込み、以降は前回の取り込み(synced_at)以降に登録・変更された行と、このプロセスで書き込んだ行だけを反映する。
+# IDはインスタンスごとにブロック単位で払い出されるため、新規行はidの大小ではなく登録日・変更履歴で判定する
+# (utils.util 側で一定間隔ごとに全件を再読み込みし、差分で漏れた変更も取り込む)。
+# 同じ検索条件でのページ移動に備え、条件ごとの結果(id降順)を索引が変わるまで保持する。
+
+# 検索結果を保持する検索条件の数
+RESULT_CACHE_SIZE = 64
+
+# 絞り込み後の候補が全件のこの割合を超える場合は、索引の積集合ではなく全件を順に確認する
+SCAN_RATIO = 0.25
+
+
+def _grams(name: str) -> Set[str]:
+    """氏名の1文字/2文字の部分文字列 (検索語の長さに応じて使い分ける)"""
+    grams = set(name)
+    grams.update(name[i:i + 2] for i in range(len(name) - 1))
+    return grams
+
+
+class UserSearchIndex:
+    """申請者の氏名/引き渡し希望日による検索をメモリ上で行う索引"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        self._names: Dict[str, Set[int]] = defaultdict(set)
+        self._dates: Dict[datetime.date, Set[int]] = defaultdict(set)
+        self._ids_desc: Optional[List[int]] = None  # 全件のid降順 (変更時に破棄して再計算)
+        self._results: "OrderedDict[tuple, List[int]]" = OrderedDict()  # 検索条件 -> 一致したid(降順)
+        self._date_counts: Optional[List[Tuple[datetime.date, int]]] = None  # 日付ごとの件数 (変更時に破棄)
+        self.synced_at: Optional[datetime.datetime] = None  # 最後に取り込んだ時点 (差分の取り込みの起点)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ------------------------------------------
+    # 更新
+    # ------------------------------------------
+    def load(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """全件を読み込み直す (索引は作り直してから差し替えるため、読み込み中も検索できる)"""
+        fresh = UserSearchIndex()
+        fresh.apply(rows)
+        with self._lock:
+            self._rows, self._names, self._dates = fresh._rows, fresh._names, fresh._dates
+            self._ids_desc = None
+            self._results.clear()
+            self._date_counts = None
+
+    def apply(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        行の追加/置き換えを反映 (各行は登録時・読み込み時の完全な行。含まれないカラムは None とする)
+        """
+        with self._lock:
+            self._results.clear()
+            self._date_counts = None
+            for row in rows:
+                self._put(int(row['id']), {c: None for c in USER_LIST_COLUMNS}, row)
+
+    def update(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        登録済みの行へ変更を反映し、反映した件数を返す (各行は id と変更したカラムのみ)
+        未登録のidは他のカラムが分からないため反映しない (次回の差分の取り込みで完全な行を取り込む)
+        """
+        applied = 0
+        with self._lock:
+            self._results.clear()
+            self._date_counts = None
+            for row in rows:
+                user_id = int(row['id'])
+                current = self._rows.get(user_id)
+                if current is not None:
+                    self._put(user_id, dict(current), row)
+                    applied += 1
+        return applied
+
+    def _put(self, user_id: int, base: Dict[str, Any], row: Dict[str, Any]) -> None:
+        """base に row の値を重ねた行で索引を置き換える (_lock 下で呼び出す)"""
+        base.update((k, v) for k, v in row.items() if k in base)
+        base['desired_delivery_date'] = to_date(base['desired_delivery_date'])
+        current = self._rows.get(user_id)
+        if current is not None:
+            self._unindex(user_id, current)
+        else:
+            self._ids_desc = None
+        self._rows[user_id] = base
+        self._index(user_id, base)
+
+    def _index(self, user_id: int, row: Dict[str, Any]) -> None:
+        for gram in _grams(row['name'] or ''):
+            self._names[gram].add(user_id)
+        if row['desired_delivery_date'] is not None:
+            self._dates[row['desired_delivery_date']].add(user_id)
+
+    def _unindex(self, user_id: int, row: Dict[str, Any]) -> None:
+        for gram in _grams(row['name'] or ''):
+            ids = self._names.get(gram)
+            if ids is not None:
+                ids.discard(user_id)
+                if not ids:
+                    del self._names[gram]
+        date = row['desired_delivery_date']
+        if date is not None and date in self._dates:
+            self._dates[date].discard(user_id)
+            if not self._dates[date]:
+                del self._dates[date]
+
+    # ------------------------------------------
+    # 検索
+    # ------------------------------------------
+    def search(self, name: Optional[str] = None, s_date: Optional[str] = None,
+               offset: int = 0, limit: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        条件に一致する件数と、id降順で offset 件目から limit 件分の行を返す
+        氏名は大文字小文字を区別する部分一致 (BigQueryの LIKE '%name%' と同じ)
+        """
+        date = to_date(s_date) if s_date else None
+        with self._lock:
+            ids = self._matching_ids(name or None, date)
+            end = None if limit is None else offset + limit
+            return len(ids), [dict(self._rows[i]) for i in ids[offset:end]]
+
+    def _all_ids(self) -> List[int]:
+        if self._ids_desc is None:
+            self._ids_desc = sorted(self._rows, reverse=True)
+        return self._ids_desc
+
+    def _matching_ids(self, name: Optional[str], date: Optional[datetime.date]) -> List[int]:
+        if not name and date is None:
+            return self._all_ids()
+        key = (name, date)
+        ids = self._results.get(key)
+        if ids is not None:
+            self._results.move_to_end(key)
+            return ids
+
+        postings: List[Set[int]] = []
+        if date is not None:
+            postings.append(self._dates.get(date, set()))
+        if name:
+            grams = {name} if len(name) == 1 else {name[i:i + 2] for i in range(len(name) - 1)}
+            postings.extend(self._names.get(g, set()) for g in grams)
+        smallest = min(postings, key=len)
+
+        rows = self._rows
+        if len(smallest) > len(rows) * SCAN_RATIO:
+            # 多くの行に一致する条件では、集合演算と並べ替えより全件を順に確認する方が速い
+            ids = [i for i in self._all_ids()
+                   if (date is None or rows[i]['desired_delivery_date'] == date)
+                   and (not name or name in (rows[i]['name'] or ''))]
+        else:
+            candidates = set(smallest)
+            for posting in postings:
+                if posting is not smallest:
+                    candidates &= posting
+            if name and len(name) > 2:
+                # n-gramの一致だけでは連続して含まれるとは限らないため、部分一致で確認
+                candidates = {i for i in candidates if name in (rows[i]['name'] or '')}
+            ids = sorted(candidates, reverse=True)
+
+        self._results[key] = ids
+        while len(self._results) > RESULT_CACHE_SIZE:
+            self._results.popitem(last=False)
+        return ids
+
+    def date_counts(self) -> List[Tuple[datetime.date, int]]:
+        """引き渡し希望日ごとの件数 (日付の昇順)。日付の索引から数えるため、行数ではなく日付の種類数に比例"""
+        with self._lock:
+            if self._date_counts is None:
+                self._date_counts = [(date, len(self._dates[date])) for date in sorted(self._dates)]
+            return self._date_counts
@@ -0,0 +1,215 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+# utils.util と同じルートロガーを使用 (循環importを避けるため直接取得)
+logger = logging.getLogger()
+
+# ==========================================
+# サーバー側のセッション保存
+# ==========================================
+# Flask標準のセッションは内容を署名付きCookieへ格納するため、毎リクエストで全内容が送受信・検証・復元される。
+# SESSION_BACKEND=memory / sqlite では内容をサーバー側に保存し、Cookieには署名付きのセッションキーのみを格納する。
+#   - memory : プロセス内のLRU (最大 SESSION_MAX_ENTRIES 件)。インスタンス/ワーカー間では共有されない
+#   - sqlite : ローカルのSQLiteファイル (同一インスタンス内のワーカー間で共有)
+#   - cookie : Flask標準 (署名付きCookie)。既定値
+# 保存期間は最終更新から SESSION_TTL 秒。期限切れのセッションは空のセッションとして扱い、順次削除する。
+# 内容が変更されていないリクエストでは保存しない (残り期間が半分を切った場合のみ期限を延長する)。
+
+# Cookieの署名のソルト (Flask標準のセッションCookieとは別の値にする)
+SIGNER_SALT = "server-session"
+
+
+class ServerSession(SecureCookieSession):
+    """サーバー側に保存するセッション (sid: セッションキー, expires_at: 保存期限)"""
+
+    def __init__(self, initial: Optional[Dict[str, Any]] = None, sid: Optional[str] = None,
+                 expires_at: float = 0.0):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+
+
+class MemorySessionStore:
+    """プロセス内のLRU (スレッドセーフ)"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # sid -> (内容, 期限)
+        self._lock = threading.Lock()
+
+    def load(self, sid: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry
+
+    def save(self, sid: str, data: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[sid] = (data, expires_at)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def purge(self) -> int:
+        """期限切れのセッションを削除し、削除件数を返す"""
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for sid in expired:
+                del self._entries[sid]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteSessionStore:
+    """ローカルのSQLiteファイル (同一インスタンス内の複数ワーカーから参照可能)"""
+
+    # 保存PURGE_EVERY回ごとに期限切れのセッションを削除する
+    PURGE_EVERY = 200
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._saves = 0
+
+    def load(self, sid: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save(self, sid: str, data: str, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)", (sid, data, expires_at))
+            self._conn.commit()
+            self._saves += 1
+            purge = self._saves % self.PURGE_EVERY == 0
+        if purge:
+            self.purge()
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            self._conn.commit()
+
+    def purge(self) -> int:
+        """期限切れのセッションを削除し、削除件数を返す"""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class ServerSessionInterface(SessionInterface):
+    """セッションの内容を store に保存し、Cookieには署名付きのセッションキーのみを格納する"""
+
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSession
+
+    def __init__(self, store: Any, ttl: float):
+        self.store = store
+        self.ttl = ttl
+
+    def _signer(self, app) -> Optional[Signer]:
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt=SIGNER_SALT)
+
+    def open_session(self, app, request) -> Optional[ServerSession]:
+        signer = self._signer(app)
+        if signer is None:
+            return None
+        value = request.cookies.get(self.get_cookie_name(app))
+        if value:
+            try:
+                sid = signer.unsign(value).decode()
+            except BadSignature:
+                sid = None
+            entry = self.store.load(sid) if sid else None
+            if entry is not None:
+                try:
+                    return self.session_class(self.serializer.loads(entry[0]), sid=sid, expires_at=entry[1])
+                except ValueError:
+                    logger.warning(f"セッションの内容を復元できないため破棄します: {sid}")
+        return self.session_class()
+
+    def save_session(self, app, session: ServerSession, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        # 空になったセッションは保存先とCookieの両方から削除
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        now = time.time()
+        refresh = session.expires_at - now < self.ttl / 2
+        if not session.modified and not refresh:
+            return
+
+        if session.sid is None:
+            session.sid = uuid.uuid4().hex
+        session.expires_at = now + self.ttl
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), session.expires_at)
+
+        response.set_cookie(
+            name, self._signer(app).sign(session.sid).decode(), expires=self.get_expiration_time(app, session),
+            httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
+        response.vary.add("Cookie")
+
+
+def build_session_interface(backend: str, ttl: float, max_entries: int = 10000,
+                            sqlite_path: str = "/tmp/multicloud_sessions.sqlite3") -> Optional[SessionInterface]:
+    """SESSION_BACKEND に応じたセッションの保存方法 (cookie の場合は None = Flask標準のまま)"""
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        return ServerSessionInterface(MemorySessionStore(max_entries), ttl)
+    if backend == "sqlite":
+        return ServerSessionInterface(SQLiteSessionStore(sqlite_path), ttl)
+    raise ValueError(f"未対応のSESSION_BACKENDです: {backend}")
@@ -0,0 +1,166 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Optional
+
+# utils.util と同じルートロガーを使用 (循環importを避けるため直接取得)
+logger = logging.getLogger()
+
+# 取得失敗後、次の再取得を試みるまでの最短間隔(秒)。障害時に毎リクエスト再取得しないため
+RETRY_BACKOFF = 30.0
+
+
+class RefreshingSnapshot:
+    """
+    ローダー関数の結果をプロセス内に保持するスナップショット
+
+    - TTL内はキャッシュをそのまま返却 (外部APIへの往復なし)
+    - TTL切れ時は古い値を返しつつ、バックグラウンドで1回だけ再取得 (stale-while-revalidate)
+    - 同時に複数スレッドが再取得を要求しても、ローダー呼び出しは1本に集約
+    - 再取得に失敗した場合は、最後に成功したスナップショットを返し続ける
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any], ttl: float, empty: Any = None):
+        self.name = name
+        self._loader = loader
+        self._ttl = ttl
+        self._empty = empty
+
+        self._value: Any = None
+        self._loaded_at: Optional[float] = None
+        # 値の版 (差し替えのたびに増加) と、最後に差し替えた時刻(UNIX時刻)
+        self._version = 0
+        self._replaced_at: Optional[float] = None
+        self._last_error: Optional[Exception] = None
+        self._stale = False
+        self._retry_after = 0.0
+
+        # _state_lock: 値の参照/差し替え用, _load_lock: ローダー実行の直列化用
+        self._state_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    # ------------------------------------------
+    # 参照系
+    # ------------------------------------------
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def replaced_at(self) -> Optional[float]:
+        return self._replaced_at
+
+    @property
+    def age(self) -> Optional[float]:
+        """最終取得からの経過秒数 (未取得ならNone)"""
+        if self._loaded_at is None:
+            return None
+        return time.monotonic() - self._loaded_at
+
+    def get(self) -> Any:
+        """現在のスナップショットを返却 (未取得時のみ同期ロード)"""
+        if self._loaded_at is None:
+            if time.monotonic() < self._retry_after:
+                # 初回取得に失敗した直後は、再試行までの間リクエストごとにローダーを呼ばない
+                return self._empty
+            # 初回のみ同期取得。同時アクセスは_load_lockで待ち合わせ、ロードは1回に集約
+            self.refresh()
+            if self._loaded_at is None:
+                return self._empty
+            return self._value
+
+        now = time.monotonic()
+        if now >= self._retry_after and (self._stale or (self._ttl and now - self._loaded_at > self._ttl)):
+            self.refresh_async()
+        return self._value
+
+    # ------------------------------------------
+    # 更新系
+    # ------------------------------------------
+    def refresh(self) -> bool:
+        """同期的に再取得。他スレッドが取得中の場合はその完了を待って結果を共有する"""
+        started_at = self._loaded_at
+        with self._load_lock:
+            # 待機中に他スレッドが取得を終えていれば、それを採用して再取得しない
+            if self._loaded_at is not None and self._loaded_at != started_at:
+                return True
+            try:
+                value = self._loader()
+            except Exception as e:
+                self._last_error = e
+                self._retry_after = time.monotonic() + RETRY_BACKOFF
+                if self._loaded_at is None:
+                    logger.error(f"{self.name}: 初回取得に失敗しました: {e}")
+                else:
+                    logger.error(f"{self.name}: 再取得に失敗したため前回のスナップショットを継続使用します: {e}")
+                return False
+
+            self.replace(value)
+            self._last_error = None
+            self._retry_after = 0.0
+            return True
+
+    def refresh_async(self) -> None:
+        """バックグラウンドで再取得 (既に取得中なら何もしない)"""
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _run():
+            try:
+                self.refresh()
+            finally:
+                with self._state_lock:
+                    self._refreshing = False
+
+        threading.Thread(target=_run, name=f"{self.name}-refresh", daemon=True).start()
+
+    def replace(self, value: Any) -> None:
+        """スナップショットを差し替え (書き込み直後の即時反映などに使用)"""
+        with self._state_lock:
+            self._value = value
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            self._version += 1
+            self._replaced_at = time.time()
+
+    def update(self, fn: Callable[[Any], Any]) -> None:
+        """現在値に関数を適用して差し替え (未取得時は何もしない)"""
+        with self._state_lock:
+            if self._loaded_at is None:
+                return
+            self._value = fn(self._value)
+            self._version += 1
+            self._replaced_at = time.time()
+
+    def invalidate(self) -> None:
+        """次回参照時に再取得させる (古い値は再取得完了まで返却し続ける)"""
+        with self._state_lock:
+            self._stale = True
+
+    # ------------------------------------------
+    # 定期更新
+    # ------------------------------------------
+    def start_background(self, interval: float) -> None:
+        """interval秒ごとに再取得するデーモンスレッドを起動 (多重起動はしない)"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        def _loop():
+            while not self._stop.wait(interval):
+                self.refresh()
+
+        self._stop.clear()
+        self._worker = threading.Thread(target=_loop, name=f"{self.name}-interval", daemon=True)
+        self._worker.start()
+
+    def stop_background(self) -> None:
+        self._stop.set()
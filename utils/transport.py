@@ -0,0 +1,261 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from utils.metrics import REGISTRY
+
+# ==========================================
+# 外部API(BigQuery / Resource Manager)への通信: 接続プール・期限・再試行・流量制限
+# ==========================================
+# gunicornの全スレッド(+並列読み取りのスレッド)が1つのクライアントを共有するため、通信路を次のように管理する。
+#   - 接続プール : BigQueryのHTTPセッションの接続プールを同時実行数(BACKEND_POOL_SIZE)に合わせ、
+#                 keep-aliveの接続を使い回す (既定の10接続では溢れた分の接続が毎回破棄・再接続される)
+#   - 期限       : リクエストごとに期限(REQUEST_DEADLINE / 画面ごとの ROUTE_DEADLINES)を設定し、
+#                 各呼び出しのタイムアウト・完了待ち・再試行は期限の残り時間までとする (超過は DeadlineExceeded)
+#                 リクエスト外(バックグラウンドの再読み込み・書き込み等)の呼び出しは1回ごとに BACKGROUND_DEADLINE 秒
+#   - 再試行予算 : 一時的なエラーの再試行はプロセス全体で共有する予算(RetryBudget)の範囲内とし、
+#                 障害時に再試行が呼び出し数を何倍にも増やさないようにする
+#   - 流量制限   : 同時呼び出し数が BACKEND_POOL_SIZE に達している場合、空きを BACKEND_QUEUE_TIMEOUT 秒までしか待たず
+#                 BackendSaturated を送出する (main.py で503の画面を即座に返す)。
+#                 全ての接続が使用中で、空き待ちが上限(BACKEND_MAX_WAITERS)に達しているか
+#                 直近の空き待ち時間が BACKEND_SHED_QUEUE_DELAY 秒以上の場合は、リクエストの受付時点で503を返す
+# Resource Manager(gRPC)は1本のチャネル上で多重化されるため接続プールの設定は行わず、期限・再試行予算・流量制限のみ適用する。
+
+SHED_REQUESTS = REGISTRY.counter(
+    "multicloud_backend_shed_total", "Backend calls or requests rejected because the connection pool was saturated",
+    ("backend", "stage"))
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "multicloud_backend_deadline_exceeded_total", "Backend calls abandoned because the request deadline passed",
+    ("backend", "operation"))
+RETRIES = REGISTRY.counter(
+    "multicloud_backend_retries_total", "Retries of transient backend errors (denied: retry budget exhausted)",
+    ("result",))
+POOL_IN_USE = REGISTRY.gauge(
+    "multicloud_backend_pool_in_use", "Backend calls currently holding a connection slot", ("backend",))
+POOL_WAITING = REGISTRY.gauge(
+    "multicloud_backend_pool_waiting", "Backend calls waiting for a connection slot", ("backend",))
+
+# 直近の空き待ち時間(指数移動平均)に、1回の呼び出しの待ち時間を反映する割合
+QUEUE_DELAY_WEIGHT = 0.2
+
+# 実行中のリクエストの期限 (time.monotonic() の値。main.py の before_request で設定)
+_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """リクエストの期限までに外部APIの呼び出しが完了しなかった"""
+
+
+class BackendSaturated(Exception):
+    """外部APIの同時呼び出し数が上限に達しているため、呼び出しを行わなかった"""
+
+
+def enter_deadline(seconds: float) -> contextvars.Token:
+    return _deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+
+
+def leave_deadline(token: contextvars.Token) -> None:
+    _deadline.reset(token)
+
+
+def time_remaining(default: float) -> float:
+    """期限までの残り秒数 (リクエスト外では default)。期限を過ぎている場合は DeadlineExceeded を送出する"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("リクエストの期限を過ぎたため、外部APIを呼び出しませんでした")
+    return left
+
+
+def parse_deadlines(value: str) -> Dict[str, float]:
+    """'export_users=300,import_users=300' を {画面名: 秒数} へ"""
+    deadlines = {}
+    for item in filter(None, (v.strip() for v in value.split(","))):
+        route, _, seconds = item.partition("=")
+        deadlines[route.strip()] = float(seconds)
+    return deadlines
+
+
+class RetryBudget:
+    """
+    プロセス全体で共有する再試行の予算 (トークンバケット)
+    呼び出し1回ごとに ratio 個のトークンが貯まり (上限 max_tokens)、再試行1回ごとに1個を消費する。
+    平常時は呼び出し数の ratio 倍まで再試行でき、障害で予算を使い切った後は再試行せずにエラーを返す。
+    """
+
+    def __init__(self, ratio: float = 0.1, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max(max_tokens, min_tokens)
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def record_call(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def try_retry(self) -> bool:
+        with self._lock:
+            allowed = self._tokens >= 1.0
+            if allowed:
+                self._tokens -= 1.0
+        RETRIES.inc(result="allowed" if allowed else "denied")
+        return allowed
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def wrap(self, predicate: Callable[[Exception], bool], timeout: float) -> Any:
+        """
+        predicate が真となるエラーを、予算の範囲内でのみ再試行し timeout 秒で打ち切る google.api_core の Retry
+        (待ち時間の増やし方は google.api_core の既定と同じ)
+        """
+        from google.api_core.retry import Retry
+
+        def should_retry(exc: Exception) -> bool:
+            return predicate(exc) and self.try_retry()
+        return Retry(predicate=should_retry, timeout=timeout)
+
+
+class ConcurrencyLimiter:
+    """
+    外部APIの同時呼び出し数の上限 (接続プールの大きさ)
+    空きが無い場合は max_wait 秒(期限の残り時間が短ければそれまで)だけ待ち、空かなければ BackendSaturated を送出する
+    shed_delay: 全ての接続が使用中の間、直近の空き待ち時間がこの秒数以上なら新しいリクエストを受け付けない (既定は max_wait の半分)
+    """
+
+    def __init__(self, backend: str, limit: int, max_wait: float = 1.0, max_waiters: Optional[int] = None,
+                 shed_delay: Optional[float] = None):
+        self.backend = backend
+        self.limit = max(limit, 1)
+        self.max_wait = max_wait
+        self.max_waiters = self.limit if max_waiters is None else max(max_waiters, 1)
+        self.shed_delay = max_wait / 2 if shed_delay is None else shed_delay
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._queue_delay = 0.0
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def queue_delay(self) -> float:
+        """直近の空き待ち時間(秒)の指数移動平均 (待たずに確保できた呼び出しは0秒として反映)"""
+        return self._queue_delay
+
+    def saturated(self) -> bool:
+        """
+        全ての接続が使用中で、空き待ちが上限に達しているか直近の空き待ちが長いか (新しいリクエストを受け付けない)
+        空き待ちの件数だけでは、待てる呼び出し元(スレッド)が少ない thread モードで上限に届かないため、待ち時間でも判定する
+        """
+        if self._in_use < self.limit:
+            return False
+        return self._waiting >= self.max_waiters or self._queue_delay >= self.shed_delay
+
+    def _record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._queue_delay += QUEUE_DELAY_WEIGHT * (seconds - self._queue_delay)
+
+    @contextmanager
+    def acquire(self) -> Iterator[None]:
+        if self._slots.acquire(blocking=False):
+            self._record_wait(0.0)
+        else:
+            wait = min(self.max_wait, time_remaining(self.max_wait))
+            with self._lock:
+                self._waiting += 1
+            POOL_WAITING.set(self._waiting, backend=self.backend)
+            started = time.monotonic()
+            try:
+                acquired = self._slots.acquire(timeout=wait)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+                POOL_WAITING.set(self._waiting, backend=self.backend)
+                self._record_wait(time.monotonic() - started)
+            if not acquired:
+                SHED_REQUESTS.inc(backend=self.backend, stage="call")
+                raise BackendSaturated(f"{self.backend}: 同時呼び出し数が上限({self.limit})に達しています")
+        with self._lock:
+            self._in_use += 1
+        POOL_IN_USE.set(self._in_use, backend=self.backend)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            POOL_IN_USE.set(self._in_use, backend=self.backend)
+            self._slots.release()
+
+
+class BackendTransport:
+    """1つの外部APIに対する流量制限・期限・再試行予算の組み合わせ"""
+
+    def __init__(self, backend: str, limiter: ConcurrencyLimiter, budget: RetryBudget,
+                 background_deadline: float = 600.0):
+        self.backend = backend
+        self.limiter = limiter
+        self.budget = budget
+        self.background_deadline = background_deadline
+
+    def timeout(self) -> float:
+        """この呼び出しに使える秒数 (期限を過ぎていれば DeadlineExceeded)"""
+        return time_remaining(self.background_deadline)
+
+    @contextmanager
+    def call(self, op: str) -> Iterator[float]:
+        """
+        接続の空きを確保して呼び出す (as で受け取る値は、呼び出しに使える秒数)
+        呼び出し中のタイムアウト(concurrent.futures / requests / google.api_core)は DeadlineExceeded へ変換する
+        """
+        try:
+            timeout = self.timeout()
+            with self.limiter.acquire():
+                self.budget.record_call()
+                yield self.timeout()
+        except DeadlineExceeded:
+            DEADLINE_EXCEEDED.inc(backend=self.backend, operation=op)
+            raise
+        except Exception as e:
+            if not _is_timeout(e):
+                raise
+            DEADLINE_EXCEEDED.inc(backend=self.backend, operation=op)
+            raise DeadlineExceeded(f"{self.backend}.{op}: {timeout:.1f}秒以内に完了しませんでした") from e
+
+    def retry(self, predicate: Callable[[Exception], bool], timeout: float) -> Any:
+        return self.budget.wrap(predicate, timeout)
+
+
+def _is_timeout(exc: Exception) -> bool:
+    """各ライブラリのタイムアウト例外か (依存ライブラリの読み込みを強制しないよう、型名で判定)"""
+    from concurrent.futures import TimeoutError as FutureTimeout
+    if isinstance(exc, FutureTimeout):
+        return True
+    name = type(exc).__name__
+    return name in ("ReadTimeout", "ConnectTimeout", "Timeout", "DeadlineExceeded", "RetryError")
+
+
+def build_pooled_session(credentials: Any, pool_size: int) -> Any:
+    """
+    接続プールを pool_size に合わせた認証付きHTTPセッション (BigQueryクライアントの _http に渡す)
+    keep-aliveの接続を pool_size 本まで保持して使い回す
+    """
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    session = AuthorizedSession(credentials)
+    # pool_connections は接続先ホストごとのプール数 (BigQuery API / 認証トークンの取得先)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
@@ -1,13 +1,30 @@
 import os
 import sys
-import re
+import time
 import logging
-from typing import List, Dict, Any, Optional
-
-import google.auth
-from google.cloud import bigquery
-from google.cloud import logging as cloud_logging
-from google.cloud import resourcemanager_v3
+import datetime
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, List, Dict, Any, Optional, NamedTuple, Tuple
+
+from markupsafe import Markup
+
+from utils.clients import ClientRegistry, LazyClient
+from utils.snapshot import RefreshingSnapshot
+from utils.metrics import track_call
+from utils.search_index import UserSearchIndex
+from utils import response_cache
+from utils.response_cache import DataGeneration, FragmentCache, SnapshotGeneration
+from utils.transport import (
+    BackendSaturated, BackendTransport, ConcurrencyLimiter, DeadlineExceeded, RetryBudget, build_pooled_session,
+    time_remaining,
+)
+from utils.validation import USER_FORM, PROJECT_FORM, ADMIN_FORM
+
+# google.auth / BigQuery / Cloud Logging / Resource Manager / pendulum は import が重いため、
+# 初回使用時 (各ファクトリ関数内) まで読み込みを遅延する
 
 # ==========================================
 # 1. 環境変数と定数の設定
@@ -22,221 +39,822 @@ dataset            = os.getenv("DATASET_ID")
 table              = os.getenv("TABLE_ID")
 company_list_table = os.getenv("COMPANY_LIST_TABLE")
 
+# 会社一覧キャッシュの有効期間(秒)。期限切れ後は古い値を返しつつバックグラウンドで再取得
+company_cache_ttl  = float(os.getenv("COMPANY_CACHE_TTL", "300"))
+
+# プロジェクトID索引のバックグラウンド更新間隔(秒)
+project_index_interval = float(os.getenv("PROJECT_INDEX_REFRESH_INTERVAL", "600"))
+
+# データの保存先 (bigquery: 本番 / sqlite: ローカル検証・ベンチマーク用)
+storage_backend    = os.getenv("STORAGE_BACKEND", "bigquery").lower()
+sqlite_path        = os.getenv("SQLITE_PATH", ":memory:")
+# sqlite利用時に各呼び出しへ挿入する疑似遅延(ミリ秒)
+storage_latency_ms = float(os.getenv("STORAGE_LATENCY_MS", "0"))
+# sqlite利用時に起動時に投入するダミー申請者数 (会社は未登録の場合のみ10件投入)
+local_seed_users   = int(os.getenv("LOCAL_SEED_USERS", "0"))
+
+# ID採番用のシーケンステーブル名と、1回の予約で確保するIDの件数
+id_sequence_table  = os.getenv("ID_SEQUENCE_TABLE", f"{table}_id_sequence")
+id_block_size      = int(os.getenv("ID_BLOCK_SIZE", "20"))
+
+# 申請者の変更履歴テーブル (更新は行の書き換えではなく変更履歴の追記で行う) と、最新の状態を返すビュー
+user_change_table  = os.getenv("USER_CHANGE_TABLE", f"{table}_changes")
+user_current_view  = os.getenv("USER_CURRENT_VIEW", f"{table}_current")
+
+# 登録データの非同期書き込み (キューへ積んで即応答し、バックグラウンドでまとめて書き込む)
+# 書き込めない行(恒久的なエラー・再投入の上限超過)は WRITE_DEAD_LETTER_PATH へ移し、後続の行の書き込みを止めない
+write_pipeline_enabled = os.getenv("WRITE_PIPELINE", "true").lower() == "true"
+write_spool_path       = os.getenv("WRITE_SPOOL_PATH", "/tmp/multicloud_write_spool.jsonl")
+write_queue_size       = int(os.getenv("WRITE_QUEUE_SIZE", "1000"))
+write_batch_size       = int(os.getenv("WRITE_BATCH_SIZE", "50"))
+write_flush_interval   = float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0"))
+write_dead_letter_path = os.getenv("WRITE_DEAD_LETTER_PATH", "/tmp/multicloud_write_dead_letter.jsonl")
+
+# 申請者検索用のプロセス内インデックス
+# 差分(新規行)の取り込み間隔と、他インスタンスでの更新を取り込むための全件再読み込みの間隔(秒)
+search_index_enabled           = os.getenv("SEARCH_INDEX", "true").lower() == "true"
+search_index_refresh_interval  = float(os.getenv("SEARCH_INDEX_REFRESH_INTERVAL", "30"))
+search_index_reload_interval   = float(os.getenv("SEARCH_INDEX_RELOAD_INTERVAL", "600"))
+
+# 読み取り結果のキャッシュ (書き込み時に該当する結果を無効化。他インスタンスでの書き込みはTTLで反映)
+query_cache_enabled  = os.getenv("QUERY_CACHE", "true").lower() == "true"
+query_cache_ttl      = float(os.getenv("QUERY_CACHE_TTL", "30"))
+query_cache_entries  = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "512"))
+query_cache_max_rows = int(os.getenv("QUERY_CACHE_MAX_ROWS", "20000"))
+
+# 一覧・検索・登録フォームの条件付きGET (ETag / 304)
+# 他インスタンスでの書き込みは RESPONSE_CACHE_MAX_AGE 秒以内に反映 (同一インスタンス内の書き込みは即時)
+response_cache_enabled = os.getenv("RESPONSE_CACHE", "true").lower() == "true"
+response_cache_max_age = float(os.getenv("RESPONSE_CACHE_MAX_AGE", "30"))
+
+# 読み取りクエリの処理量の見積もり(ドライラン)と、1クエリあたりの処理量の上限 (BigQuery利用時)
+# 上限は画面(Flaskのエンドポイント名)ごとに QUERY_ROUTE_BUDGETS で指定し、無い画面は QUERY_BYTES_BUDGET を使用
+# QUERY_BUDGET_ENFORCE=false なら超過時は警告ログのみ、true なら実行を拒否する
+query_planner_enabled = os.getenv("QUERY_PLANNER", "true").lower() == "true"
+query_bytes_budget    = os.getenv("QUERY_BYTES_BUDGET", "1GB")
+query_route_budgets   = os.getenv("QUERY_ROUTE_BUDGETS", "")
+query_budget_enforce  = os.getenv("QUERY_BUDGET_ENFORCE", "false").lower() == "true"
+
+# 独立した読み取りを並列に実行するスレッド数と、1件あたりの既定のタイムアウト(秒)
+fanout_workers = int(os.getenv("FANOUT_WORKERS", "8"))
+fanout_timeout = float(os.getenv("FANOUT_TIMEOUT", "30"))
+
+# セッションの保存先 (cookie: Flask標準の署名付きCookie / memory: プロセス内のLRU / sqlite: ローカルファイル)
+# memory / sqlite ではCookieにはセッションキーのみを格納し、最終更新から SESSION_TTL 秒で破棄する
+session_backend     = os.getenv("SESSION_BACKEND", "cookie").lower()
+session_ttl         = float(os.getenv("SESSION_TTL", "3600"))
+session_max_entries = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+session_sqlite_path = os.getenv("SESSION_SQLITE_PATH", "/tmp/multicloud_sessions.sqlite3")
+
+# ログの非同期・一括出力 (LOG_PIPELINE=false なら従来どおり Cloud Logging のハンドラで出力)
+# 出力先 LOG_SINK: cloud (Cloud Logging API) / stdout (構造化JSON。Cloud Runでは自動で取り込まれる)
+# 出力先が失敗・遅延(LOG_SINK_SLOW_SECONDS以上)した場合は一定時間 LOG_SPOOL_PATH へ書き込む
+# 同じ箇所からの警告/エラーは LOG_RATE_WINDOW 秒ごとに LOG_RATE_LIMIT 件まで、以降は LOG_SAMPLE_EVERY 件に1件を出力
+log_pipeline_enabled  = os.getenv("LOG_PIPELINE", "true").lower() == "true"
+log_sink              = os.getenv("LOG_SINK", "cloud").lower()
+log_name              = os.getenv("LOG_NAME", "multicloud")
+log_spool_path        = os.getenv("LOG_SPOOL_PATH", "/tmp/multicloud_log_spool.jsonl")
+log_batch_size        = int(os.getenv("LOG_BATCH_SIZE", "100"))
+log_flush_interval    = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+log_sink_slow_seconds = float(os.getenv("LOG_SINK_SLOW_SECONDS", "2.0"))
+log_rate_limit        = int(os.getenv("LOG_RATE_LIMIT", "10"))
+log_rate_window       = float(os.getenv("LOG_RATE_WINDOW", "60"))
+log_sample_every      = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+
+# 外部API(BigQuery / Resource Manager)への通信
+# BACKEND_POOL_SIZE: 同時呼び出し数の上限 = BigQueryのHTTP接続プールの大きさ
+#   (既定はリクエストのスレッド数 + 並列読み取りのスレッド数。cooperative モードでは64)
+# 空きを BACKEND_QUEUE_TIMEOUT 秒待っても空かない場合は503を返す
+# 全ての接続が使用中で、空き待ちが BACKEND_MAX_WAITERS 件に達しているか直近の空き待ちが BACKEND_SHED_QUEUE_DELAY 秒以上の間は
+# リクエストの受付時点で503を返す (BACKEND_MAX_WAITERS の既定は、同時に呼び出し得る数のうち接続を確保できない分)
+# REQUEST_DEADLINE: リクエストごとの期限(秒)。画面ごとに ROUTE_DEADLINES (例: export_users=300) で上書きできる
+# BACKGROUND_DEADLINE: リクエスト外の呼び出し1回あたりの期限(秒)
+# 一時的なエラーの再試行は、呼び出し数の RETRY_BUDGET_RATIO 倍(最低 RETRY_BUDGET_MIN 回)まで
+_worker_mode          = os.getenv("WORKER_MODE", "thread").lower()
+_backend_callers      = int(os.getenv("WORKER_CONNECTIONS", "500") if _worker_mode == "cooperative"
+                            else os.getenv("WORKER_THREADS", "8")) + fanout_workers
+_default_pool_size    = 64 if _worker_mode == "cooperative" else _backend_callers
+backend_pool_size     = int(os.getenv("BACKEND_POOL_SIZE", str(_default_pool_size)))
+backend_queue_timeout = float(os.getenv("BACKEND_QUEUE_TIMEOUT", "1.0"))
+backend_max_waiters   = int(os.getenv("BACKEND_MAX_WAITERS", str(max(_backend_callers - backend_pool_size, 1))))
+backend_shed_delay    = float(os.getenv("BACKEND_SHED_QUEUE_DELAY", str(backend_queue_timeout / 2)))
+request_deadline      = float(os.getenv("REQUEST_DEADLINE", "30"))
+route_deadlines       = os.getenv("ROUTE_DEADLINES", "export_users=300,import_users=300")
+background_deadline   = float(os.getenv("BACKGROUND_DEADLINE", "600"))
+retry_budget_ratio    = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+retry_budget_min      = float(os.getenv("RETRY_BUDGET_MIN", "10"))
+
 # 必須環境変数のチェック (Fail Fast)
 required_vars = [project, dataset, table]
-if not all(required_vars):
+if storage_backend == "bigquery" and not all(required_vars):
     # ロガー設定前なので標準エラー出力に出して終了
     print(f"CRITICAL: 必須環境変数が設定されていません。", file=sys.stderr)
     sys.exit(1)
 
+# 起動時にクライアントを事前生成するか (gunicornのポートbind後にバックグラウンドで実行)
+client_warmup = os.getenv("CLIENT_WARMUP", "true").lower() == "true"
+
 # ==========================================
 # 2. 認証情報の取得 (ADCへの移行)
 # ==========================================
 # Secret Manager経由の鍵取得は廃止し、ADCを使用します。
 # Cloud Runでは自動的にSA権限が適用されます。
 # 変数 credentials, credentials_info は互換性維持のために定義します。
+# (credentials は初回のクライアント生成時に設定されます)
 credentials = None
 credentials_info = None
 
-try:
-    # google.auth.default() は環境(Cloud Run/Local)に応じて最適な認証を探します
-    credentials, project_id = google.auth.default()
-except Exception as e:
-    print(f"CRITICAL: 認証情報の取得に失敗しました: {e}", file=sys.stderr)
-    sys.exit(1)
-
 # ==========================================
-# 3. ロガー & クライアント初期化
+# 3. ロガー & クライアント初期化 (遅延生成)
 # ==========================================
-# Cloud Logging クライアント
-logging_client = cloud_logging.Client(credentials=credentials, project=project)
-logging_client.setup_logging(log_level=LOG_LEVEL)
-
 # 標準ロガーの取得
+# Cloud Loggingのハンドラが設定されるまでは標準エラー出力へ出力 (Cloud Runでは同様に収集される)
 logger = logging.getLogger()
+logger.setLevel(LOG_LEVEL)
+_bootstrap_handler = logging.StreamHandler(sys.stderr)
+logger.addHandler(_bootstrap_handler)
+
+clients = ClientRegistry()
+
+
+def _build_credentials():
+    global credentials
+    import google.auth
+    try:
+        # google.auth.default() は環境(Cloud Run/Local)に応じて最適な認証を探します
+        credentials, _ = google.auth.default()
+    except Exception as e:
+        logger.critical(f"CRITICAL: 認証情報の取得に失敗しました: {e}")
+        raise
+    return credentials
+
+
+def cooperative_mode() -> bool:
+    """
+    geventのワーカー(WORKER_MODE=cooperative)で動作しているか
+    この場合、gRPCの呼び出しはイベントループ全体を止めるため、各クライアントはHTTP(REST)で通信する
+    """
+    if "gevent" not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched("socket")
+
+
+def _build_logging_client():
+    from google.cloud import logging as cloud_logging
+    kwargs = {"_use_grpc": False} if cooperative_mode() else {}
+    client = cloud_logging.Client(credentials=clients.get("credentials"), project=project, **kwargs)
+    if log_pipeline_enabled:
+        _start_log_pipeline(client)
+    else:
+        client.setup_logging(log_level=LOG_LEVEL)
+    # Cloud Loggingのハンドラへ切り替わったため、起動用のハンドラは外す (二重出力防止)
+    logger.removeHandler(_bootstrap_handler)
+    return client
+
+
+# ログの非同期・一括出力パイプライン (Cloud Loggingへの切り替え時に起動)
+log_pipeline = None
+
+
+def _start_log_pipeline(client) -> None:
+    global log_pipeline
+    from utils.log_pipeline import LogPipeline, RateLimiter, cloud_logging_sink, stdout_sink
+    if log_sink == "cloud":
+        sink = cloud_logging_sink(client, log_name)
+    elif log_sink == "stdout":
+        sink = stdout_sink()
+    else:
+        raise ValueError(f"未対応のLOG_SINKです: {log_sink}")
+    pipeline = LogPipeline(
+        sink,
+        spool_path=log_spool_path,
+        batch_size=log_batch_size,
+        flush_interval=log_flush_interval,
+        slow_seconds=log_sink_slow_seconds,
+        rate_limiter=RateLimiter(log_rate_limit, log_rate_window, log_sample_every),
+    )
+    pipeline.start()
+    pipeline.handler.setLevel(LOG_LEVEL)
+    logger.addHandler(pipeline.handler)
+    log_pipeline = pipeline
+
+
+# 外部APIの同時呼び出し数の上限・再試行予算 (再試行予算はBigQuery / Resource Managerで共有)
+retry_budget = RetryBudget(retry_budget_ratio, min_tokens=retry_budget_min)
+bigquery_transport = BackendTransport(
+    "bigquery",
+    ConcurrencyLimiter("bigquery", backend_pool_size, backend_queue_timeout, backend_max_waiters, backend_shed_delay),
+    retry_budget,
+    background_deadline=background_deadline,
+)
+rm_transport = BackendTransport(
+    "resource_manager",
+    ConcurrencyLimiter("resource_manager", backend_pool_size, backend_queue_timeout, backend_max_waiters,
+                       backend_shed_delay),
+    retry_budget,
+    background_deadline=background_deadline,
+)
+
+
+def _build_bigquery_client():
+    from google.cloud import bigquery
+    credentials = clients.get("credentials")
+    # 全スレッドで共有するため、接続プールを同時呼び出し数の上限に合わせる (keep-aliveの接続を使い回す)
+    session = build_pooled_session(credentials, backend_pool_size)
+    return bigquery.Client(credentials=credentials, project=project, _http=session)
+
+
+def _build_rm_client():
+    # Resource Manager は管理者の重複チェックでのみ使用するため、import自体もここまで遅延
+    if storage_backend == "sqlite":
+        from utils.local_repository import LocalProjectsClient
+        return LocalProjectsClient(latency_ms=storage_latency_ms)
+    from google.cloud import resourcemanager_v3
+    transport = "rest" if cooperative_mode() else None
+    return resourcemanager_v3.ProjectsClient(credentials=clients.get("credentials"), transport=transport)
+
+
+def _build_repository():
+    """STORAGE_BACKEND に応じたリポジトリを生成 (QUERY_CACHE=true なら読み取り結果のキャッシュを挟む)"""
+    if storage_backend == "sqlite":
+        from utils.local_repository import SQLiteUserRepository
+        repository = SQLiteUserRepository(sqlite_path, latency_ms=storage_latency_ms)
+        repository.seed(users=local_seed_users)
+    elif storage_backend == "bigquery":
+        from utils.bigquery_repository import BigQueryUserRepository
+        repository = BigQueryUserRepository()
+    else:
+        raise ValueError(f"未対応のSTORAGE_BACKENDです: {storage_backend}")
+
+    if query_cache_enabled:
+        from utils.query_cache import CachedUserRepository, QueryCache
+        cache = QueryCache(query_cache_ttl, max_entries=query_cache_entries, max_rows=query_cache_max_rows)
+        repository = CachedUserRepository(repository, cache)
+    return repository
+
+
+def _build_id_allocator():
+    from utils.id_allocator import IdAllocator
+    # リポジトリが差し替えられても追従するよう、予約処理はプロキシ経由で呼び出す
+    return IdAllocator(lambda count: user_repository.reserve_ids(count), id_block_size)
+
+
+
+def _is_transient_write_error(exc: Exception) -> bool:
+    """登録データの書き込みエラーが一時的なものか (流量制限・期限切れ・認証トークンの更新失敗・SQLiteのロック待ちも含む)"""
+    import sqlite3
+    from google.auth.exceptions import GoogleAuthError
+    from utils.write_pipeline import is_transient
+    return is_transient(exc) or isinstance(
+        exc, (BackendSaturated, DeadlineExceeded, GoogleAuthError, sqlite3.OperationalError))
+
+
+def _build_write_pipeline():
+    from utils.write_pipeline import WritePipeline
+    pipeline = WritePipeline(
+        lambda rows: user_repository.insert_users(rows),
+        spool_path=write_spool_path,
+        dead_letter_path=write_dead_letter_path,
+        is_transient=_is_transient_write_error,
+        max_queue=write_queue_size,
+        batch_size=write_batch_size,
+        flush_interval=write_flush_interval,
+        # 書き込み完了で一覧の先頭に行が増えるため、ページ境界の破棄と検索インデックスへの反映を行う
+        on_flushed=lambda rows: Utils.notify_users_changed(rows, inserted=True),
+    )
+    pipeline.start()
+    return pipeline
+
+
+clients.register("credentials", _build_credentials)
+clients.register("logging", _build_logging_client)
+clients.register("bigquery", _build_bigquery_client)
+clients.register("resource_manager", _build_rm_client)
+clients.register("repository", _build_repository)
+clients.register("id_allocator", _build_id_allocator)
+clients.register("write_pipeline", _build_write_pipeline)
+
+# 既存コードからは従来どおりの変数名で参照できる (実体は初回のメソッド呼び出し時に生成)
+logging_client = LazyClient(clients, "logging")
+bigquery_client = LazyClient(clients, "bigquery")
+rm_client = LazyClient(clients, "resource_manager")
+
+# 申請者/会社データへのアクセスは、SQLを直接組み立てずこのリポジトリ経由で行う
+user_repository = LazyClient(clients, "repository")
+
+# 申請者IDの採番 (採番テーブルからブロック単位で予約し、メモリ上で払い出す)
+id_allocator = LazyClient(clients, "id_allocator")
+
+# 登録データの非同期書き込みパイプライン (初回使用時にスプールの未書き込み分を再投入して起動)
+write_pipeline = LazyClient(clients, "write_pipeline")
+
+
+def start_warm_up() -> None:
+    """
+    ポートbind後に呼び出す起動処理 (gunicorn.conf.py の post_worker_init から実行)
+    Cloud Loggingへの切り替えは常に行い、CLIENT_WARMUP=true の場合は
+    BigQuery / Resource Manager クライアントも先にバックグラウンドで生成しておく
+    """
+    if storage_backend == "sqlite":
+        # ローカル検証ではGCPへ接続しない
+        names = ["repository"]
+    else:
+        names = ["credentials", "logging"]
+        if client_warmup:
+            names += ["bigquery", "resource_manager", "repository"]
+    if write_pipeline_enabled:
+        # 前回停止時にスプールへ残った登録データを起動直後に書き込む
+        names.append("write_pipeline")
+    clients.warm_up_async(names)
+    if search_index_enabled and (storage_backend == "sqlite" or client_warmup):
+        # 最初の検索で全件読み込みを待たせないよう、検索インデックスも先に読み込んでおく
+        user_index.refresh_async()
+
+
+def shutdown() -> None:
+    """
+    停止時の後処理 (gunicorn.conf.py の worker_exit から実行)
+    書き込み待ちの登録データを可能な限り書き込む (残りはスプールに保持)
+    """
+    if clients.is_built("write_pipeline"):
+        clients.get("write_pipeline").shutdown()
+    if _fanout_executor is not None:
+        _fanout_executor.shutdown(wait=False, cancel_futures=True)
+    if log_pipeline is not None:
+        # 出力待ちのログを書き込む (書き込めない分はスプールへ)
+        log_pipeline.shutdown()
 
-# BigQueryクライアント
-bigquery_client = bigquery.Client(credentials=credentials, project=project)
 
-# Resource Manager クライアント (v3) - Lazy Loading推奨だが、要件に従いここで初期化する場合
-# プロジェクト一覧取得などで使用
-rm_client = resourcemanager_v3.ProjectsClient(credentials=credentials)
+# ==========================================
+# 4. 独立した読み取りの並列実行
+# ==========================================
+# 画面表示に必要な読み取り(申請者・会社一覧・プロジェクト索引など)が互いに独立している場合、
+# 直列に待つと応答時間が各所要時間の合計になるため、共有のスレッドプールで同時に実行する。
+# gunicornのリクエストスレッドは増やさず、先頭の1件は呼び出し元のスレッドで実行する。
+
+class FanOutTimeout(Exception):
+    """並列実行した読み取りがタイムアウトした"""
+
+
+_fanout_executor: Optional[ThreadPoolExecutor] = None
+_fanout_lock = threading.Lock()
+
+
+def _get_fanout_executor() -> ThreadPoolExecutor:
+    global _fanout_executor
+    with _fanout_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix="fanout")
+        return _fanout_executor
+
+
+def fan_out(fetches: Dict[str, Callable[[], Any]], timeouts: Optional[Dict[str, float]] = None,
+            timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    独立した読み取りを同時に実行し、{名前: 結果} を返す (全体の待ち時間は最も遅い1件の所要時間)
+    先頭の1件は呼び出し元のスレッドで実行するため、結果が必ず必要な読み取りを先頭に置く (タイムアウト対象外)
+    2件目以降は timeouts で名前ごとのタイムアウト(秒)を指定できる (未指定は timeout、既定は FANOUT_TIMEOUT)
+    いずれかが失敗/タイムアウトした場合は、未開始の読み取りを取り消して例外を送出する
+    """
+    if not fetches:
+        return {}
+    timeouts = timeouts or {}
+    # リクエストの期限を超えて待たない
+    default_timeout = min(fanout_timeout if timeout is None else timeout, time_remaining(fanout_timeout))
+    names = list(fetches)
+    started = time.monotonic()
+
+    # 計測(Server-Timing)などのリクエスト単位の情報を引き継ぐため、呼び出し元のコンテキストで実行
+    executor = _get_fanout_executor()
+    futures: Dict[str, Future] = {
+        name: executor.submit(contextvars.copy_context().run, fetches[name]) for name in names[1:]
+    }
+    try:
+        results = {names[0]: fetches[names[0]]()}
+        for name, future in futures.items():
+            remaining = started + timeouts.get(name, default_timeout) - time.monotonic()
+            try:
+                results[name] = future.result(timeout=max(remaining, 0))
+            except FutureTimeout:
+                raise FanOutTimeout(f"{name}: {timeouts.get(name, default_timeout)}秒以内に完了しませんでした")
+        return results
+    finally:
+        for future in futures.values():
+            future.cancel()
 
 
-class Utils:
+# ==========================================
+# 5. プロセス内キャッシュ (会社一覧・ページ境界・検索インデックス・プロジェクトID索引)
+# ==========================================
+class CompanyDirectory(NamedTuple):
+    """会社一覧のスナップショット (画面表示用の行 + ID→会社名の索引)"""
+    rows: Tuple[Dict[str, Any], ...]
+    names: Dict[int, str]
 
     @classmethod
-    def validate(cls, data: Dict[str, Any]) -> List[str]:
-        """一般ユーザー登録のバリデーション"""
-        errMsg = []
-        noInput = 'が正しく入力されていません。'
-
-        # ヘルパー関数で視認性を向上
-        def is_invalid_str(val, max_len=100):
-            return not val or len(str(val)) > max_len
-
-        if is_invalid_str(data.get('username')):
-            errMsg.append('氏名' + noInput)
+    def build(cls, rows: List[Dict[str, Any]]) -> "CompanyDirectory":
+        return cls(
+            rows=tuple(rows),
+            names={int(row["company_id"]): row["company_name"] for row in rows},
+        )
+
+
+def _load_company_directory() -> CompanyDirectory:
+    """会社一覧を取得 (失敗時は例外を送出し、スナップショット側で前回値を継続使用)"""
+    return CompanyDirectory.build(user_repository.list_companies())
+
+
+# ページ境界(各ページ末尾のid)の記録。次ページ要求時にキーセットページングで使用する
+# キー: (name, date, per_page, page) / 値: (末尾id, 記録時刻)
+PAGE_CURSOR_TTL = 60.0
+PAGE_CURSOR_MAX = 256
+_page_cursors: "OrderedDict[tuple, tuple]" = OrderedDict()
+_page_cursors_lock = threading.Lock()
+
+# 会社一覧はプロセス内で共有 (gunicornの全スレッドで1つのスナップショットを参照)
+company_directory = RefreshingSnapshot(
+    "company_directory",
+    _load_company_directory,
+    ttl=company_cache_ttl,
+    empty=CompanyDirectory.build([]),
+)
+
+# 申請者の検索用インデックス (全スレッドで共有)。初回は全件、以降は前回以降に登録・変更された行のみを取り込む
+user_search_index = UserSearchIndex()
+_user_index_reloaded_at: Optional[float] = None
+
+# 差分の取り込みで前回の取り込み時点より前から読み直す秒数 (書き込みの反映の遅れ・インスタンス間の時計のずれを見込む)
+SEARCH_INDEX_SYNC_OVERLAP = datetime.timedelta(seconds=60)
+
+
+def _load_user_search_index() -> UserSearchIndex:
+    """
+    検索インデックスを更新 (スナップショットのロードロック下で実行されるため直列化される)
+    一定間隔ごとに全件を読み込み直し、他インスタンスでの更新・削除も取り込む
+    """
+    global _user_index_reloaded_at
+    now = time.monotonic()
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    if (_user_index_reloaded_at is None or user_search_index.synced_at is None
+            or now - _user_index_reloaded_at > search_index_reload_interval):
+        user_search_index.load(user_repository.list_users())
+        _user_index_reloaded_at = now
+    else:
+        since = user_search_index.synced_at - SEARCH_INDEX_SYNC_OVERLAP
+        user_search_index.apply(user_repository.list_users_changed_since(since))
+    user_search_index.synced_at = started_at
+    return user_search_index
+
+
+user_index = RefreshingSnapshot(
+    "user_search_index",
+    _load_user_search_index,
+    ttl=search_index_refresh_interval,
+)
+
+# 引き渡し希望日ごとの件数 (検索インデックス無効時に使用)。書き込み時に破棄し、次回参照時に再集計する
+DATE_FACET_TTL = 300.0
+delivery_date_facet = RefreshingSnapshot(
+    "delivery_date_facet",
+    lambda: user_repository.count_by_delivery_date(),
+    ttl=DATE_FACET_TTL,
+    empty=[],
+)
+
+# 申請者データの世代 (書き込みのたびに増加)。画面のETagと、日付プルダウン等の描画済みHTMLの再利用に使用
+data_generation = DataGeneration(response_cache_max_age)
+
+# 会社一覧の世代 (会社一覧のスナップショットの版)。会社一覧のみに依存する登録フォームのETagに使用
+company_generation = SnapshotGeneration(company_directory)
+fragments = FragmentCache()
+
+# 払い出し済みだがResource Managerにまだ現れないプロジェクトID (ID -> 登録時刻)
+# 作成パイプラインの完了前に索引が再取得されても、重複チェックから漏れないよう保持する
+PENDING_PROJECT_TTL = 24 * 60 * 60
+_pending_project_ids: Dict[str, float] = {}
+_pending_project_ids_lock = threading.Lock()
+
+
+def _search_projects(timeout: float) -> Any:
+    """有効なプロジェクトの一覧を検索 (sqlite ではローカルの代替クライアントから取得し、GCPのライブラリを読み込まない)"""
+    if storage_backend == "sqlite":
+        return rm_client.search_projects(timeout=timeout)
+
+    from google.cloud import resourcemanager_v3
+    from google.api_core.retry import if_transient_error
+
+    # v3 APIを使用して検索
+    # 注: ADCの権限で閲覧可能なすべてのプロジェクトをリストします
+    req = resourcemanager_v3.SearchProjectsRequest(query="lifecycleState:ACTIVE")
+    # 一時的なエラーの再試行は再試行予算の範囲内・期限(通常はリクエスト外のため BACKGROUND_DEADLINE)まで
+    retry = rm_transport.retry(if_transient_error, timeout)
+    return rm_client.search_projects(request=req, retry=retry, timeout=timeout)
+
+
+def _load_project_index() -> frozenset:
+    """Resource Managerから有効なプロジェクトIDを取得 (失敗時は例外を送出)"""
+    # イテレータが自動的にページング処理を行います (全ページの取得までを計測)
+    with rm_transport.call("search_projects") as timeout, track_call("resource_manager", "search_projects"):
+        project_ids = frozenset(p.project_id for p in _search_projects(timeout))
+    if not project_ids and storage_backend != "sqlite":
+        logger.warning('プロジェクトが見つかりません。')
+
+    now = time.monotonic()
+    with _pending_project_ids_lock:
+        for pj_id, registered_at in list(_pending_project_ids.items()):
+            # 実在が確認できたもの・期限切れのものは保留リストから外す
+            if pj_id in project_ids or now - registered_at > PENDING_PROJECT_TTL:
+                del _pending_project_ids[pj_id]
+        pending = frozenset(_pending_project_ids)
+    return project_ids | pending
+
+
+# プロジェクトID索引 (frozenset)。バックグラウンドスレッドが定期的に差し替える
+project_index = RefreshingSnapshot(
+    "project_index",
+    _load_project_index,
+    ttl=project_index_interval * 2,
+    empty=frozenset(),
+)
 
-        email = data.get('email', '')
-        if not re.match(r'[\w\-.-]+@[\w\-._]+\.[A-Za-z]+', email) or len(email) > 100:
-            errMsg.append('メールアドレス' + noInput)
 
-        tel = data.get('tel_number', '')
-        if not re.match(r'^[0-9\-]+$', tel) or len(tel) > 100:
-            errMsg.append('電話番号' + noInput)
-
-        if not data.get('regist_date'):
-            errMsg.append('引き渡し希望日' + noInput)
+class Utils:
 
-        if is_invalid_str(data.get('belonging_department')):
-            errMsg.append('所属部署名' + noInput)
+    @classmethod
+    def validate(cls, data: Dict[str, Any]) -> List[str]:
+        """一般ユーザー登録のバリデーション (定義: utils.validation.USER_FORM)"""
+        return USER_FORM.validate(data)
 
-        if not data.get('company_id'):
-            errMsg.append('社名' + noInput)
+    @classmethod
+    def validate2(cls, data: Dict[str, Any]) -> List[str]:
+        """プロジェクト情報のバリデーション (定義: utils.validation.PROJECT_FORM)"""
+        return PROJECT_FORM.validate(data)
 
-        return errMsg
+    @classmethod
+    def admin_valitation(cls, data: Dict[str, Any]) -> List[str]:
+        """管理者用バリデーション (定義: utils.validation.ADMIN_FORM)"""
+        return ADMIN_FORM.validate(data)
 
     @classmethod
-    def validate2(cls, data: Dict[str, Any]) -> List[str]:
-        """プロジェクト情報のバリデーション"""
-        errMsg = []
-        noInput = 'が正しく入力されていません。'
+    def validate_registrations(cls, records: List[Dict[str, Any]]) -> List[List[str]]:
+        """
+        一般ユーザー登録(validate + validate2)を複数件まとめてチェック
+        入力と同じ順序で行ごとのエラー一覧を返す (一括登録や、ルール変更後の全件再チェック用)
+        """
+        users = USER_FORM.validate_many(records)
+        projects = PROJECT_FORM.validate_many(records)
+        return [u + p for u, p in zip(users, projects)]
 
-        if not data.get('project_name'):
-            errMsg.append('プロジェクト名' + noInput)
-        if not data.get('system_name'):
-            errMsg.append('システム名' + noInput)
-        if not data.get('type'):
-            errMsg.append('利用用途' + noInput)
+    @classmethod
+    def validate_admin_records(cls, records: List[Dict[str, Any]]) -> List[List[str]]:
+        """管理者用バリデーションを複数件まとめてチェック (行ごとのエラー一覧)"""
+        return ADMIN_FORM.validate_many(records)
 
-        return errMsg
+    @classmethod
+    def validate_admin_changes(cls, current: Dict[int, Dict[str, Any]],
+                               changes: Dict[int, Dict[str, Any]]) -> Dict[int, List[str]]:
+        """
+        一括更新の変更 {id: {カラム: 値}} を、登録済みの行 current {id: 行} に重ねてチェック
+        エラーのある申請者だけを {id: エラー一覧} で返す (登録されていないidは変更内容のみでチェック)
+        """
+        results = {}
+        for user_id, fields in changes.items():
+            errors = ADMIN_FORM.validate_changes(current.get(user_id, {}), fields)
+            if errors:
+                results[user_id] = errors
+        return results
 
     @classmethod
-    def admin_valitation(cls, data: Dict[str, Any]) -> List[str]:
-        """管理者用バリデーション"""
-        errMsg = []
-        noInput = 'が正しく入力されていません。'
-
-        # 正規表現パターンの定義
-        PATTERNS = {
-            'alpha_num': r'^[a-z0-9]+$',
-            'alpha_num_hyphen': r'^[a-z0-9\-]+$',
-            'email': r'[\w\-._]+@[\w\-._]+\.[A-Za-z]+',
-            'cidr': r'^(((?!10\.0\.0\.0/31$)\d+\.\d+\.\d+\.\d+/\d+)(?:,|$))+$', # カンマ区切り対応
-            'vpc_cidr': r'^(?!10\.0\.0\.0/31$)\d+\.\d+\.\d+\.\d+/28$',
-            'domain': r'^(?![-.])[a-z0-9]([a-z0-9.-]*[a-z0-9])?(\.[a-z]{2,})+$'
+    def build_registration_row(cls, form: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+        """登録フォームの値を申請者テーブルの1行へ変換 (検証済みであること)"""
+        # 会社IDの分割処理 "1: 株式会社XX" -> 1
+        company_id_val = int(str(form['company_id']).split(':')[0])
+        return {
+            'id': user_id,
+            'name': form['username'],
+            'desired_delivery_date': form['regist_date'],
+            'tel': form['tel_number'],
+            'email': form['email'],
+            'belonging_department': form['belonging_department'],
+            'company_id': company_id_val,
+            'project_name': form['project_name'],
+            'system_name': form['system_name'],
+            'type': form['type'],
+            'memo': form.get('memo', ''),
+            'insert_date': cls.today(),
+            'UPDATE_FLG': 'update',
         }
 
-        # 項目ごとのチェック定義 (フィールド名, パターン, エラーメッセージ)
-        checks = [
-            ('manage_company_name', 'alpha_num', '会社名は半角英数文字(英小文字)のみです。'),
-            ('project_name_gcp', 'alpha_num', 'プロジェクト名は半角英数文字(英小文字)のみです。'),
-            ('organization_name', 'alpha_num', '組織名は半角英数文字(英小文字)のみです。'),
-            ('group_name', 'alpha_num_hyphen', 'Googleグループ名(管理者用)は半角英数文字(英小文字),-(半角ハイフン)のみです。'),
-            ('user_group_name', 'alpha_num_hyphen', 'Googleグループ名(利用者用)は半角英数文字(英小文字),-(半角ハイフン)のみです。'),
-            ('group_email', 'email', 'Googleグループのemail(管理者用)' + noInput),
-            ('user_group_email', 'email', 'Googleグループのemail(利用者用)' + noInput),
-        ]
-
-        # 定型チェック実行
-        for field, pattern_key, msg in checks:
-            val = data.get(field, '')
-            if not re.search(PATTERNS[pattern_key], val):
-                errMsg.append(msg)
-
-        # 文字数チェック
-        for field, label in [('manage_company_name', '会社名'), ('project_name_gcp', 'プロジェクト名'), ('organization_name', '組織名')]:
-            if len(data.get(field, '')) > 8:
-                errMsg.append(f'{label}が8文字を超えています!!')
-
-        # 必須チェック
-        if not data.get('env'):
-            errMsg.append('環境' + noInput)
-        if not data.get('use_purpose'):
-            errMsg.append('利用用途' + noInput)
-
-        # 条件付きチェック (use_purpose に依存するもの)
-        use_purpose = data.get('use_purpose')
-
-        # サブネット情報 (wp, static以外)
-        if use_purpose not in ['wp', 'static']:
-            subnet = data.get('subnet_info', '')
-            if not re.search(r'^(?!10\.0\.0\.0/31$)\d+\.\d+\.\d+\.\d+/\d+$', subnet):
-                 errMsg.append('利用IP範囲は半角数字及び.(ドット)/(スラッシュ)のみです。')
-
-        # クライアントCIDR (api, secure)
-        if use_purpose in ['api', 'secure']:
-            client_cidr = data.get('client_cidr', '').replace(' ', '')
-            if client_cidr and not re.search(PATTERNS['cidr'], client_cidr):
-                errMsg.append('アクセス元IP制限は半角数字及び.(ドット)/(スラッシュ),(カンマ)のみです。')
-
-        # VPCコネクタ (secure)
-        if use_purpose == 'secure':
-            conn_cidr = data.get('connector_cidr', '')
-            if conn_cidr and conn_cidr != 'None' and not re.search(PATTERNS['vpc_cidr'], conn_cidr):
-                errMsg.append('VPCコネクター利用IP範囲が適切な形式になっていません。(空欄又は*.*.*.*/28など)。')
-
-        # ドメイン (static, wp)
-        if use_purpose in ['static', 'wp']:
-            domain = data.get('domain_name', '')
-            if not re.search(PATTERNS['domain'], domain):
-                 errMsg.append('無効なドメイン名です。')
-
-        return errMsg
+    @classmethod
+    def today(cls):
+        """本日の日付 (登録日用)"""
+        import pendulum
+        return pendulum.today().date()
 
     @classmethod
     def get_company_list(cls) -> List[Dict[str, Any]]:
-        """会社一覧を取得"""
-        query = f'SELECT company_id, company_name FROM `{project}.{dataset}.{company_list_table}`'
+        """会社一覧を取得 (プロセス内キャッシュから返却。BigQuery障害時は前回取得分を返す)"""
+        directory = company_directory.get()
+        if not company_directory.loaded:
+            response_cache.skip()  # 未取得(初回取得の失敗)の空の一覧を返す画面にETagを付けない
+        return list(directory.rows)
+
+    @classmethod
+    def get_company_name(cls, company_id: Any, default: str = "不明な会社") -> str:
+        """会社IDから会社名を取得 (索引を参照するためO(1))"""
         try:
-            query_job = bigquery_client.query(query)
-            # リスト内包表記で高速化
-            return [{"company_id": row.company_id, "company_name": row.company_name} for row in query_job]
-        except Exception as e:
-            logger.error(f"Failed to get company list: {e}")
-            return []
+            return company_directory.get().names.get(int(company_id), default)
+        except (TypeError, ValueError):
+            return default
 
     @classmethod
     def get_users_list(cls) -> List[Dict[str, Any]]:
         """申請者リスト取得"""
-        query = f"""
-            SELECT id, name, desired_delivery_date, tel, email, belonging_department,
-                   project_name, type, project_id_gcp, UPDATE_FLG
-            FROM `{project}.{dataset}.{table}`
-            ORDER BY id DESC
-        """
         try:
-            query_job = bigquery_client.query(query)
-            return [dict(row.items()) for row in query_job]
+            return user_repository.list_users()
+        except (BackendSaturated, DeadlineExceeded):
+            raise  # 混雑/期限切れは空の結果にせず、呼び出し元(main.py の errorhandler)で503/504を返す
         except Exception as e:
             logger.error(f"Failed to get users list: {e}")
+            response_cache.skip()  # 空の結果を返す画面にETagを付けない
             return []
 
     @classmethod
-    def get_multicloud_pjname(cls) -> List[str]:
+    def count_users(cls, name: Optional[str] = None, s_date: Optional[str] = None) -> int:
+        """申請者件数を取得 (ページネーションの総件数用)"""
+        try:
+            return user_repository.count_users(name or None, s_date or None)
+        except (BackendSaturated, DeadlineExceeded):
+            raise  # 混雑/期限切れは空の結果にせず、呼び出し元(main.py の errorhandler)で503/504を返す
+        except Exception as e:
+            logger.error(f"Failed to count users: {e}")
+            response_cache.skip()  # 空の結果を返す画面にETagを付けない
+            return 0
+
+    @classmethod
+    def get_users_page(cls, page: int, per_page: int,
+                       name: Optional[str] = None, s_date: Optional[str] = None) -> List[Dict[str, Any]]:
         """
-        プロジェクトID一覧を取得
-        Band 7改修: googleapiclient(v1) -> google-cloud-resourcemanager(v3)
+        申請者リストを1ページ分だけ取得 (id降順)
+        直前ページの末尾idが記録済みなら id < after_id のキーセットページング、
+        それ以外 (任意ページへのジャンプ等) は LIMIT/OFFSET で取得する
         """
+        page = max(page, 1)
+        after_id = cls._get_page_cursor((name or "", s_date or "", per_page, page - 1)) if page > 1 else None
         try:
-            # v3 APIを使用して検索
-            # 注: ADCの権限で閲覧可能なすべてのプロジェクトをリストします
-            req = resourcemanager_v3.SearchProjectsRequest(
-                query="lifecycleState:ACTIVE"
+            rows = user_repository.list_users_page(
+                per_page, offset=(page - 1) * per_page, after_id=after_id,
+                name=name or None, s_date=s_date or None,
             )
-            # イテレータが自動的にページング処理を行います
-            page_result = rm_client.search_projects(request=req)
+        except (BackendSaturated, DeadlineExceeded):
+            raise  # 混雑/期限切れは空の結果にせず、呼び出し元(main.py の errorhandler)で503/504を返す
+        except Exception as e:
+            logger.error(f"Failed to get users page: {e}")
+            response_cache.skip()  # 空の結果を返す画面にETagを付けない
+            return []
 
-            pj_list = [p.project_id for p in page_result]
-            
-            if not pj_list:
-                logger.warning('プロジェクトが見つかりません。')
-                return []
+        if rows:
+            cls._set_page_cursor((name or "", s_date or "", per_page, page), rows[-1]["id"])
+        return rows
 
-            # 重複除去してリスト返却
-            return list(set(pj_list))
+    @classmethod
+    def search_users_page(cls, page: int, per_page: int, name: Optional[str] = None,
+                          s_date: Optional[str] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        検索条件に一致する件数と1ページ分の申請者を取得 (id降順)
+        検索インデックスが有効ならメモリ上で検索し、無効/未取得の場合はリポジトリへ問い合わせる
+        """
+        page = max(page, 1)
+        if search_index_enabled:
+            index = user_index.get()
+            if index is not None:
+                try:
+                    return index.search(name or None, s_date or None, offset=(page - 1) * per_page, limit=per_page)
+                except ValueError as e:
+                    logger.error(f"Failed to search users: {e}")
+                    response_cache.skip()
+                    return 0, []
+        return cls.count_users(name, s_date), cls.get_users_page(page, per_page, name, s_date)
 
-        except Exception as e:
-            logger.error(f'プロジェクト一覧取得エラー: {e}')
-            return []
+    @classmethod
+    def notify_users_changed(cls, rows: Optional[List[Dict[str, Any]]] = None, inserted: bool = False) -> None:
+        """
+        申請者の追加/変更を一覧系のキャッシュへ反映
+        rows は新規行(inserted=True)なら登録した行、変更なら id と変更したカラム
+        None の場合は次回参照時に差分を取り込ませる
+        """
+        cls.invalidate_user_pages()
+        data_generation.bump()
+        # 日付ごとの件数は検索インデックス無効時のみ使用するキャッシュ (有効時は索引側で更新される)
+        delivery_date_facet.invalidate()
+        if not search_index_enabled:
+            return
+        if rows is None:
+            user_index.invalidate()
+        elif user_index.loaded:
+            if inserted:
+                user_search_index.apply(rows)
+            else:
+                # 索引に無いidの変更は、次回の差分の取り込みで完全な行として取り込む
+                user_search_index.update(rows)
+
+    @classmethod
+    def get_delivery_date_facet(cls) -> List[Dict[str, Any]]:
+        """
+        引き渡し希望日ごとの件数 ([{'date': 'YYYY-MM-DD', 'count': 件数}, ...] 日付の昇順)
+        検索インデックスが有効なら索引から、無効ならキャッシュ(書き込み時に破棄)から返す
+        """
+        counts = None
+        if search_index_enabled:
+            index = user_index.get()
+            if index is not None:
+                counts = index.date_counts()
+        if counts is None:
+            counts = delivery_date_facet.get()
+            if not delivery_date_facet.loaded:
+                response_cache.skip()
+        return [{'date': d.strftime('%Y-%m-%d'), 'count': n} for d, n in counts]
+
+    @classmethod
+    def get_date_options_html(cls, selected: str = '') -> Markup:
+        """一覧/検索画面の引き渡し希望日プルダウンの<option>一覧 (次の書き込みまで描画済みのHTMLを再利用)"""
+        def render() -> Markup:
+            return Markup('').join(
+                Markup('<option value="{0}"{2}>{0} ({1}件)</option>').format(
+                    facet['date'], facet['count'], Markup(' selected') if facet['date'] == selected else '')
+                for facet in cls.get_delivery_date_facet()
+            )
+        return fragments.get(('date_options', selected or ''), data_generation.token(), render)
+
+    @classmethod
+    def get_company_options_html(cls) -> Markup:
+        """登録フォームの会社プルダウンの<option>一覧 (会社一覧のスナップショットの版が変わるまで描画済みのHTMLを再利用)"""
+        # 版は描画より先に取得する (描画中に差し替わった場合は古い版で保持され、次回に描画し直す)
+        return fragments.get('company_options', company_generation.token(), lambda: Markup('').join(
+            Markup('<option value="{0}:{1}">{1}</option>').format(c['company_id'], c['company_name'])
+            for c in cls.get_company_list()
+        ))
+
+    @classmethod
+    def get_delivery_dates(cls) -> List[str]:
+        """引き渡し希望日の一覧 (重複なし・昇順の'YYYY-MM-DD'文字列)"""
+        return [facet['date'] for facet in cls.get_delivery_date_facet()]
+
+    @classmethod
+    def _get_page_cursor(cls, key: tuple) -> Optional[int]:
+        with _page_cursors_lock:
+            entry = _page_cursors.get(key)
+            if entry is None:
+                return None
+            last_id, recorded_at = entry
+            if time.monotonic() - recorded_at > PAGE_CURSOR_TTL:
+                del _page_cursors[key]
+                return None
+            return last_id
+
+    @classmethod
+    def _set_page_cursor(cls, key: tuple, last_id: int) -> None:
+        with _page_cursors_lock:
+            _page_cursors[key] = (last_id, time.monotonic())
+            _page_cursors.move_to_end(key)
+            while len(_page_cursors) > PAGE_CURSOR_MAX:
+                _page_cursors.popitem(last=False)
+
+    @classmethod
+    def invalidate_user_pages(cls) -> None:
+        """登録によりページ境界がずれるため、記録済みのページ境界を破棄"""
+        with _page_cursors_lock:
+            _page_cursors.clear()
+
+    @classmethod
+    def get_project_index(cls) -> frozenset:
+        """プロジェクトID索引を取得 (初回参照時に定期更新スレッドを起動)"""
+        project_index.start_background(project_index_interval)
+        return project_index.get()
+
+    @classmethod
+    def project_id_exists(cls, project_id: str) -> bool:
+        """プロジェクトIDが使用済みか判定 (メモリ上の索引を参照するためO(1))"""
+        return project_id in cls.get_project_index()
+
+    @classmethod
+    def register_project_ids(cls, project_ids: List[str]) -> None:
+        """払い出したプロジェクトIDを索引へ即時反映"""
+        new_ids = frozenset(project_ids)
+        if not new_ids:
+            return
+        now = time.monotonic()
+        with _pending_project_ids_lock:
+            for pj_id in new_ids:
+                _pending_project_ids[pj_id] = now
+        project_index.update(lambda current: current | new_ids)
+
+    @classmethod
+    def get_multicloud_pjname(cls) -> List[str]:
+        """
+        プロジェクトID一覧を取得
+        Band 7改修: googleapiclient(v1) -> google-cloud-resourcemanager(v3)
+        索引(project_index)から返却するため、Resource ManagerへのAPI呼び出しは発生しない
+        """
+        return list(cls.get_project_index())
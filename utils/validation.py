@@ -0,0 +1,212 @@
+import re
+import datetime
+import ipaddress
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# ==========================================
+# 入力チェックの宣言的な定義
+# ==========================================
+# 各フォームのチェック内容を Rule の並びとして定義し、import時に一度だけ
+# 判定関数(正規表現はコンパイル済み)へ変換しておく。
+# エラーメッセージの内容・順序は従来の Utils.validate / validate2 / admin_valitation と同じ。
+
+NO_INPUT = 'が正しく入力されていません。'
+
+# CIDRとして受け付けない値 (従来の正規表現の否定先読みと同じ)
+EXCLUDED_CIDRS = frozenset({'10.0.0.0/31'})
+
+# CIDRの表記 'a.b.c.d/n' (ipaddress はネットマスク表記 'a.b.c.d/255.0.0.0' も受け付けるため、表記は正規表現で限定する)
+CIDR_NOTATION = re.compile(r'[0-9]{1,3}(?:\.[0-9]{1,3}){3}/[0-9]{1,2}')
+
+
+@dataclass(frozen=True)
+class Rule:
+    """1項目に対するチェック (条件を満たさない場合に message を1件返す)"""
+    field: str
+    message: str
+    required: bool = False             # 空なら NG
+    max_len: Optional[int] = None      # 文字数の上限
+    pattern: Optional[str] = None      # 正規表現
+    match: str = 'search'              # 'match'(先頭一致) / 'search'(部分一致)
+    cidr: Optional[str] = None         # 'single'(1件) / 'list'(カンマ区切り)
+    cidr_prefix: Optional[int] = None  # プレフィックス長の指定 (例: 28)
+    date: bool = False                 # 'YYYY-MM-DD' 形式の日付
+    optional: bool = False             # 空ならチェックしない
+    skip_values: Tuple[str, ...] = ()  # この値ならチェックしない (例: 'None')
+    strip_spaces: bool = False         # 判定前に空白を除去
+    when_in: Optional[Tuple[str, str, Tuple[str, ...]]] = None  # (項目, 'in'/'not in', 値の並び)
+
+
+def _is_ipv4_cidr(value: str, prefix: Optional[int]) -> bool:
+    """'a.b.c.d/n' 形式のIPv4 CIDRか (ホスト部のビットが立っていても許容)"""
+    if not CIDR_NOTATION.fullmatch(value) or value in EXCLUDED_CIDRS:
+        return False
+    try:
+        network = ipaddress.IPv4Network(value, strict=False)
+    except ValueError:
+        return False
+    return prefix is None or network.prefixlen == prefix
+
+
+def _is_date(value: str) -> bool:
+    """保存時の変換(utils.repository.to_date)と同じく date.fromisoformat で読める日付か"""
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _compile_rule(rule: Rule) -> Callable[[Dict[str, Any]], Optional[str]]:
+    """Rule を判定関数へ変換 (正規表現はここで一度だけコンパイル)"""
+    regex = re.compile(rule.pattern) if rule.pattern else None
+    regex_test = None
+    if regex is not None:
+        regex_test = regex.match if rule.match == 'match' else regex.search
+
+    condition = None
+    if rule.when_in is not None:
+        cond_field, op, values = rule.when_in
+        allowed = frozenset(values)
+        if op == 'in':
+            condition = lambda data: data.get(cond_field) in allowed
+        else:
+            condition = lambda data: data.get(cond_field) not in allowed
+
+    def check(data: Dict[str, Any]) -> Optional[str]:
+        if condition is not None and not condition(data):
+            return None
+
+        value = data.get(rule.field)
+        text = '' if value is None else str(value)
+        if rule.strip_spaces:
+            text = text.replace(' ', '')
+
+        if (rule.optional and not text) or text in rule.skip_values:
+            return None
+        if rule.required and not value:
+            return rule.message
+        if rule.max_len is not None and len(text) > rule.max_len:
+            return rule.message
+        if regex_test is not None and not regex_test(text):
+            return rule.message
+        if rule.date and not _is_date(text):
+            return rule.message
+        if rule.cidr == 'single' and not _is_ipv4_cidr(text, rule.cidr_prefix):
+            return rule.message
+        if rule.cidr == 'list':
+            items = [item for item in text.split(',') if item]
+            if not items or not all(_is_ipv4_cidr(item, rule.cidr_prefix) for item in items):
+                return rule.message
+        return None
+
+    return check
+
+
+class Schema:
+    """フォーム1つ分のチェック定義 (生成時にコンパイル済み)"""
+
+    def __init__(self, name: str, rules: Iterable[Rule]):
+        self.name = name
+        self.rules: Tuple[Rule, ...] = tuple(rules)
+        self._checks = tuple((rule.field, _compile_rule(rule)) for rule in self.rules)
+
+    def validate(self, data: Dict[str, Any], partial: bool = False) -> List[str]:
+        """
+        1件分をチェックし、エラーメッセージの一覧を返す (問題なければ空)
+        partial=True の場合は data に含まれる項目のチェックのみ行う (一部の項目だけを変更する場合)
+        """
+        errors = []
+        for field, check in self._checks:
+            if partial and field not in data:
+                continue
+            message = check(data)
+            if message is not None:
+                errors.append(message)
+        return errors
+
+    def validate_changes(self, current: Dict[str, Any], changes: Dict[str, Any]) -> List[str]:
+        """
+        登録済みの行 current への変更 changes をチェックし、エラーメッセージの一覧を返す (一部の項目だけを変更する場合)
+        変更した項目のチェックと、条件(when_in)の項目を変更したチェックのみを、変更後の行に対して行う
+        (条件は変更されない項目も含めた変更後の行で判定するため、利用用途を省略した変更も正しくチェックされる)
+        """
+        data = {**current, **changes}
+        errors = []
+        for rule, (field, check) in zip(self.rules, self._checks):
+            if field not in changes and (rule.when_in is None or rule.when_in[0] not in changes):
+                continue
+            message = check(data)
+            if message is not None:
+                errors.append(message)
+        return errors
+
+    def validate_many(self, records: Iterable[Dict[str, Any]], partial: bool = False) -> List[List[str]]:
+        """複数件をまとめてチェックし、入力と同じ順序で行ごとのエラー一覧を返す"""
+        if partial:
+            return [self.validate(data, partial=True) for data in records]
+        checks = [check for _, check in self._checks]
+        results = []
+        for data in records:
+            results.append([m for m in (check(data) for check in checks) if m is not None])
+        return results
+
+    def invalid_rows(self, records: Iterable[Dict[str, Any]]) -> Dict[int, List[str]]:
+        """複数件をまとめてチェックし、エラーのある行だけを {行番号: エラー一覧} で返す"""
+        return {i: errors for i, errors in enumerate(self.validate_many(records)) if errors}
+
+
+# ==========================================
+# フォーム定義
+# ==========================================
+_ALPHA_NUM = r'^[a-z0-9]+$'
+_ALPHA_NUM_HYPHEN = r'^[a-z0-9\-]+$'
+_EMAIL = r'[\w\-._]+@[\w\-._]+\.[A-Za-z]+'
+_DOMAIN = r'^(?![-.])[a-z0-9]([a-z0-9.-]*[a-z0-9])?(\.[a-z]{2,})+$'
+
+# 一般ユーザー登録 (Utils.validate)
+USER_FORM = Schema('user', [
+    Rule('username', '氏名' + NO_INPUT, required=True, max_len=100),
+    Rule('email', 'メールアドレス' + NO_INPUT, pattern=r'[\w\-.-]+@[\w\-._]+\.[A-Za-z]+', match='match', max_len=100),
+    Rule('tel_number', '電話番号' + NO_INPUT, pattern=r'^[0-9\-]+$', match='match', max_len=100),
+    # 日付・会社IDは保存時に型変換するため、変換できない値はここで弾く (非同期書き込みでは後から画面にエラーを返せない)
+    Rule('regist_date', '引き渡し希望日' + NO_INPUT, required=True, date=True),
+    Rule('belonging_department', '所属部署名' + NO_INPUT, required=True, max_len=100),
+    Rule('company_id', '社名' + NO_INPUT, required=True, pattern=r'^\d+\s*(:|$)', match='match'),
+])
+
+# プロジェクト情報 (Utils.validate2)
+PROJECT_FORM = Schema('project', [
+    Rule('project_name', 'プロジェクト名' + NO_INPUT, required=True),
+    Rule('system_name', 'システム名' + NO_INPUT, required=True),
+    Rule('type', '利用用途' + NO_INPUT, required=True),
+])
+
+# 管理者用 (Utils.admin_valitation)
+ADMIN_FORM = Schema('admin', [
+    # 定型チェック
+    Rule('manage_company_name', '会社名は半角英数文字(英小文字)のみです。', pattern=_ALPHA_NUM),
+    Rule('project_name_gcp', 'プロジェクト名は半角英数文字(英小文字)のみです。', pattern=_ALPHA_NUM),
+    Rule('organization_name', '組織名は半角英数文字(英小文字)のみです。', pattern=_ALPHA_NUM),
+    Rule('group_name', 'Googleグループ名(管理者用)は半角英数文字(英小文字),-(半角ハイフン)のみです。', pattern=_ALPHA_NUM_HYPHEN),
+    Rule('user_group_name', 'Googleグループ名(利用者用)は半角英数文字(英小文字),-(半角ハイフン)のみです。', pattern=_ALPHA_NUM_HYPHEN),
+    Rule('group_email', 'Googleグループのemail(管理者用)' + NO_INPUT, pattern=_EMAIL),
+    Rule('user_group_email', 'Googleグループのemail(利用者用)' + NO_INPUT, pattern=_EMAIL),
+    # 文字数チェック
+    Rule('manage_company_name', '会社名が8文字を超えています!!', max_len=8),
+    Rule('project_name_gcp', 'プロジェクト名が8文字を超えています!!', max_len=8),
+    Rule('organization_name', '組織名が8文字を超えています!!', max_len=8),
+    # 必須チェック
+    Rule('env', '環境' + NO_INPUT, required=True),
+    Rule('use_purpose', '利用用途' + NO_INPUT, required=True),
+    # 条件付きチェック (use_purpose に依存するもの)
+    Rule('subnet_info', '利用IP範囲は半角数字及び.(ドット)/(スラッシュ)のみです。',
+         cidr='single', when_in=('use_purpose', 'not in', ('wp', 'static'))),
+    Rule('client_cidr', 'アクセス元IP制限は半角数字及び.(ドット)/(スラッシュ),(カンマ)のみです。',
+         cidr='list', optional=True, strip_spaces=True, when_in=('use_purpose', 'in', ('api', 'secure'))),
+    Rule('connector_cidr', 'VPCコネクター利用IP範囲が適切な形式になっていません。(空欄又は*.*.*.*/28など)。',
+         cidr='single', cidr_prefix=28, optional=True, skip_values=('None',),
+         when_in=('use_purpose', 'in', ('secure',))),
+    Rule('domain_name', '無効なドメイン名です。', pattern=_DOMAIN, when_in=('use_purpose', 'in', ('static', 'wp'))),
+])
@@ -0,0 +1,334 @@
+import os
+import json
+import time
+import queue
+import logging
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# utils.util と同じルートロガーを使用 (循環importを避けるため直接取得)
+logger = logging.getLogger()
+
+# ==========================================
+# 登録データの非同期書き込み
+# ==========================================
+# リクエストスレッドでは行をキューへ積んで即座に応答し、専用スレッドがまとめて書き込む。
+# 未書き込みの行はローカルのスプールファイルへ追記しておき、プロセス再起動時に再投入する。
+# (書き込みが確認できた行はack行として追記し、起動時に未ackの行だけを残して詰め直す)
+# 書き込みに失敗したバッチは二分して書き込める行を先に書き込み、1行単位でも書き込めない行は
+# 恒久的なエラー(is_transient が False)であれば、又は再投入が max_requeues 回を超えたら
+# デッドレターファイルへ移す (不正な1行が後続の行の書き込みを止め続けないようにする)。
+# キューに入り切らずスプールにのみ残した行は、キューが空になった時点でスプールから読み直して再投入する。
+
+# 一時的な障害とみなすHTTPステータス (google.api_core の例外は code にHTTPステータスを持つ)
+TRANSIENT_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+TRANSIENT_REASONS = frozenset({"rateLimitExceeded", "backendError", "internalError"})
+
+
+def is_transient(exc: Exception) -> bool:
+    """再試行すれば書き込める可能性のあるエラーか (通信障害・タイムアウト・レート制限・サーバー側の障害)"""
+    if isinstance(exc, (ConnectionError, TimeoutError, OSError)):
+        return True
+    if getattr(exc, "code", None) in TRANSIENT_STATUS_CODES:
+        return True
+    # BigQueryのレート制限超過は403で返るため、エラーの理由(reason)でも判定する
+    reasons = {err.get("reason") for err in getattr(exc, "errors", None) or () if isinstance(err, dict)}
+    return bool(reasons & TRANSIENT_REASONS)
+
+
+class WriteQueueFull(Exception):
+    """キューが上限に達しているため受け付けられない"""
+
+
+class WritePipeline:
+    """行をバッチにまとめて sink へ書き込むバックグラウンドパイプライン"""
+
+    def __init__(self, sink: Callable[[List[Dict[str, Any]]], None], spool_path: Optional[str] = None,
+                 max_queue: int = 1000, batch_size: int = 50, flush_interval: float = 1.0,
+                 max_retries: int = 5, retry_backoff: float = 0.5, key: str = "id",
+                 on_flushed: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 dead_letter_path: Optional[str] = None, max_requeues: int = 10,
+                 is_transient: Callable[[Exception], bool] = is_transient):
+        self._sink = sink
+        self._spool_path = spool_path
+        self._batch_size = max(batch_size, 1)
+        self._flush_interval = flush_interval
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        self._key = key
+        self._on_flushed = on_flushed
+        self._dead_letter_path = dead_letter_path
+        self._max_requeues = max_requeues
+        self._is_transient = is_transient
+        self._requeues: Dict[Any, int] = {}  # キー -> 書き込めずにキューへ戻した回数
+
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._spool_lock = threading.Lock()
+        self._pending = 0  # キュー投入済みで未書き込みの行数 (取り出し後の書き込み中も含む)
+        self._spool_only = 0  # キューに入り切らずスプールにのみ残っている行数 (キューが空になったら読み直す)
+        self._pending_lock = threading.Condition()
+        self._dead_lettered = 0
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    # ------------------------------------------
+    # 受付
+    # ------------------------------------------
+    def submit(self, row: Dict[str, Any]) -> None:
+        """行を受け付ける (スプールへ追記後にキューへ投入。満杯時は WriteQueueFull)"""
+        with self._pending_lock:
+            if self._queue.full():
+                raise WriteQueueFull(f"write queue is full ({self._queue.maxsize})")
+            self._spool_append({"op": "row", "row": row})
+            self._queue.put_nowait(row)
+            self._pending += 1
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def spool_only(self) -> int:
+        return self._spool_only
+
+    @property
+    def dead_lettered(self) -> int:
+        """デッドレターファイルへ移した行数 (このプロセスでの累計)"""
+        return self._dead_lettered
+
+    # ------------------------------------------
+    # 起動/停止
+    # ------------------------------------------
+    def start(self) -> None:
+        """スプールに残った未書き込み行を再投入し、書き込みスレッドを起動"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._pending_lock:
+            self._enqueue_spooled(self._recover_spool())
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name="write-pipeline", daemon=True)
+        self._worker.start()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """キュー内・スプールにのみ残っている行がすべて書き込まれるまで待機 (タイムアウト時はFalse)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._pending_lock:
+            while self._pending > 0 or self._spool_only > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._pending_lock.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: float = 8.0) -> None:
+        """残りを書き込んでから停止 (書き込めなかった行はスプールに残り、次回起動時に再投入)"""
+        if not self.flush(timeout):
+            logger.warning(f"書き込み待ちの{self._pending}件をスプールに残して停止します")
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join(timeout=1.0)
+
+    # ------------------------------------------
+    # 書き込みスレッド
+    # ------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            elif self._spool_only:
+                self._reload_spool()
+
+    def _enqueue_spooled(self, rows: List[Dict[str, Any]]) -> None:
+        """スプールから読み直した行をキューへ投入 (入り切らない分はスプールにのみ残す。_pending_lock 下で呼び出す)"""
+        queued = 0
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                break
+            queued += 1
+        self._pending += queued
+        self._spool_only = len(rows) - queued
+
+    def _reload_spool(self) -> None:
+        """
+        キューが空になった時点で、スプールにのみ残っている行を読み直して再投入する
+        (書き込み中の行が無いため、スプールの未ackの行 = スプールにのみ残っている行)
+        """
+        with self._pending_lock:
+            if self._pending > 0 or not self._spool_only:
+                return
+            self._enqueue_spooled(self._recover_spool())
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        """最初の1行を待ち、flush_interval の間に届いた行を batch_size 件までまとめる"""
+        try:
+            batch = [self._queue.get(timeout=self._flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self._flush_interval
+        while len(batch) < self._batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self._sink(batch)
+                break
+            except Exception as e:
+                if not self._is_transient(e) or attempt >= self._max_retries or self._stop.is_set():
+                    logger.error(f"登録データの書き込みに失敗しました ({len(batch)}件): {e}")
+                    self._isolate(batch, e)
+                    return
+                wait = self._retry_backoff * 2 ** (attempt - 1)
+                logger.warning(f"登録データの書き込みを再試行します ({attempt}/{self._max_retries}, {wait:.1f}秒後): {e}")
+                time.sleep(wait)
+        self._written(batch)
+
+    def _written(self, batch: List[Dict[str, Any]]) -> None:
+        for row in batch:
+            self._requeues.pop(row.get(self._key), None)
+        self._spool_append({"op": "ack", "keys": [row.get(self._key) for row in batch]})
+        self._done(len(batch), written=True)
+        if self._on_flushed is not None:
+            try:
+                self._on_flushed(batch)
+            except Exception as e:
+                logger.error(f"書き込み後処理でエラーが発生しました: {e}")
+
+    def _isolate(self, batch: List[Dict[str, Any]], error: Exception) -> None:
+        """
+        書き込めなかったバッチを二分して書き込める行を書き込み、書き込めない行を振り分ける
+        一時的な障害(is_transient)の場合は分割せずにキューへ戻し、恒久的なエラーの1行はデッドレターへ移す
+        """
+        if self._is_transient(error) or self._stop.is_set():
+            self._requeue(batch, error)
+            return
+        if len(batch) == 1:
+            self._dead_letter(batch, error)
+            return
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                self._sink(half)
+            except Exception as e:
+                self._isolate(half, e)
+            else:
+                self._written(half)
+
+    def _requeue(self, batch: List[Dict[str, Any]], error: Exception) -> None:
+        """
+        書き込めなかった行をキューへ戻し、間隔を空けて再試行させる (max_requeues 回を超えた行はデッドレターへ)
+        停止中やキューが満杯の場合はスプールにのみ残す (キューが空になった時点又は次回起動時に再投入)
+        """
+        retry = []
+        for row in batch:
+            key = row.get(self._key)
+            self._requeues[key] = self._requeues.get(key, 0) + 1
+            if self._requeues[key] > self._max_requeues:
+                self._dead_letter([row], error)
+            else:
+                retry.append(row)
+
+        dropped = 0
+        if self._stop.is_set():
+            dropped = len(retry)
+        else:
+            for row in retry:
+                try:
+                    self._queue.put_nowait(row)
+                except queue.Full:
+                    dropped += 1
+        if dropped:
+            with self._pending_lock:
+                self._spool_only += dropped
+            self._done(dropped)
+        if retry:
+            # 障害が続いている間にキューを空回りさせないよう待機
+            self._stop.wait(self._retry_backoff * 2 ** self._max_retries)
+
+    def _dead_letter(self, rows: List[Dict[str, Any]], error: Exception) -> None:
+        """書き込めない行をデッドレターファイルへ移し、スプールからは外す (再起動時に再投入しない)"""
+        failed_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        for row in rows:
+            self._requeues.pop(row.get(self._key), None)
+            logger.error(f"登録データを書き込めないためデッドレターへ移します (id={row.get(self._key)}): {error}")
+            if self._dead_letter_path:
+                self._append_line(self._dead_letter_path,
+                                  {"row": row, "error": f"{type(error).__name__}: {error}", "failed_at": failed_at})
+        self._spool_append({"op": "ack", "keys": [row.get(self._key) for row in rows]})
+        self._dead_lettered += len(rows)
+        self._done(len(rows), written=True)
+
+    def _done(self, count: int, written: bool = False) -> None:
+        with self._pending_lock:
+            self._pending -= count
+            if written and self._pending == 0 and self._spool_only == 0:
+                # 未書き込みの行が無くなった時点でスプールを空にする (submitも同じロック下で追記するため競合しない)
+                self._spool_truncate()
+            self._pending_lock.notify_all()
+
+    # ------------------------------------------
+    # スプールファイル
+    # ------------------------------------------
+    def _spool_append(self, record: Dict[str, Any]) -> None:
+        if not self._spool_path:
+            return
+        self._append_line(self._spool_path, record)
+
+    def _append_line(self, path: str, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._spool_lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _spool_truncate(self) -> None:
+        if not self._spool_path:
+            return
+        with self._spool_lock:
+            with open(self._spool_path, "w", encoding="utf-8"):
+                pass
+
+    def _recover_spool(self) -> List[Dict[str, Any]]:
+        """スプールから未ackの行を取り出し、スプールをその行だけに詰め直す"""
+        if not self._spool_path or not os.path.exists(self._spool_path):
+            return []
+        rows: Dict[Any, Dict[str, Any]] = {}
+        with self._spool_lock:
+            with open(self._spool_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で停止した末尾行などは読み飛ばす
+                        continue
+                    if record.get("op") == "row":
+                        rows[record["row"].get(self._key)] = record["row"]
+                    elif record.get("op") == "ack":
+                        for key in record.get("keys", []):
+                            rows.pop(key, None)
+
+            tmp_path = self._spool_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for row in rows.values():
+                    f.write(json.dumps({"op": "row", "row": row}, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._spool_path)
+
+        if rows:
+            logger.warning(f"スプールに残っていた未書き込みの登録データ{len(rows)}件を再投入します")
+        return list(rows.values())